@@ -1,20 +1,46 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy import select, update
+import json
+import logging
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import select, update, event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, selectinload
 from core.config import settings
-from core.db_models import Base, User, Session, Answer
+from core.db_models import Base, User, Session, Answer, FSMRecord, NormBin
+from adapters.migrations import run_migrations
 
 class DBRepo:
     def __init__(self):
-        self.engine = create_async_engine(settings.DATABASE_URL, echo=False)
+        connect_args = {}
+        if settings.DATABASE_URL.startswith("sqlite"):
+            # Several processes/tasks write concurrently: wait for the lock instead of failing
+            connect_args["timeout"] = 30
+        self.engine = create_async_engine(settings.DATABASE_URL, echo=False, connect_args=connect_args)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", self._sqlite_pragmas)
         self.async_session = sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
 
+    @staticmethod
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL lets readers run alongside the single writer
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        # Only takes effect on a new file; existing ones need a one-off
+        # `python -m adapters.retention --vacuum-full`
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.close()
+
     async def init_db(self):
         async with self.engine.begin() as conn:
             # await conn.run_sync(Base.metadata.drop_all) # For dev reset
             await conn.run_sync(Base.metadata.create_all)
+            version = await conn.run_sync(run_migrations)
+        logging.info(f"Database schema at version {version}")
 
     async def get_or_create_user(self, telegram_id: int, name: str = None) -> User:
         async with self.async_session() as session:
@@ -28,16 +54,44 @@ class DBRepo:
                 await session.refresh(user)
             return user
 
-    async def create_session(self, user_id: int) -> Session:
+    async def update_user_contact(self, telegram_id: int, name: str = None, phone: str = None, email: str = None):
+        # Lead details from the report form (needed later to re-send regenerated reports)
+        values = {k: v for k, v in {"name": name, "phone": phone, "email": email}.items() if v}
+        if not values:
+            return
+        async with self.async_session() as session:
+            await session.execute(update(User).where(User.telegram_id == telegram_id).values(**values))
+            await session.commit()
+
+    async def create_session(self, user_id: int, tenant: str = None, questions_version: str = None, info_version: str = None) -> Session:
         async with self.async_session() as session:
             # Mark previous sessions as potentially abandoned? Or just create new.
-            new_session = Session(user_id=user_id)
+            new_session = Session(user_id=user_id, tenant=tenant, questions_version=questions_version, info_version=info_version)
             session.add(new_session)
             await session.commit()
             await session.refresh(new_session)
             return new_session
 
     async def save_answer(self, session_id: int, question_id: int, option_id: str, open_text: str = None):
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            # One statement on the (session_id, question_id) unique index instead of select + insert/update
+            insert = sqlite_insert if dialect == "sqlite" else pg_insert
+            stmt = insert(Answer).values(
+                session_id=session_id,
+                question_id=question_id,
+                selected_option_id=option_id,
+                open_text_input=open_text,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Answer.session_id, Answer.question_id],
+                set_={"selected_option_id": option_id, "open_text_input": open_text},
+            )
+            async with self.async_session() as session:
+                await session.execute(stmt)
+                await session.commit()
+            return
+
         async with self.async_session() as session:
             # Check if answer exists to update
             result = await session.execute(
@@ -59,6 +113,15 @@ class DBRepo:
             
             await session.commit()
 
+    async def mark_session_completed(self, session_id: int):
+        async with self.async_session() as session:
+            await session.execute(
+                update(Session)
+                .where(Session.id == session_id)
+                .values(is_completed=True, completed_at=datetime.utcnow())
+            )
+            await session.commit()
+
     async def get_session_with_answers(self, session_id: int) -> Session:
         async with self.async_session() as session:
             result = await session.execute(
@@ -68,4 +131,62 @@ class DBRepo:
             )
             return result.scalar_one_or_none()
 
+    # --- Population norms ---
+
+    async def add_norm_scores(self, scores: Dict[str, int]):
+        """One completed test: +1 in each archetype's (archetype, score) bin."""
+        dialect = self.engine.dialect.name
+        async with self.async_session() as session:
+            if dialect in ("sqlite", "postgresql"):
+                insert = sqlite_insert if dialect == "sqlite" else pg_insert
+                stmt = insert(NormBin).values([
+                    {"archetype": arch, "score": score, "count": 1} for arch, score in scores.items()
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[NormBin.archetype, NormBin.score],
+                    set_={"count": NormBin.count + 1},
+                )
+                await session.execute(stmt)
+            else:
+                for arch, score in scores.items():
+                    row = await session.get(NormBin, (arch, score))
+                    if row:
+                        row.count += 1
+                    else:
+                        session.add(NormBin(archetype=arch, score=score, count=1))
+            await session.commit()
+
+    async def load_norm_bins(self) -> Dict[str, Dict[int, int]]:
+        async with self.async_session() as session:
+            result = await session.execute(select(NormBin.archetype, NormBin.score, NormBin.count))
+            bins: Dict[str, Dict[int, int]] = {}
+            for arch, score, count in result:
+                bins.setdefault(arch, {})[score] = count
+            return bins
+
+    # --- FSM storage (shared between worker processes) ---
+
+    async def get_fsm_record(self, key: str):
+        async with self.async_session() as session:
+            return await session.get(FSMRecord, key)
+
+    async def set_fsm_state(self, key: str, state):
+        async with self.async_session() as session:
+            record = await session.get(FSMRecord, key)
+            if record:
+                record.state = state
+            elif state is not None:
+                session.add(FSMRecord(key=key, state=state, data="{}"))
+            await session.commit()
+
+    async def set_fsm_data(self, key: str, data: dict):
+        payload = json.dumps(data, ensure_ascii=False)
+        async with self.async_session() as session:
+            record = await session.get(FSMRecord, key)
+            if record:
+                record.data = payload
+            elif data:
+                session.add(FSMRecord(key=key, state=None, data=payload))
+            await session.commit()
+
 db_repo = DBRepo()
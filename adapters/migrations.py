@@ -0,0 +1,102 @@
+"""
+Versioned schema migrations.
+
+`Base.metadata.create_all` only creates missing tables, so existing
+databases never pick up new indexes or columns. Each migration here runs
+once, in order, and the applied version is recorded in `schema_version`.
+Migrations must be safe on a fresh database too (create_all has already
+built the current models there), hence the IF NOT EXISTS guards.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import func, inspect, or_, select, text, update
+from sqlalchemy.engine import Connection
+
+from core.db_models import Answer, Session
+
+# Size of the question bank when sessions were not yet marked on completion (migration 4);
+# later banks may differ, so the backfill must not read the live questions.json
+LEGACY_QUESTION_COUNT = 36
+
+
+def _m001_answers_unique_session_question(conn: Connection):
+    # Older databases may hold duplicate answers (the old save path was check-then-insert);
+    # keep the newest row for every (session, question) before adding the unique index
+    conn.execute(text(
+        "DELETE FROM answers WHERE id NOT IN "
+        "(SELECT MAX(id) FROM answers GROUP BY session_id, question_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_answers_session_question "
+        "ON answers (session_id, question_id)"
+    ))
+
+
+def _m002_sessions_user_id(conn: Connection):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)"))
+
+
+def _m003_sessions_completion(conn: Connection):
+    columns = {c["name"] for c in inspect(conn).get_columns("sessions")}
+    if "completed_at" not in columns:
+        conn.execute(text("ALTER TABLE sessions ADD COLUMN completed_at TIMESTAMP"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sessions_completed_started ON sessions (is_completed, started_at)"
+    ))
+
+
+def _m004_backfill_completed(conn: Connection):
+    # Before sessions were marked on completion, a finished test only shows as a full answer set;
+    # without this, retention treats those sessions as abandoned
+    answered = select(func.count()).select_from(Answer).where(Answer.session_id == Session.id).scalar_subquery()
+    conn.execute(
+        update(Session)
+        .where(or_(Session.is_completed.is_(None), Session.is_completed == False))  # noqa: E712
+        .where(answered >= LEGACY_QUESTION_COUNT)
+        .values(is_completed=True, completed_at=func.coalesce(Session.completed_at, Session.started_at))
+    )
+
+
+def _m005_sessions_tenant(conn: Connection):
+    columns = {c["name"] for c in inspect(conn).get_columns("sessions")}
+    if "tenant" not in columns:
+        conn.execute(text("ALTER TABLE sessions ADD COLUMN tenant VARCHAR"))
+
+
+def _m006_sessions_content_versions(conn: Connection):
+    columns = {c["name"] for c in inspect(conn).get_columns("sessions")}
+    for column in ("questions_version", "info_version"):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE sessions ADD COLUMN {column} VARCHAR"))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "unique index answers(session_id, question_id)", _m001_answers_unique_session_question),
+    (2, "index sessions(user_id)", _m002_sessions_user_id),
+    (3, "sessions.completed_at + retention index", _m003_sessions_completion),
+    (4, "mark sessions with a full answer set as completed", _m004_backfill_completed),
+    (5, "sessions.tenant", _m005_sessions_tenant),
+    (6, "sessions.questions_version / info_version", _m006_sessions_content_versions),
+]
+
+
+def run_migrations(conn: Connection) -> int:
+    """Applies pending migrations inside the caller's transaction. Returns the schema version."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+    ))
+    current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying migration {version:03d}: {description}")
+        migrate(conn)
+        conn.execute(
+            text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {"v": version, "d": description, "t": datetime.utcnow()},
+        )
+        current = version
+    return current
@@ -0,0 +1,82 @@
+"""
+Population norms: where a user's archetype scores fall among everyone else's.
+
+Every completed (full-length) test adds one count to a per-archetype score
+histogram in `norm_bins` (12 upserted rows, independent of history size).
+Each process keeps the histograms in memory and re-reads them every
+NORMS_REFRESH_SECONDS, so other workers' results show up without any
+per-request scan of past sessions. `python -m analytics norms` rebuilds
+the table from history in one vectorised pass.
+
+Percentile = share of recorded tests with a lower score, ties counted half
+(mid-rank), so a score in the middle of the pack reads as ~50.
+"""
+import logging
+import time
+from typing import Dict, Optional
+
+from core.config import settings
+from adapters.db_repo import db_repo
+
+
+def _name(arch) -> str:
+    return getattr(arch, "value", arch)
+
+
+class Norms:
+    """In-memory histograms {archetype: {score: count}}."""
+
+    def __init__(self, bins: Optional[Dict[str, Dict[int, int]]] = None):
+        self.bins = bins or {}
+        self.totals = {arch: sum(counts.values()) for arch, counts in self.bins.items()}
+
+    def add(self, scores: Dict):
+        for arch, score in scores.items():
+            counts = self.bins.setdefault(_name(arch), {})
+            counts[score] = counts.get(score, 0) + 1
+            self.totals[_name(arch)] = self.totals.get(_name(arch), 0) + 1
+
+    def samples(self) -> int:
+        return min(self.totals.values(), default=0)
+
+    def percentile(self, arch, score: int) -> Optional[int]:
+        counts = self.bins.get(_name(arch))
+        total = self.totals.get(_name(arch), 0)
+        if not counts or not total:
+            return None
+        below = sum(c for s, c in counts.items() if s < score)
+        return round(100 * (below + 0.5 * counts.get(score, 0)) / total)
+
+    def percentiles(self, scores: Dict) -> Dict:
+        """Same keys as `scores`; empty until every archetype has NORMS_MIN_SAMPLES tests behind it."""
+        if self.samples() < settings.NORMS_MIN_SAMPLES:
+            return {}
+        return {arch: self.percentile(arch, score) for arch, score in scores.items()}
+
+
+class NormsStore:
+    def __init__(self, refresh_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self.norms = Norms()
+        self._loaded_at = 0.0
+
+    async def get(self) -> Norms:
+        if time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            try:
+                self.norms = Norms(await db_repo.load_norm_bins())
+            except Exception as e:
+                logging.error(f"Loading norms failed: {e}")
+            self._loaded_at = time.monotonic()
+        return self.norms
+
+    async def percentiles(self, scores: Dict) -> Dict:
+        return (await self.get()).percentiles(scores)
+
+    async def record(self, scores: Dict):
+        """Counts one completed test: the DB row for every archetype, plus this process's copy."""
+        scores = {_name(arch): int(score) for arch, score in scores.items()}
+        await db_repo.add_norm_scores(scores)
+        self.norms.add(scores)
+
+
+norms_store = NormsStore(settings.NORMS_REFRESH_SECONDS)
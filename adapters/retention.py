@@ -0,0 +1,195 @@
+"""
+Retention & compaction for the bot database.
+
+Every /start creates a new Session, and most abandoned tests are never
+finished, so `sessions`/`answers` fill with partial data. This job runs
+in the background and:
+  - archives (JSONL) or deletes abandoned sessions and their answers after a cutoff
+    (not those a user is still in, as far as DB FSM storage shows)
+  - optionally drops completed sessions older than RETENTION_COMPLETED_DAYS
+  - removes stale FSM rows (DB storage)
+  - reclaims free pages on SQLite (incremental vacuum)
+All deletes run in small batches, each in its own short transaction.
+
+    python -m adapters.retention --once          # single pass
+    python -m adapters.retention --vacuum-full   # one-off: enable incremental vacuum on an existing SQLite file
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
+
+from sqlalchemy import delete, or_, select, text
+
+from core.config import settings
+from core.db_models import Answer, FSMRecord, Session
+from adapters.db_repo import db_repo
+
+
+class RetentionJob:
+    def __init__(self):
+        self.totals: Dict[str, int] = {"abandoned": 0, "completed": 0, "fsm": 0}
+
+    async def run_forever(self):
+        interval = max(1, settings.RETENTION_INTERVAL_MINUTES) * 60
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Retention run failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def run_once(self) -> Dict[str, int]:
+        now = datetime.utcnow()
+        removed = {
+            "abandoned": await self._purge_sessions(
+                or_(Session.is_completed.is_(None), Session.is_completed == False)  # noqa: E712
+                & (Session.started_at < now - timedelta(hours=settings.RETENTION_ABANDONED_HOURS)),
+                keep=await self._live_sessions(),
+            ),
+            "completed": 0,
+            "fsm": await self._purge_fsm(now - timedelta(days=settings.RETENTION_FSM_DAYS)),
+        }
+        if settings.RETENTION_COMPLETED_DAYS > 0:
+            removed["completed"] = await self._purge_sessions(
+                (Session.is_completed == True) & (Session.started_at < now - timedelta(days=settings.RETENTION_COMPLETED_DAYS))  # noqa: E712
+            )
+        for key, count in removed.items():
+            self.totals[key] += count
+        await self._incremental_vacuum()
+        if any(removed.values()):
+            logging.info(f"Retention: removed {removed}")
+        return removed
+
+    async def _live_sessions(self) -> Set[int]:
+        """Sessions a user is still in (FSM state set; DB storage only, memory storage is invisible here)."""
+        async with db_repo.async_session() as session:
+            rows = (await session.execute(
+                select(FSMRecord.data).where(FSMRecord.state.is_not(None))
+            )).scalars().all()
+        live = set()
+        for data in rows:
+            try:
+                session_id = json.loads(data or "{}").get("session_id")
+            except ValueError:
+                continue
+            if session_id:
+                live.add(session_id)
+        return live
+
+    async def _purge_sessions(self, condition, keep: Set[int] = frozenset()) -> int:
+        total = 0
+        after = 0
+        while True:
+            async with db_repo.async_session() as session:
+                ids = (await session.execute(
+                    select(Session.id).where(condition, Session.id > after).order_by(Session.id).limit(settings.RETENTION_BATCH_SIZE)
+                )).scalars().all()
+                if not ids:
+                    return total
+                after = ids[-1]
+                ids = [i for i in ids if i not in keep]
+                if not ids:
+                    continue
+                if settings.RETENTION_MODE == "archive":
+                    await self._archive(session, ids)
+                await session.execute(delete(Answer).where(Answer.session_id.in_(ids)))
+                await session.execute(delete(Session).where(Session.id.in_(ids)))
+                await session.commit()
+            total += len(ids)
+            # Give bot writes a chance to take the lock between batches
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE)
+
+    async def _archive(self, session, ids: List[int]):
+        sessions = (await session.execute(select(Session).where(Session.id.in_(ids)))).scalars().all()
+        answers = (await session.execute(select(Answer).where(Answer.session_id.in_(ids)))).scalars().all()
+        by_session: Dict[int, list] = {}
+        for a in answers:
+            by_session.setdefault(a.session_id, []).append({
+                "question_id": a.question_id,
+                "option": a.selected_option_id,
+                "open_text": a.open_text_input,
+            })
+        lines = [
+            json.dumps({
+                "session_id": s.id,
+                "user_id": s.user_id,
+                "started_at": s.started_at.isoformat() if s.started_at else None,
+                "is_completed": bool(s.is_completed),
+                "tenant": s.tenant,
+                # Answers refer to this version of the question bank (ARTIFACT_DIR/content/)
+                "questions_version": s.questions_version,
+                "answers": by_session.get(s.id, []),
+            }, ensure_ascii=False)
+            for s in sessions
+        ]
+        os.makedirs(settings.RETENTION_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(settings.RETENTION_ARCHIVE_DIR, f"sessions-{datetime.utcnow():%Y%m%d}.jsonl")
+        # Written before the delete commits: a crash may duplicate archive lines, never lose them
+        await asyncio.to_thread(self._append, path, lines)
+
+    @staticmethod
+    def _append(path: str, lines: List[str]):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def _purge_fsm(self, cutoff: datetime) -> int:
+        total = 0
+        while True:
+            async with db_repo.async_session() as session:
+                keys = (await session.execute(
+                    select(FSMRecord.key).where(FSMRecord.updated_at < cutoff).limit(settings.RETENTION_BATCH_SIZE)
+                )).scalars().all()
+                if not keys:
+                    return total
+                await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(keys)))
+                await session.commit()
+            total += len(keys)
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE)
+
+    async def _incremental_vacuum(self):
+        if db_repo.engine.dialect.name != "sqlite":
+            return
+        async with db_repo.engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+            if mode != 2:
+                return  # not INCREMENTAL, see --vacuum-full
+            await conn.execute(text(f"PRAGMA incremental_vacuum({int(settings.RETENTION_VACUUM_PAGES)})"))
+            await conn.commit()
+
+
+async def vacuum_full():
+    """Switches an existing SQLite file to incremental auto-vacuum. Rewrites the file: run off-peak."""
+    if db_repo.engine.dialect.name != "sqlite":
+        logging.info("Not SQLite, nothing to do.")
+        return
+    async with db_repo.engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        await conn.execute(text("VACUUM"))
+    logging.info("VACUUM done, auto_vacuum=INCREMENTAL.")
+
+
+retention_job = RetentionJob()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m adapters.retention")
+    parser.add_argument("--once", action="store_true", help="Run one retention pass and exit")
+    parser.add_argument("--vacuum-full", action="store_true", help="One-off VACUUM enabling incremental auto-vacuum")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        await db_repo.init_db()
+        if args.vacuum_full:
+            await vacuum_full()
+        if args.once or not args.vacuum_full:
+            print(await retention_job.run_once())
+
+    asyncio.run(_main())
@@ -0,0 +1,87 @@
+"""
+Answer callbacks carry the question they belong to: "ans:{token}:{q_index}:{option}",
+where token is the session id in base36 (callback data is limited to 64 bytes).
+
+AnswerGuard remembers, per chat, the one question whose keyboard is live.
+Chats are keyed by (bot id, chat id): in multi-tenant mode a user's private
+chats with two bots have the same chat id.
+AnswerGuardMiddleware checks each answer tap against it before aiogram's FSM
+middleware reads the state, so a double tap or a tap on an old message's
+keyboard costs a dict lookup instead of storage reads, DB writes and Bot API calls.
+Chats it does not know (after a restart, or evicted) pass through, and
+process_answer re-checks them against the FSM data.
+"""
+import string
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+ChatKey = Tuple[int, int]  # (bot id, chat id)
+
+ANSWER_PREFIX = "ans:"
+_DIGITS = string.digits + string.ascii_lowercase
+
+
+def session_token(session_id: int) -> str:
+    n = int(session_id)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if not n:
+            return out
+
+
+def answer_payload(session_id: int, q_index: int, option_id: str) -> str:
+    return f"{ANSWER_PREFIX}{session_token(session_id)}:{q_index}:{option_id}"
+
+
+def parse_answer_payload(data: str) -> Optional[Tuple[str, int, str]]:
+    """(token, q_index, option_id), or None for keyboards sent before tokens existed ("ans:{option}")."""
+    parts = data.split(":")
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return parts[1], int(parts[2]), parts[3]
+
+
+class AnswerGuard:
+    def __init__(self, max_chats: int = 100_000):
+        self.max_chats = max_chats
+        # (bot id, chat id) -> [token, q_index, still open]
+        self._live: "OrderedDict[ChatKey, list]" = OrderedDict()
+        self.stats: Dict[str, int] = {"accepted": 0, "duplicate": 0, "stale": 0, "stale_fsm": 0}
+
+    def expect(self, chat: ChatKey, token: str, q_index: int):
+        """Called right before a question keyboard is sent: only its taps are accepted from now on."""
+        self._live[chat] = [token, q_index, True]
+        self._live.move_to_end(chat)
+        if len(self._live) > self.max_chats:
+            self._live.popitem(last=False)
+
+    def check(self, chat: ChatKey, token: str, q_index: int) -> Optional[str]:
+        """None if the tap should be handled (and closes the question), else the reason to drop it."""
+        live = self._live.get(chat)
+        if live is None:
+            # Unknown here: let the FSM check decide, but catch a second tap of the same button
+            self.expect(chat, token, q_index)
+            live = self._live.get(chat) or [token, q_index, True]
+        if live[0] != token or live[1] != q_index:
+            self.stats["stale"] += 1
+            return "stale"
+        if not live[2]:
+            self.stats["duplicate"] += 1
+            return "duplicate"
+        live[2] = False
+        self.stats["accepted"] += 1
+        return None
+
+    def release(self, chat: ChatKey, token: str, q_index: int):
+        """The accepted tap failed in the handler: let the user tap again."""
+        live = self._live.get(chat)
+        if live is not None and live[0] == token and live[1] == q_index:
+            live[2] = True
+
+    def rejected(self) -> int:
+        return self.stats["duplicate"] + self.stats["stale"] + self.stats["stale_fsm"]
+
+
+answer_guard = AnswerGuard()
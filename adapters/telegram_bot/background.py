@@ -0,0 +1,60 @@
+"""
+Long tails of handlers, run as background tasks: the results countdown
+(RESULTS_COUNTDOWN_SECONDS of sleeps, then the meta-archetype wait) and the
+report delivery (LLM, PDF, SMTP).
+
+The handler does the quick part (state write, first reply) and returns, so
+its update releases its in-flight slot (webhook/worker UpdateRunner, polling
+task limit) within milliseconds. Users waiting for their results never hold
+up other users' taps, however many of them finish at once.
+
+A background task runs outside the per-chat order, so it re-checks that the
+user is still in the same test (`still_in_session`) before writing the FSM.
+Shutdown waits for the tasks (`drain`), as for in-flight updates.
+"""
+import asyncio
+import logging
+from typing import Coroutine, Set
+
+from aiogram.fsm.context import FSMContext
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine, tenant) -> asyncio.Task:
+    # create_task copies the context: the update's log fields carry over
+    task = asyncio.create_task(_run(coro, tenant))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def _run(coro: Coroutine, tenant):
+    try:
+        await coro
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        tenant.metrics["errors"] += 1
+        logging.exception("Background task failed")
+
+
+def pending() -> int:
+    return len(_tasks)
+
+
+async def still_in_session(state: FSMContext, session_id) -> bool:
+    """False once the user has started another test (/start) or the FSM data was cleared."""
+    return (await state.get_data()).get("session_id") == session_id
+
+
+async def drain(timeout: float):
+    if not _tasks:
+        return
+    logging.info(f"Waiting for {len(_tasks)} background tasks...")
+    done, left = await asyncio.wait(set(_tasks), timeout=timeout)
+    if left:
+        logging.warning(f"Drain timeout: cancelling {len(left)} background tasks")
+        for task in left:
+            task.cancel()
+        await asyncio.gather(*left, return_exceptions=True)
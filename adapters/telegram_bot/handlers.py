@@ -1,32 +1,69 @@
 import io
+import logging
 import random
 import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
 from aiogram import Router, F, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import FSInputFile, BufferedInputFile
+from aiogram.types import FSInputFile, BufferedInputFile, InputFile
 
-from core.engine import ArchetypeEngine
+from core.config import settings
+from core.content import content_store
+from core.logging_setup import bind_log_context
 from adapters.db_repo import db_repo
+from adapters.norms import norms_store
 from reports.chart_maker import create_radar_chart
 from reports.pdf_generator import generate_pdf_report
+from reports.artifact_store import artifact_store
+from reports.report_artifact import ReportArtifact
 from core.ai_service import ai_service
-from core.email_service import send_report_email
-from core.models import UserSession, Question
+from core.email_service import send_report_email, PDFAttachment
+from core.models import UserSession, Question, ArchetypeType
+from . import background
+from .answer_guard import answer_guard, parse_answer_payload, session_token
+from .throttle import throttle
 from .keyboards import get_question_keyboard, get_lead_magnet_keyboard
+from .middlewares import answer_dropped
 from .states import TestStates, LeadMagnetStates
+from .tenants import Tenant
 
-router = Router()
-engine = ArchetypeEngine() # Loads questions
+# PDF and chart rendering for every tenant of the process, off the event loop. One thread,
+# so pdf_generator's caches and matplotlib's pyplot state are never used concurrently. Each tenant queues at most
+# `max_reports` jobs (tenant.report_slots): one bot's burst of leads cannot push
+# the other bots' reports to the back of the queue
+report_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+
+def create_router() -> Router:
+    # One instance per tenant Dispatcher (a Router can only be included once)
+    router = Router()
+    router.message.register(cmd_start, Command("start"))
+    router.message.register(cmd_report, Command("report"))
+    router.message.register(cmd_reload, Command("reload"))
+    router.callback_query.register(process_answer, F.data.startswith("ans:"))
+    router.message.register(process_open_text, TestStates.waiting_for_open_text)
+    router.callback_query.register(start_lead_magnet, F.data == "get_report")
+    router.message.register(process_name, LeadMagnetStates.waiting_for_name)
+    router.message.register(process_phone, LeadMagnetStates.waiting_for_phone)
+    router.message.register(process_email, LeadMagnetStates.waiting_for_email)
+    return router
 
 # Temporary storage for simple session flow if not using DB logic strictly every step
 # But we should use FSM data.
 
-@router.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext):
+async def cmd_start(message: types.Message, state: FSMContext, tenant: Tenant):
+    # The test runs on the content versions current now, whatever is reloaded meanwhile
+    engine = tenant.engine
+    info_version = content_store.knowledge_base().version
     # 1. Create User/Session
     user = await db_repo.get_or_create_user(message.from_user.id, message.from_user.full_name)
-    session = await db_repo.create_session(user.id)
+    session = await db_repo.create_session(user.id, tenant.db_name, engine.version, info_version)
+    bind_log_context(session_id=session.id)
+    tenant.metrics["tests_started"] += 1
     
     # 2. Randomize Question IDs
     q_ids = list(engine.questions.keys())
@@ -35,21 +72,114 @@ async def cmd_start(message: types.Message, state: FSMContext):
     await state.update_data(
         session_id=session.id, 
         current_q_index=0,
-        question_order=q_ids
+        question_order=q_ids,
+        scores={},  # running totals for adaptive mode
+        questions_version=engine.version,
+        info_version=info_version,
     )
+    await state.set_state(TestStates.answering_questions)
     
     # 3. Send Intro
-    await message.answer("Вітаю! Це тест на Архетипи. 36 питань допоможуть визначити ваш профіль.")
+    if settings.ADAPTIVE_MODE:
+        await message.answer(f"Вітаю! Це тест на Архетипи. До {len(q_ids)} питань допоможуть визначити ваш профіль — щойно результат стане однозначним, тест завершиться.")
+    else:
+        await message.answer(f"Вітаю! Це тест на Архетипи. {len(q_ids)} питань допоможуть визначити ваш профіль.")
     
     # 4. Send Q1
-    await send_question(message, state)
-    await state.set_state(TestStates.answering_questions)
+    await send_question(message, engine, session.id, q_ids, 0)
 
-async def send_question(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    q_index = data.get("current_q_index", 0)
-    q_order = data.get("question_order")
-    
+async def cmd_report(message: types.Message, tenant: Tenant):
+    # Re-deliver the last report by Telegram file_id: no rendering, no upload
+    pdf_key = await asyncio.to_thread(artifact_store.get_alias, tenant.scoped(f"last_report:{message.from_user.id}"))
+    if not pdf_key:
+        await message.answer("У вас ще немає звіту. Пройдіть тест: /start")
+        return
+    filename = await asyncio.to_thread(artifact_store.get_filename, pdf_key) or "Archetype_Report.pdf"
+    artifact = None
+    if not await asyncio.to_thread(artifact_store.get_file_id, pdf_key, message.bot.id):
+        artifact = await asyncio.to_thread(artifact_store.open, pdf_key)
+        if artifact is None:
+            await message.answer("На жаль, цей звіт більше недоступний. Пройдіть тест ще раз: /start")
+            return
+    try:
+        await send_report_document(message, pdf_key, artifact, filename, "Ваш останній звіт")
+    finally:
+        if artifact:
+            artifact.close()
+
+def is_admin(user_id: int) -> bool:
+    return str(user_id) in {i.strip() for i in settings.ADMIN_USER_IDS.split(",") if i.strip()}
+
+async def cmd_reload(message: types.Message):
+    # Content hot reload for admins; everyone else gets no answer, as for an unknown command
+    if not is_admin(message.from_user.id):
+        return
+    changes = await content_store.reload(force=True)
+    await message.answer("\n".join(["Контент перезавантажено:", *changes]) if changes else "Контент без змін.")
+
+def canonical_scores(scores: Dict) -> Dict[str, int]:
+    # Fixed archetype order, so identical score vectors give identical charts (and cache keys)
+    by_name = {getattr(k, "value", k): v for k, v in scores.items()}
+    return {a.value: by_name.get(a.value, 0) for a in ArchetypeType}
+
+def chart_key(scores: Dict[str, int], percentiles: Dict[str, int]) -> str:
+    if not percentiles:
+        return artifact_store.key_for("chart", scores)
+    return artifact_store.key_for("chart", {"scores": scores, "percentiles": percentiles})
+
+async def get_chart_bytes(scores: Dict, percentiles: Optional[Dict] = None) -> bytes:
+    scores = canonical_scores(scores)
+    percentiles = canonical_scores(percentiles) if percentiles else {}
+    key = chart_key(scores, percentiles)
+    data = await asyncio.to_thread(artifact_store.get_bytes, key)
+    if data is None:
+        # Detached once as immutable bytes; BufferedInputFile and BytesIO(data) share them from here
+        render = functools.partial(contextvars.copy_context().run, create_radar_chart, scores, percentiles)
+        data = (await asyncio.get_running_loop().run_in_executor(report_pool, render)).getvalue()
+        await asyncio.to_thread(artifact_store.put, key, data, "chart.png")
+    return data
+
+async def send_chart(message: types.Message, scores: Dict, caption: str, percentiles: Optional[Dict] = None):
+    key = chart_key(canonical_scores(scores), canonical_scores(percentiles) if percentiles else {})
+    file_id = await asyncio.to_thread(artifact_store.get_file_id, key, message.bot.id)
+    if file_id:
+        await message.answer_photo(file_id, caption=caption, parse_mode="HTML")
+        return
+    data = await get_chart_bytes(scores, percentiles)
+    sent = await message.answer_photo(BufferedInputFile(data, filename="chart.png"), caption=caption, parse_mode="HTML")
+    await asyncio.to_thread(artifact_store.set_file_id, key, message.bot.id, sent.photo[-1].file_id)
+
+class ArtifactInputFile(InputFile):
+    """Uploads a ReportArtifact chunk by chunk (BufferedInputFile would copy the whole report first)."""
+
+    def __init__(self, artifact: ReportArtifact, filename: str):
+        super().__init__(filename=filename)
+        self.artifact = artifact
+
+    async def read(self, bot):
+        for chunk in self.artifact.chunks(self.chunk_size):
+            yield bytes(chunk)
+
+async def send_report_document(message: types.Message, pdf_key: str, pdf: Optional[ReportArtifact], filename: str, caption: str):
+    file_id = await asyncio.to_thread(artifact_store.get_file_id, pdf_key, message.bot.id)
+    if file_id:
+        await message.answer_document(file_id, caption=caption)
+        return
+    sent = await message.answer_document(ArtifactInputFile(pdf, filename), caption=caption)
+    await asyncio.to_thread(artifact_store.set_file_id, pdf_key, message.bot.id, sent.document.file_id)
+
+async def call(awaitable):
+    # aiogram method objects (callback.answer(), ...) are awaitable but not coroutines; gather() needs coroutines
+    return await awaitable
+
+# Intermediate Progress Messages, sent right before the question with this index
+PROGRESS_MESSAGES = {
+    9: "🚀 Чудовий початок! Ви пройшли 25% тесту. Ваша щирість — ключ до точного результату.",
+    18: "🌓 Ви вже на екваторі (50%)! Архетипи починають проявлятися ясніше. Продовжуємо?",
+    27: "🏁 Залишився останній ривок (75%)! Ви вже майже бачите свій повний профіль."
+}
+
+async def send_question(message: types.Message, engine, session_id: int, q_order: list, q_index: int):
     if not q_order:
         # Fallback if state lost or first run
         q_order = list(engine.questions.keys())
@@ -57,92 +187,155 @@ async def send_question(message: types.Message, state: FSMContext):
     q_id = q_order[q_index]
     q = engine.questions.get(q_id)
     if not q:
-        import logging
         logging.error(f"Question {q_id} not found in Engine! Total Loaded: {len(engine.questions)}")
         await message.answer("⚠️ Вибачте, сталася технічна помилка. Питання не знайдено.")
         return
     
+    if q_index in PROGRESS_MESSAGES:
+        await message.answer(PROGRESS_MESSAGES[q_index])
     
     text = f"<b>{q_index + 1}. {q.text}</b>\n\n{q.context}\n\n<i>{q.coaching_question}</i>"
-    kb = get_question_keyboard(q.options)
+    kb = get_question_keyboard(q.options, session_id, q_index)
+    answer_guard.expect((message.bot.id, message.chat.id), session_token(session_id), q_index)
     await message.answer(text,  reply_markup=kb, parse_mode="HTML")
 
-@router.callback_query(F.data.startswith("ans:"))
-async def process_answer(callback: types.CallbackQuery, state: FSMContext):
+async def process_answer(callback: types.CallbackQuery, state: FSMContext, tenant: Tenant, raw_state: Optional[str] = None):
     data = await state.get_data()
     q_index = data.get("current_q_index", 0)
     session_id = data.get("session_id")
     q_order = data.get("question_order")
-    
-    option_id = callback.data.split(":")[1]
+    bind_log_context(session_id=session_id)
+
+    parsed = parse_answer_payload(callback.data)
+    if parsed is None:
+        option_id = callback.data.split(":")[1]  # keyboard sent before tokens: applies to the current question
+    else:
+        token, tapped_index, option_id = parsed
+        # The middleware only knows chats it has seen since start: the FSM data is the authority
+        if raw_state != TestStates.answering_questions.state or session_id is None \
+                or token != session_token(session_id) or tapped_index != q_index:
+            answer_guard.stats["stale_fsm"] += 1
+            logging.debug("answer tap dropped", extra={"reason": "stale_fsm", "q_index": tapped_index})
+            await answer_dropped(callback)
+            return
     current_q_id = q_order[q_index]
+    logging.debug("answer", extra={"q_index": q_index, "question_id": current_q_id, "option": option_id})
     
     # Handle "Own Answer" (Option F)
     if option_id == "F":
-        await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.message.answer("Будь ласка, введіть вашу власну відповідь:")
+        # State first: the user's text must find the bot already waiting for it
         await state.set_state(TestStates.waiting_for_open_text)
-        await callback.answer()
+        await asyncio.gather(
+            call(callback.answer()),
+            call(callback.message.edit_reply_markup(reply_markup=None)),
+            call(callback.message.answer("Будь ласка, введіть вашу власну відповідь:")),
+        )
         return
 
-    # Save Standard Answer
-    await db_repo.save_answer(session_id, current_q_id, option_id)
-    await callback.answer()
-    
-    await callback.message.edit_reply_markup(reply_markup=None)
-    await proceed_to_next(callback.message, state)
+    add_running_score(tenant.engine_for(data.get("questions_version")), data, current_q_id, option_id)
+    # Save Standard Answer; the Telegram calls run alongside the next question
+    await proceed_to_next(callback.message, state, tenant, data, db_repo.save_answer(session_id, current_q_id, option_id), [
+        call(callback.answer()),
+        call(callback.message.edit_reply_markup(reply_markup=None)),
+    ])
 
-@router.message(TestStates.waiting_for_open_text)
-async def process_open_text(message: types.Message, state: FSMContext):
+async def process_open_text(message: types.Message, state: FSMContext, tenant: Tenant):
     data = await state.get_data()
     q_index = data.get("current_q_index", 0)
     session_id = data.get("session_id")
     q_order = data.get("question_order")
     current_q_id = q_order[q_index]
-    
-    # Save Answer with Text
-    await db_repo.save_answer(session_id, current_q_id, "F", open_text=message.text)
+    bind_log_context(session_id=session_id)
+    logging.debug("open text answer", extra={"q_index": q_index, "question_id": current_q_id, "chars": len(message.text or "")})
     
     await state.set_state(TestStates.answering_questions)
-    await proceed_to_next(message, state)
+    # Save Answer with Text
+    await proceed_to_next(message, state, tenant, data, db_repo.save_answer(session_id, current_q_id, "F", open_text=message.text), [])
 
-async def proceed_to_next(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    q_index = data.get("current_q_index", 0)
+def add_running_score(engine, data: dict, question_id: int, option_id: str):
+    # Sessions started before this was deployed have no totals: they just run the full test
+    scores = data.get("scores")
+    arch, points = engine.option_score(question_id, option_id)
+    if arch and scores is not None:
+        # A new dict: the FSM storage may hand out its own, and the save can still fail
+        data["scores"] = {**scores, arch.value: scores.get(arch.value, 0) + points}
+
+def adaptive_step(engine, data: dict, next_index: int) -> bool:
+    """
+    Adaptive mode: True when the answers so far already fix the result.
+    Otherwise moves the most informative remaining question to `next_index`.
+    """
+    if not settings.ADAPTIVE_MODE or next_index < settings.ADAPTIVE_MIN_QUESTIONS or "scores" not in data:
+        return False
+    q_order = data["question_order"]
+    remaining = q_order[next_index:]
+    scores = {ArchetypeType(a): v for a, v in data.get("scores", {}).items()}
+    secondary = settings.ADAPTIVE_SCOPE != "primary"
+    if engine.is_settled(scores, remaining, secondary):
+        return True
+    best = engine.pick_next(scores, remaining, secondary)
+    i = q_order.index(best, next_index)
+    q_order[next_index], q_order[i] = q_order[i], q_order[next_index]
+    return False
+
+async def proceed_to_next(message: types.Message, state: FSMContext, tenant: Tenant, data: dict, save, pending: list):
+    """
+    Advances the test using the FSM data the caller already read: the answer
+    `save` first, then one state write, then `pending` (callback answer,
+    keyboard removal...) runs concurrently with sending the next question.
+    """
+    try:
+        # Stored before the index moves on: if the save fails, the question stays current
+        await save
+    except Exception:
+        for coro in pending:
+            coro.close()
+        raise
     q_order = data.get("question_order")
-    
-    next_index = q_index + 1
-    
-    # Intermediate Progress Messages
-    progress_messages = {
-        9: "🚀 Чудовий початок! Ви пройшли 25% тесту. Ваша щирість — ключ до точного результату.",
-        18: "🌓 Ви вже на екваторі (50%)! Архетипи починають проявлятися ясніше. Продовжуємо?",
-        27: "🏁 Залишився останній ривок (75%)! Ви вже майже бачите свій повний профіль."
-    }
-    
-    if next_index in progress_messages:
-        await message.answer(progress_messages[next_index])
+    next_index = data.get("current_q_index", 0) + 1
+    engine = tenant.engine_for(data.get("questions_version"))
 
-    if next_index < len(q_order):
-        await state.update_data(current_q_index=next_index)
-        await send_question(message, state)
+    if next_index < len(q_order) and not adaptive_step(engine, data, next_index):
+        # Written before anything is sent, so the next tap always sees the new index
+        data["current_q_index"] = next_index
+        await state.set_data(data)
+        await asyncio.gather(*pending, send_question(message, engine, data.get("session_id"), q_order, next_index))
     else:
-        await finish_test(message, state)
+        await asyncio.gather(*pending)
+        await finish_test(message, state, tenant, data, stop_reason="adaptive" if next_index < len(q_order) else "complete")
 
-async def finish_test(message: types.Message, state: FSMContext):
+# Opening line of the results, by why the test ended ("adaptive": the answers already fixed the result)
+FINISH_MESSAGES = {
+    "complete": "🎉 <b>Вітаю! Ви відповіли на всі питання!</b>",
+    "adaptive": "🎉 <b>Вітаю! Ваших відповідей уже достатньо, щоб точно визначити ваш профіль!</b>",
+}
+
+async def finish_test(message: types.Message, state: FSMContext, tenant: Tenant, data: Optional[dict] = None,
+                      stop_reason: str = "complete"):
     # 1. Congratulation
-    await message.answer("🎉 <b>Вітаю! Ви відповіли на всі питання!</b>\n\nТепер починається найцікавіше — аналіз вашого профілю.", parse_mode="HTML")
+    await message.answer(f"{FINISH_MESSAGES[stop_reason]}\n\nТепер починається найцікавіше — аналіз вашого профілю.", parse_mode="HTML")
     
     # 2. Start Timer & Analysis
-    timer_msg = await message.answer("⏳ <b>Запускаю процес аналізу...</b>\nЗалишилось: 2:00", parse_mode="HTML")
+    start_mins, start_secs = divmod(settings.RESULTS_COUNTDOWN_SECONDS, 60)
+    timer_msg = await message.answer(f"⏳ <b>Запускаю процес аналізу...</b>\nЗалишилось: {start_mins}:{start_secs:02d}", parse_mode="HTML")
     
     # Run scoring in background/parallel to timer if needed, 
     # but the user wants results AFTER the countdown.
-    data = await state.get_data()
+    if data is None:
+        data = await state.get_data()
     session_id = data.get("session_id")
+    bind_log_context(session_id=session_id)
+    logging.info("test finished", extra={"stop_reason": stop_reason, "answered": data.get("current_q_index", 0) + 1})
+    engine = tenant.engine_for(data.get("questions_version"))
     
     # Prepare data for scoring
-    session_obj = await db_repo.get_session_with_answers(session_id)
+    session_obj = await db_repo.get_session_with_answers(session_id) if session_id else None
+    if session_obj is None:
+        # Removed by the retention job (abandoned for RETENTION_ABANDONED_HOURS) or FSM data lost
+        logging.warning("Session not found at finish, asking the user to start over")
+        await state.clear()
+        await timer_msg.edit_text("На жаль, цей тест застарів і його відповіді більше недоступні. Пройдіть тест ще раз: /start")
+        return
     from core.models import UserSession as PydanticSession, UserAnswer
     p_answers = [
         UserAnswer(question_id=a.question_id, selected_option_id=a.selected_option_id, open_text_input=a.open_text_input)
@@ -154,26 +347,44 @@ async def finish_test(message: types.Message, state: FSMContext):
          answers=p_answers
     )
     result = engine.calculate_scores(p_session)
-    await state.update_data(scoring_result=result.model_dump())
+    result.questions_version = engine.version
+    result.info_version = data.get("info_version") or content_store.knowledge_base().version
+    # Norms hold full-length tests only: an adaptive early stop has fewer points to compare.
+    # They are one population of the bundled bank, which other banks' scores would skew
+    if tenant.default_bank and len(session_obj.answers) >= len(engine.questions):
+        try:
+            all_scores = {a: result.archetype_scores.get(a, 0) for a in ArchetypeType}  # zeros count too
+            result.percentiles = await norms_store.percentiles(all_scores)
+            await norms_store.record(all_scores)
+        except Exception as e:
+            logging.error(f"Norms update failed: {e}")
+    await state.update_data(scoring_result=result.model_dump(mode="json"))
+    # Late taps on the last question's keyboard find the test over
+    await state.set_state(TestStates.results_ready)
+    await db_repo.mark_session_completed(session_id)
+    tenant.metrics["tests_completed"] += 1
 
-    # Start countdown loop (2 minutes = 120 seconds)
-    # We edit every 5-10 seconds to avoid hitting Telegram limits
-    total_seconds = 120
-    step = 5
-    
     # In parallel, we can start the AI synthesis so it's ready when timer ends
     ai_task = None
     if engine.needs_meta_archetype(result):
         primary_names = [a.value for a in result.primary_cluster]
         ai_task = asyncio.create_task(ai_service.synthesize_meta_archetype(primary_names))
 
+    # The countdown runs outside the update (background.py), so it holds no in-flight slot
+    background.spawn(show_results(message, state, session_id, timer_msg, result, ai_task), tenant)
+
+async def show_results(message: types.Message, state: FSMContext, session_id: int, timer_msg: types.Message, result, ai_task):
+    # Start countdown loop (2 minutes = 120 seconds by default)
+    # We edit every 5-10 seconds to avoid hitting Telegram limits
+    total_seconds = settings.RESULTS_COUNTDOWN_SECONDS
+    step = max(1, settings.RESULTS_COUNTDOWN_STEP)
+
     for remaining in range(total_seconds - step, -1, -step):
         await asyncio.sleep(step)
         mins, secs = divmod(remaining, 60)
         try:
             await timer_msg.edit_text(f"⏳ <b>Аналізую ваші результати...</b>\nЗалишилось: {mins}:{secs:02d}", parse_mode="HTML")
         except Exception as e:
-            import logging
             logging.error(f"Timer edit failed: {e}")
             # If edit fails, we just continue or stop
     
@@ -185,17 +396,19 @@ async def finish_test(message: types.Message, state: FSMContext):
             # But let's wait a bit more just in case.
             ai_res = await asyncio.wait_for(ai_task, timeout=10.0) 
             meta_title = ai_res.get("title")
-            await state.update_data(meta_title=meta_title)
         except Exception as e:
-            import logging
             logging.error(f"AI Synthesis failed or timed out: {e}")
 
+    if not await background.still_in_session(state, session_id):
+        # The user started over during the countdown: the new test owns the FSM now
+        logging.info("results dropped, user started another test")
+        return
+    if meta_title:
+        await state.update_data(meta_title=meta_title)
+
     # 3. Final Results
     await timer_msg.delete()
     
-    # Generate Chart
-    chart_buf = create_radar_chart(result.archetype_scores)
-    
     caption = f"🏁 <b>Ваші результати готові!</b>\n\n"
     if meta_title:
         caption += f"🔮 <b>Ваш Мета-Архетип:</b> {meta_title}\n\n"
@@ -208,42 +421,67 @@ async def finish_test(message: types.Message, state: FSMContext):
     caption += "📊 <b>Детальні бали:</b>\n"
     sorted_scores = sorted(result.archetype_scores.items(), key=lambda x: x[1], reverse=True)
     for arch, score in sorted_scores:
-        caption += f"• {arch.ukrainian_name.split(' (')[0]}: {score}\n"
-        
+        caption += f"• {arch.ukrainian_name.split(' (')[0]}: {score}"
+        if arch in result.percentiles:
+            caption += f" (вище, ніж у {result.percentiles[arch]}%)"
+        caption += "\n"
+
     caption += "\nПовний опис стратегії доступний у звіті нижче."
     
-    input_file = BufferedInputFile(chart_buf.getvalue(), filename="chart.png")
-    await message.answer_photo(input_file, caption=caption, parse_mode="HTML")
+    await send_chart(message, result.archetype_scores, caption, result.percentiles)
     await message.answer("Щоб отримати повний PDF-звіт та стратегію, заповніть дані:", reply_markup=get_lead_magnet_keyboard())
     await state.set_state(LeadMagnetStates.waiting_for_name)
 
-@router.callback_query(F.data == "get_report")
 async def start_lead_magnet(callback: types.CallbackQuery, state: FSMContext):
+    if not (await state.get_data()).get("scoring_result"):
+        # An old offer message: the report was sent and the FSM data cleared
+        await callback.answer()
+        await callback.message.answer("Звіт уже надіслано. Отримати його ще раз: /report, пройти тест знову: /start")
+        return
     await callback.message.answer("Введіть ваше ім'я для звіту:")
     await state.set_state(LeadMagnetStates.waiting_for_name)
     await callback.answer()
 
-@router.message(LeadMagnetStates.waiting_for_name)
 async def process_name(message: types.Message, state: FSMContext):
     await state.update_data(user_name=message.text)
     await message.answer("Введіть ваш номер телефону:")
     await state.set_state(LeadMagnetStates.waiting_for_phone)
 
-@router.message(LeadMagnetStates.waiting_for_phone)
 async def process_phone(message: types.Message, state: FSMContext):
     await state.update_data(user_phone=message.text)
     await message.answer("Введіть ваш Email (туди прийде PDF):")
     await state.set_state(LeadMagnetStates.waiting_for_email)
 
-@router.message(LeadMagnetStates.waiting_for_email)
-async def process_email(message: types.Message, state: FSMContext):
+async def process_email(message: types.Message, state: FSMContext, tenant: Tenant):
+    data = await state.get_data()
+    session_id = data.get("session_id")
+    bind_log_context(session_id=session_id)
+    # LLM + PDF + SMTP run once per test session, however many e-mails arrive meanwhile
+    once_key = ("report", session_id)
+    if not throttle.claim_once(once_key):
+        logging.debug("report already in progress or sent")
+        return
     email = message.text
+    data["user_email"] = email
     await state.update_data(user_email=email)
-    
+
     # Generate PDF
     await message.answer("⏳ Генерую PDF файл (~10-20 секунд)...")
-    
-    data = await state.get_data()
+    # Seconds of LLM, PDF and SMTP: delivered outside the update (background.py)
+    background.spawn(deliver_lead_report(message, state, tenant, data, once_key), tenant)
+
+async def deliver_lead_report(message: types.Message, state: FSMContext, tenant: Tenant, data: dict, once_key):
+    try:
+        sent = await send_lead_report(message, state, tenant, data)
+    except Exception:
+        throttle.release_once(once_key)
+        raise
+    if not sent:
+        throttle.release_once(once_key)  # the user may send the e-mail again
+
+async def send_lead_report(message: types.Message, state: FSMContext, tenant: Tenant, data: dict) -> bool:
+    email = data["user_email"]
+    await db_repo.update_user_contact(message.from_user.id, data.get("user_name"), data.get("user_phone"), email)
     scoring_result = data.get("scoring_result") 
     # Use real objects
     
@@ -251,40 +489,67 @@ async def process_email(message: types.Message, state: FSMContext):
     # Actually we stored result, can recreate.
     
     # Generate Strategy Logic (Stub)
-    strategy_text = await ai_service.generate_report_strategy(scoring_result['archetype_scores'])
-    
-    # Chart
-    chart_buf = create_radar_chart(scoring_result['archetype_scores'])
-    
+    info_version = scoring_result.get("info_version")
+    strategy_text = await ai_service.generate_report_strategy(scoring_result['archetype_scores'], info_version)
+    
+    report_inputs = {
+        "user_name": data.get("user_name"),
+        "user_phone": data.get("user_phone", "Не вказано"),
+        "meta_archetype_title": data.get("meta_title", "Архетипний Профіль"),
+        "scoring_data": scoring_result,
+        "strategy_content": strategy_text,
+        "date": datetime.now().strftime('%d.%m.%Y'),
+        "content": info_version,
+    }
+    pdf_key = artifact_store.key_for("pdf", report_inputs)
+    filename = f"Archetype_{data.get('user_name')}.pdf"
+
+    # Identical inputs (e.g. a repeated email step) reuse the stored PDF
+    artifact = await asyncio.to_thread(artifact_store.open, pdf_key)
+    if artifact is None:
+        chart_data = await get_chart_bytes(scoring_result['archetype_scores'], scoring_result.get('percentiles'))
+        render = functools.partial(
+            contextvars.copy_context().run,  # keeps the update's log context in the render thread
+            generate_pdf_report,
+            user_name=report_inputs["user_name"],
+            user_phone=report_inputs["user_phone"],
+            meta_archetype_title=report_inputs["meta_archetype_title"],
+            scoring_data=scoring_result,
+            strategy_content=strategy_text,
+            chart_buffer=io.BytesIO(chart_data),
+            info_version=info_version
+        )
+        try:
+            async with tenant.report_slots:
+                pdf_buf = await asyncio.get_running_loop().run_in_executor(report_pool, render)
+            tenant.metrics["reports"] += 1
+        except Exception as e:
+            logging.error(f"PDF Generation Failed: {e}")
+            await message.answer("❌ Сталася помилка при генерації PDF. Але ваші результати збережені, ми надішлемо їх пізніше.")
+            return False
+        # One shared artifact for the store, Telegram and both e-mails
+        artifact = ReportArtifact.from_buffer(pdf_buf, filename)
+        del pdf_buf
+        await asyncio.to_thread(artifact_store.put, pdf_key, artifact.view, filename)
+
     try:
-        pdf_buf = generate_pdf_report(
+        # Send via Telegram
+        await send_report_document(message, pdf_key, artifact, filename, "Ваш персональний звіт готовий!")
+        await asyncio.to_thread(artifact_store.set_alias, tenant.scoped(f"last_report:{message.from_user.id}"), pdf_key)
+
+        # Send via Email
+        await send_report_email(
+            to_email=email,
             user_name=data.get("user_name"),
             user_phone=data.get("user_phone", "Не вказано"),
-            meta_archetype_title=data.get("meta_title", "Архетипний Профіль"),
-            scoring_data=scoring_result,
-            strategy_content=strategy_text,
-            chart_buffer=chart_buf
+            pdf=PDFAttachment(artifact.view, filename),
+            filename=filename
         )
-    except Exception as e:
-        import logging
-        logging.error(f"PDF Generation Failed: {e}")
-        await message.answer("❌ Сталася помилка при генерації PDF. Але ваші результати збережені, ми надішлемо їх пізніше.")
-        return
-    
-    pdf_file = BufferedInputFile(pdf_buf.getvalue(), filename=f"Archetype_{data.get('user_name')}.pdf")
-    
-    # Send via Telegram
-    await message.answer_document(pdf_file, caption="Ваш персональний звіт готовий!")
-    
-    # Send via Email
-    await send_report_email(
-        to_email=email,
-        user_name=data.get("user_name"),
-        user_phone=data.get("user_phone", "Не вказано"),
-        pdf_buf=pdf_buf,
-        filename=f"Archetype_{data.get('user_name')}.pdf"
-    )
+    finally:
+        artifact.close()
     
     await message.answer("✅ Також я щойно відправив цей звіт на вашу пошту. Перевірте папку 'Вхідні' (або 'Спам').")
     
-    await state.clear()
+    if await background.still_in_session(state, data.get("session_id")):
+        await state.clear()
+    return True
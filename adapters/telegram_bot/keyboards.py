@@ -3,11 +3,12 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from typing import List
 from core.models import QuestionOption
+from .answer_guard import answer_payload
 
-def get_question_keyboard(options: List[QuestionOption]) -> InlineKeyboardMarkup:
+def get_question_keyboard(options: List[QuestionOption], session_id: int, q_index: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     for opt in options:
-        # Callback data format: "ans:{option_id}"
+        # Callback data format: "ans:{session token}:{q_index}:{option_id}" (see answer_guard.py)
         # Truncate text for specific mobile view if needed? 
         # Telegram buttons wrap text automatically.
         # Try to force 2 lines if text is long by inserting a newline
@@ -21,7 +22,7 @@ def get_question_keyboard(options: List[QuestionOption]) -> InlineKeyboardMarkup
         else:
             display_text = f"{opt.id}) {opt.text}"
 
-        builder.button(text=display_text, callback_data=f"ans:{opt.id}")
+        builder.button(text=display_text, callback_data=answer_payload(session_id, q_index, opt.id))
     builder.adjust(1) # 1 column
     return builder.as_markup()
 
@@ -1,21 +1,92 @@
 # Bot Version: 1.1.5 - Pro Fallback & Robust SMTP
 import asyncio
 import logging
+import signal
 import sys
+from typing import List, Tuple
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 # Fix path to allow importing from root if running as script
 import os
 sys.path.append(os.getcwd())
 
 from core.config import settings
+from core.logging_setup import setup_logging
+from core.content import content_store
+from core.loop_monitor import loop_monitor
 from adapters.db_repo import db_repo
-from adapters.telegram_bot.handlers import router as bot_router
+from adapters.retention import retention_job
+from adapters.telegram_bot import background
+from adapters.telegram_bot.handlers import create_router
+from adapters.telegram_bot.middlewares import AnswerGuardMiddleware, LogContextMiddleware, TenantMetricsMiddleware, ThrottleMiddleware
+from adapters.telegram_bot.storage import create_storage
+from adapters.telegram_bot.tenants import Tenant, default_tenant, load_tenants, log_tenant_stats, log_tenant_stats_forever
+from adapters.telegram_bot.webhook import run_webhook
+from adapters.telegram_bot.workers import run_multiworker
+
+def create_api_session() -> AiohttpSession:
+    if settings.TELEGRAM_API_URL:
+        # Local Bot API server (self-hosted or the load-test stand-in)
+        return AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+    return AiohttpSession()
+
+def create_bot(token: str = None, session: AiohttpSession = None) -> Bot:
+    # The token is part of each request URL, so the bots of all tenants can share one session (connection pool)
+    return Bot(token=token or settings.BOT_TOKEN, session=session or create_api_session())
+
+def create_dispatcher(tenant: Tenant = None) -> Dispatcher:
+    # Workflow data: handlers and middlewares get the tenant as `tenant`
+    dp = Dispatcher(storage=create_storage(), tenant=tenant or default_tenant())
+    # Between aiogram's user and FSM middlewares: floods and stale taps are dropped before any storage read
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(TenantMetricsMiddleware())
+    if settings.THROTTLE_ENABLED:
+        dp.update.outer_middleware(ThrottleMiddleware())
+    dp.update.outer_middleware(AnswerGuardMiddleware())
+    dp.update.outer_middleware(dp.fsm)
+    # After aiogram's user/FSM outer middlewares, so their data is available
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.include_router(create_router())
+    return dp
+
+def create_tenant_bots(tenants: List[Tenant]) -> List[Tuple[Bot, Dispatcher]]:
+    session = create_api_session()
+    return [(create_bot(t.token, session), create_dispatcher(t)) for t in tenants]
+
+def start_polling(bot: Bot, dp: Dispatcher, **kwargs):
+    # At most max_in_flight handlers of a tenant at once. Handlers return in milliseconds (the results
+    # countdown and the report run in background.py), so the limit never stalls update intake for long
+    return dp.start_polling(bot, handle_signals=False, close_bot_session=False,
+                            tasks_concurrency_limit=dp["tenant"].max_in_flight, **kwargs)
+
+async def run_polling(bots: List[Tuple[Bot, Dispatcher]]):
+    # One polling loop per tenant; aiogram's signal handling would only stop the last one registered
+    loop = asyncio.get_running_loop()
+
+    def stop():
+        for _, dp in bots:
+            asyncio.ensure_future(dp.stop_polling())
+
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows: rely on KeyboardInterrupt
+    await asyncio.gather(*(start_polling(bot, dp) for bot, dp in bots))
+
+def load_content(tenants: List[Tenant]):
+    # Loaded and validated at startup (invalid content stops the bot here); reloads are checked later
+    for t in tenants:
+        logging.info(f"Tenant {t.name}: {len(t.engine.questions)} questions, version {t.engine.version}")
+    logging.info(f"archetype_info.json version {content_store.knowledge_base().version}")
 
 async def main():
-    # Logging config
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    # Logging config (JSON lines, written off the event loop)
+    setup_logging()
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     
     # Init DB
     await db_repo.init_db()
@@ -24,21 +95,47 @@ async def main():
     from dotenv import load_dotenv
     load_dotenv()
     
-    # Init Bot
-    bot = Bot(token=settings.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    
-    # Register Routers
-    dp.include_router(bot_router)
+    # Init Bots & Register Routers (one per tenant)
+    tenants = load_tenants()
+    bots = create_tenant_bots(tenants)
+    logging.info(f"Serving {len(tenants)} bot(s): {', '.join(t.name for t in tenants)}")
     
-    # Start Polling
+    # Background retention (ingress process only in multi-worker mode)
+    retention_task = None
+    if settings.RETENTION_ENABLED:
+        retention_task = asyncio.create_task(retention_job.run_forever())
+    stats_task = None
+    if settings.TENANT_STATS_INTERVAL > 0 and settings.WORKERS <= 1:
+        stats_task = asyncio.create_task(log_tenant_stats_forever(tenants, settings.TENANT_STATS_INTERVAL))
+    # Content hot reload (each worker process watches its own copy)
+    content_task = None
+    if settings.WORKERS <= 1:
+        load_content(tenants)
+        if settings.CONTENT_RELOAD_SECONDS > 0:
+            content_task = asyncio.create_task(content_store.watch_forever(settings.CONTENT_RELOAD_SECONDS))
+
     try:
-        logging.info("Starting Bot Polling...")
-        await dp.start_polling(bot)
+        if settings.WORKERS > 1:
+            await run_multiworker(bots, settings.WORKERS)
+        elif settings.BOT_MODE == "webhook":
+            logging.info("Starting Bot Webhook...")
+            await run_webhook(bots)
+        else:
+            logging.info("Starting Bot Polling...")
+            await run_polling(bots)
     except Exception as e:
         logging.error(f"Error: {e}")
     finally:
-        await bot.session.close()
+        for task in (retention_task, stats_task, content_task):
+            if task:
+                task.cancel()
+        # Results countdowns and report deliveries still running (no-op in the multi-worker ingress)
+        await background.drain(settings.WEBHOOK_DRAIN_TIMEOUT)
+        if settings.WORKERS <= 1:
+            log_tenant_stats(tenants)
+        await loop_monitor.stop()
+        # Shared by all tenants' bots
+        await bots[0][0].session.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,141 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, Update
+
+from core.logging_setup import current_log_context, new_update_context, reset_log_context
+from core.loop_monitor import loop_monitor
+from .answer_guard import ANSWER_PREFIX, answer_guard, parse_answer_payload
+from .throttle import throttle, update_kind
+
+
+async def answer_dropped(callback: CallbackQuery, text: Optional[str] = None):
+    """Answers a tap that is not handled, so its button stops spinning. Best effort: the query may be too old."""
+    try:
+        await callback.answer(text)
+    except TelegramAPIError as e:
+        logging.debug(f"Dropped tap not answered: {e}")
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Opens a log context per update: correlation id, update/user/chat ids, tenant
+    and the FSM state at arrival. Registered after aiogram's own outer middlewares,
+    so the user, chat and raw state are already resolved (no extra storage read).
+    The loop monitor gets the same context, to name the update behind a stall.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        tenant = data.get("tenant")
+        token = new_update_context(
+            update_id=event.update_id,
+            user_id=user.id if user else None,
+            chat_id=chat.id if chat else None,
+            state=data.get("raw_state"),
+            tenant=tenant.name if tenant else None,
+        )
+        loop_monitor.track(current_log_context())
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            logging.debug("update handled", extra={"event_type": event.event_type, "ms": round((time.perf_counter() - started) * 1000, 1)})
+            loop_monitor.untrack()
+            reset_log_context(token)
+
+
+class AnswerGuardMiddleware(BaseMiddleware):
+    """
+    Drops duplicate and stale answer taps (answer_guard.py). Registered before
+    aiogram's FSM middleware, so a dropped tap never touches the FSM storage;
+    only aiogram's user/chat resolution has run. The dropped tap is still
+    answered (one Bot API call), or the user's button would keep spinning.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query
+        chat = data.get("event_chat")
+        if callback is None or chat is None or not (callback.data or "").startswith(ANSWER_PREFIX):
+            return await handler(event, data)
+        parsed = parse_answer_payload(callback.data)
+        if parsed is None:  # keyboard from before the tokens: the handler applies it as before
+            return await handler(event, data)
+        token, q_index, _ = parsed
+        key = (data["bot"].id, chat.id)
+        reason = answer_guard.check(key, token, q_index)
+        if reason:
+            logging.debug("answer tap dropped", extra={"reason": reason, "chat_id": chat.id, "q_index": q_index})
+            await answer_dropped(callback)
+            return None
+        try:
+            return await handler(event, data)
+        except Exception:
+            answer_guard.release(key, token, q_index)
+            raise
+
+
+class TenantMetricsMiddleware(BaseMiddleware):
+    """
+    Per-tenant update counters (tenant.metrics): updates, in flight, peak and
+    handler errors. Registered ahead of the answer guard, so dropped taps count too.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        metrics = data["tenant"].metrics
+        metrics["updates"] += 1
+        metrics["in_flight"] += 1
+        metrics["peak_in_flight"] = max(metrics["peak_in_flight"], metrics["in_flight"])
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics["errors"] += 1
+            raise
+        finally:
+            metrics["in_flight"] -= 1
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """
+    Per-user flood limits (throttle.py). Registered before the answer guard and
+    aiogram's FSM middleware, so a dropped update costs a bucket lookup. The first
+    dropped message of a burst gets one short notice; later ones are silent.
+    A dropped button tap is always answered (with a short "too fast" toast), or
+    the button would keep spinning.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        kind = update_kind(event)
+        if user is None or kind is None or throttle.allow(data["bot"].id, user.id, kind):
+            return await handler(event, data)
+        logging.debug("update throttled", extra={"kind": kind, "user_id": user.id})
+        if event.callback_query is not None:
+            await answer_dropped(event.callback_query, "⏳ Занадто швидко. Зачекайте трохи.")
+        elif event.message is not None and throttle.allow(data["bot"].id, user.id, "notice"):
+            await event.message.answer("⏳ Забагато повідомлень. Зачекайте трохи й спробуйте ще раз.")
+        return None
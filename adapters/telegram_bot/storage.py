@@ -0,0 +1,48 @@
+import json
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from adapters.db_repo import db_repo
+from core.config import settings
+
+
+def storage_key_str(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or 0}:{key.destiny}"
+
+
+class DBStorage(BaseStorage):
+    """
+    FSM storage in the bot database, so every worker process sees the same
+    state. Values must be JSON-serialisable (the handlers only store ids,
+    lists and dumped scoring results).
+    """
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await db_repo.set_fsm_state(storage_key_str(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await db_repo.get_fsm_record(storage_key_str(key))
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await db_repo.set_fsm_data(storage_key_str(key), dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await db_repo.get_fsm_record(storage_key_str(key))
+        if not record or not record.data:
+            return {}
+        return json.loads(record.data)
+
+    async def close(self) -> None:
+        pass
+
+
+def create_storage() -> BaseStorage:
+    # Several workers must share state; a single process can keep it in memory
+    if settings.FSM_STORAGE == "db" or settings.WORKERS > 1:
+        return DBStorage()
+    return MemoryStorage()
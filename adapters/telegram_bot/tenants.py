@@ -0,0 +1,135 @@
+"""
+Multi-tenant mode: one process serves several bots, each with its own token
+and question bank.
+
+TENANTS_FILE is a JSON list:
+    [{"name": "main", "token": "123:abc"},
+     {"name": "hr", "token": "456:def", "data_dir": "data/hr", "max_in_flight": 50, "max_reports": 1}]
+`data_dir` holds the tenant's questions.json (default: the bundled data/).
+Without TENANTS_FILE there is a single tenant, "default", running BOT_TOKEN.
+
+Every tenant gets its own Bot, Dispatcher and router (handlers.create_router),
+with the Tenant injected into handlers as `tenant`. The DB pool, AI client,
+artifact store, norms, log queue and the PDF render thread (handlers.report_pool)
+are process-wide, so they are shared. Tenants using the same question bank share
+its engine (core/content.py, which also reloads it when the file changes). Isolation: at most `max_in_flight` updates of a tenant are
+handled at once (polling task limit / webhook and worker runners), and at most
+`max_reports` of its PDFs wait for the render thread, so one busy bot cannot
+take every slot.
+"""
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from core.config import settings
+from core.content import content_store
+from core.engine import ArchetypeEngine
+
+DEFAULT_TENANT = "default"
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_DATA_DIR = os.path.join(_BASE_DIR, "data")
+
+
+@dataclass
+class Tenant:
+    name: str
+    token: str
+    data_dir: str = DEFAULT_DATA_DIR
+    max_in_flight: int = 0
+    max_reports: int = 0
+    metrics: Dict[str, int] = field(default_factory=lambda: {
+        "updates": 0, "in_flight": 0, "peak_in_flight": 0, "errors": 0,
+        "tests_started": 0, "tests_completed": 0, "reports": 0,
+    })
+    _report_slots: Optional[asyncio.Semaphore] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.data_dir = os.path.abspath(os.path.join(_BASE_DIR, self.data_dir))
+        self.max_in_flight = self.max_in_flight or settings.TENANT_MAX_IN_FLIGHT
+        self.max_reports = self.max_reports or settings.TENANT_MAX_REPORTS
+
+    @property
+    def questions_path(self) -> str:
+        return os.path.join(self.data_dir, "questions.json")
+
+    @property
+    def engine(self) -> ArchetypeEngine:
+        # Current version of the bank: new tests start on it
+        return content_store.engine(self.questions_path)
+
+    def engine_for(self, version: Optional[str]) -> ArchetypeEngine:
+        """The bank version a test started with (FSM data `questions_version`)."""
+        return content_store.engine(self.questions_path, version)
+
+    @property
+    def default_bank(self) -> bool:
+        # Norms, analytics and `reports.regenerate` defaults are built for the bundled bank
+        return self.data_dir == DEFAULT_DATA_DIR
+
+    @property
+    def db_name(self) -> Optional[str]:
+        # sessions.tenant: NULL for the single-bot setup, so older rows need no backfill
+        return None if self.name == DEFAULT_TENANT else self.name
+
+    @property
+    def report_slots(self) -> asyncio.Semaphore:
+        # Created on first use, inside the running loop (workers build tenants before it starts)
+        if self._report_slots is None:
+            self._report_slots = asyncio.Semaphore(self.max_reports)
+        return self._report_slots
+
+    def scoped(self, key: str) -> str:
+        """Artifact alias for this tenant (user ids repeat across bots)."""
+        return key if self.name == DEFAULT_TENANT else f"{self.name}:{key}"
+
+
+def load_tenants() -> List[Tenant]:
+    if not settings.TENANTS_FILE:
+        return [Tenant(DEFAULT_TENANT, settings.BOT_TOKEN)]
+    with open(settings.TENANTS_FILE, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = [
+        Tenant(
+            name=e["name"],
+            token=e["token"].strip(),
+            data_dir=e.get("data_dir") or DEFAULT_DATA_DIR,
+            max_in_flight=int(e.get("max_in_flight", 0)),
+            max_reports=int(e.get("max_reports", 0)),
+        )
+        for e in entries
+    ]
+    names = [t.name for t in tenants]
+    if not tenants or len(set(names)) != len(names) or len({t.token for t in tenants}) != len(tenants):
+        raise ValueError(f"{settings.TENANTS_FILE}: tenants need unique names and tokens")
+    for t in tenants:
+        if not os.path.exists(t.questions_path):
+            raise ValueError(f"Tenant {t.name}: {t.questions_path} not found")
+    return tenants
+
+
+def default_tenant() -> Tenant:
+    return load_tenants()[0]
+
+
+def find_tenant(name: str) -> Tenant:
+    for t in load_tenants():
+        if t.name == name:
+            return t
+    if name == DEFAULT_TENANT:
+        # Sessions from before TENANTS_FILE was set up (bundled bank)
+        return Tenant(DEFAULT_TENANT, "")
+    raise ValueError(f"Unknown tenant: {name}")
+
+
+def log_tenant_stats(tenants: List[Tenant]):
+    for t in tenants:
+        logging.info("tenant stats", extra={"tenant": t.name, **t.metrics})
+
+
+async def log_tenant_stats_forever(tenants: List[Tenant], interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        log_tenant_stats(tenants)
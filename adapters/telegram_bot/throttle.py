@@ -0,0 +1,98 @@
+"""
+Per-user flood protection.
+
+ThrottleMiddleware sorts each update into a kind (/start, /report, other
+messages, button taps) and takes a token from the user's bucket for that
+kind. Limits are "burst/seconds" settings (THROTTLE_*): `burst` updates at
+once, refilled evenly over `seconds`. An update without a token is dropped
+before the FSM storage is read, so /start spam creates no DB sessions.
+
+The report pipeline (LLM, PDF, SMTP) additionally runs at most once per test
+session: process_email claims it with `throttle.claim_once`.
+
+Buckets live in one LRU dict of [tokens, last refill] lists keyed by
+(bot id, user id, kind), capped at `max_keys`. An idle bucket refills to
+full, which is what a missing one means too, so evicting the oldest loses nothing
+unless the cap is far too small.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from core.config import settings
+
+
+def parse_limit(value: str) -> Optional[Tuple[float, float]]:
+    """"3/60" -> (burst 3, 3/60 tokens per second); "" or "0" -> unlimited."""
+    if not value or value.strip() in ("0", "off"):
+        return None
+    burst, _, seconds = value.partition("/")
+    burst = float(burst)
+    return burst, burst / float(seconds or 1)
+
+
+class Throttle:
+    def __init__(self, limits: Dict[str, str], max_keys: int = 100_000):
+        self.limits = {kind: parse_limit(value) for kind, value in limits.items()}
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._once: "OrderedDict[Hashable, bool]" = OrderedDict()
+        self.stats: Dict[str, int] = {f"{kind}_dropped": 0 for kind in self.limits}
+        self.stats["once_dropped"] = 0
+
+    def allow(self, bot_id: int, user_id: int, kind: str) -> bool:
+        limit = self.limits.get(kind)
+        if limit is None:
+            return True
+        burst, rate = limit
+        now = time.monotonic()
+        key = (bot_id, user_id, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.stats[f"{kind}_dropped"] += 1
+            return False
+        bucket[0] -= 1
+        return True
+
+    def claim_once(self, key: Hashable) -> bool:
+        """True the first time `key` is claimed (until released or evicted)."""
+        if key in self._once:
+            self.stats["once_dropped"] += 1
+            return False
+        self._once[key] = True
+        if len(self._once) > self.max_keys:
+            self._once.popitem(last=False)
+        return True
+
+    def release_once(self, key: Hashable):
+        self._once.pop(key, None)
+
+
+def update_kind(event) -> Optional[str]:
+    if event.message is not None:
+        text = event.message.text or ""
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0].split("@", 1)[0]
+            if command in ("/start", "/report"):
+                return command[1:]
+        return "text"
+    if event.callback_query is not None:
+        return "callback"
+    return None
+
+
+throttle = Throttle({
+    "start": settings.THROTTLE_START,
+    "report": settings.THROTTLE_REPORT,
+    "text": settings.THROTTLE_TEXT,
+    "callback": settings.THROTTLE_CALLBACK,
+    "notice": "1/30",  # "too many messages" replies
+})
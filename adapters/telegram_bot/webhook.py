@@ -0,0 +1,187 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import setup_application
+
+from core.config import settings
+from . import background
+from .tenants import DEFAULT_TENANT, Tenant
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_path(tenant: Tenant) -> str:
+    # The default tenant keeps the plain path, so an existing webhook registration stays valid
+    if tenant.name == DEFAULT_TENANT:
+        return settings.WEBHOOK_PATH
+    return f"{settings.WEBHOOK_PATH.rstrip('/')}/{tenant.name}"
+
+
+async def register_webhook(bot: Bot, dp: Dispatcher, max_connections: int):
+    path = webhook_path(dp["tenant"])
+    if not settings.WEBHOOK_BASE_URL:
+        logging.warning(f"WEBHOOK_BASE_URL is empty, not registering {path} with Telegram.")
+        return
+    await bot.set_webhook(
+        url=settings.WEBHOOK_BASE_URL.rstrip("/") + path,
+        secret_token=settings.WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=max_connections,
+    )
+    logging.info(f"Webhook registered at {settings.WEBHOOK_BASE_URL}{path}")
+
+
+def chat_id_of(raw: Dict[str, Any]) -> Optional[int]:
+    """
+    Cheap chat lookup on a raw update dict (no pydantic parsing).
+    Used for per-chat ordering and, in multi-worker mode, for routing.
+    """
+    for key, event in raw.items():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        sender = event.get("from")
+        if sender:
+            return sender.get("id")
+    return None
+
+
+class UpdateRunner:
+    """
+    Processes updates concurrently with a bounded number in flight.
+    Updates of one chat are still handled strictly in arrival order,
+    so a user's FSM never sees two of their taps at the same time.
+
+    A processing slot is taken only once the update holds its chat's lock:
+    updates queued behind their own chat never occupy slots, so one chat
+    flooding cannot starve the others. Accepted-but-unfinished updates are
+    bounded separately (`backlog`), which is what pushes back on the sender.
+    """
+
+    BACKLOG_FACTOR = 4
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_in_flight: int):
+        self.dp = dp
+        self.bot = bot
+        self.max_in_flight = max_in_flight
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.backlog = asyncio.Semaphore(max_in_flight * self.BACKLOG_FACTOR)
+        self.chat_locks: Dict[int, asyncio.Lock] = {}
+        self.chat_pending: Dict[int, int] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.accepting = True
+
+    async def submit(self, raw: Dict[str, Any]):
+        # Waiting here delays our HTTP response, which is the backpressure signal
+        await self.backlog.acquire()
+        chat_id = chat_id_of(raw)
+        lock = None
+        if chat_id is not None:
+            lock = self.chat_locks.setdefault(chat_id, asyncio.Lock())
+            self.chat_pending[chat_id] = self.chat_pending.get(chat_id, 0) + 1
+        task = asyncio.create_task(self._process(raw, chat_id, lock))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _process(self, raw: Dict[str, Any], chat_id: Optional[int], lock: Optional[asyncio.Lock]):
+        try:
+            if lock is None:
+                async with self.slots:
+                    await self.dp.feed_raw_update(self.bot, raw)
+                return
+            # asyncio.Lock wakes waiters FIFO, which preserves per-chat order
+            async with lock:
+                async with self.slots:
+                    await self.dp.feed_raw_update(self.bot, raw)
+        except Exception as e:
+            logging.error(f"Update {raw.get('update_id')} failed: {e}")
+        finally:
+            self.backlog.release()
+            if chat_id is not None:
+                self.chat_pending[chat_id] -= 1
+                if not self.chat_pending[chat_id]:
+                    del self.chat_pending[chat_id]
+                    self.chat_locks.pop(chat_id, None)
+
+    async def drain(self, timeout: float):
+        self.accepting = False
+        if not self.tasks:
+            return
+        logging.info(f"Draining {len(self.tasks)} in-flight updates...")
+        done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        if pending:
+            logging.warning(f"Drain timeout: cancelling {len(pending)} handlers")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def build_webhook_app(bots: List[Tuple[Bot, Dispatcher]]) -> web.Application:
+    """One server for every tenant: each bot has its own path and its own in-flight budget."""
+    secret = settings.WEBHOOK_SECRET
+    app = web.Application()
+    runners: Dict[str, UpdateRunner] = {}
+
+    for bot, dp in bots:
+        tenant = dp["tenant"]
+        runner = runners[tenant.name] = UpdateRunner(dp, bot, min(settings.WEBHOOK_MAX_IN_FLIGHT, tenant.max_in_flight))
+
+        async def handle(request: web.Request, runner: UpdateRunner = runner) -> web.Response:
+            if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+                return web.Response(status=401)
+            if not runner.accepting:
+                # Telegram retries non-2xx responses, so nothing is lost during shutdown
+                return web.Response(status=503)
+            await runner.submit(await request.json())
+            return web.json_response({})
+
+        async def on_startup(bot: Bot, dispatcher: Dispatcher, runner: UpdateRunner = runner):
+            await register_webhook(bot, dispatcher, min(100, runner.max_in_flight))
+
+        dp.startup.register(on_startup)
+        app.router.add_post(webhook_path(tenant), handle)
+
+    async def on_shutdown(app: web.Application):
+        await asyncio.gather(*(r.drain(settings.WEBHOOK_DRAIN_TIMEOUT) for r in runners.values()))
+        await background.drain(settings.WEBHOOK_DRAIN_TIMEOUT)
+
+    app["update_runners"] = runners
+    # Drain before the dispatchers' own shutdown hooks run
+    app.on_shutdown.append(on_shutdown)
+    for bot, dp in bots:
+        setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_webhook_server(bots: List[Tuple[Bot, Dispatcher]], host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(build_webhook_app(bots), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def run_webhook(bots: List[Tuple[Bot, Dispatcher]]):
+    runner = await start_webhook_server(bots, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    paths = ", ".join(webhook_path(dp["tenant"]) for _, dp in bots)
+    logging.info(f"Webhook server listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT} ({paths})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows: rely on KeyboardInterrupt
+
+    try:
+        await stop.wait()
+    finally:
+        # Closes the listener, drains in-flight handlers, then runs dispatcher shutdown
+        await runner.cleanup()
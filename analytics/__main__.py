@@ -0,0 +1,127 @@
+"""
+Analytics CLI.
+
+    python -m analytics export [--db URL] [--out DIR] [--format arrow|parquet]
+    python -m analytics report [--out DIR] [--json FILE]
+    python -m analytics norms [--db URL] [--out DIR]
+
+`export` copies the sessions completed since the last watermark (and a
+fresh snapshot of the open ones) into columnar files (schedule it
+off-peak, or point --db at a replica/backup copy).
+`report` reads only those files, never the bot database, with one
+section per bot and question bank version.
+`norms` runs an incremental export, then rebuilds the population norms
+table from the exported history (the bot updates it live after that).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from core.config import settings
+
+
+def cmd_export(args):
+    from analytics.export import export
+    result = export(args.db or settings.DATABASE_URL, args.out, fmt=args.format, chunk_size=args.chunk)
+    print(f"Exported rows: {result}")
+
+
+def _groups(args, default_bank_only: bool = False):
+    """(label, answers, sessions, QuestionTables) per bot and question bank version."""
+    from adapters.telegram_bot.tenants import find_tenant
+    from analytics.aggregates import QuestionTables, bank_groups
+    from analytics.export import read_table
+
+    for (name, version), (answers, sessions) in bank_groups(read_table(args.out, "answers"), read_table(args.out, "sessions")).items():
+        label = f"{name} / {version or 'unversioned'}"
+        try:
+            tenant = find_tenant(name)
+        except ValueError as e:
+            logging.warning(f"Skipping {sessions.num_rows} sessions of {label}: {e}")
+            continue
+        if default_bank_only and not tenant.default_bank:
+            continue
+        yield label, answers, sessions, QuestionTables(tenant.engine_for(version or None))
+
+
+def cmd_report(args):
+    from analytics.aggregates import compute_aggregates
+    from analytics.export import read_table
+
+    users = read_table(args.out, "users")
+    reports = {label: compute_aggregates(answers, sessions, users, tables) for label, answers, sessions, tables in _groups(args)}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.json}")
+
+    for label, report in reports.items():
+        print(f"\n######## {label} ########")
+        print("\n== Funnel ==")
+        for stage, count in report["funnel"].items():
+            print(f"  {stage:<16}{count:>8}")
+        if report["adaptive_stops"]:
+            print(f"\n  adaptive early stops: {report['adaptive_stops']} of {report['completed_sessions']} completed tests, "
+                  f"{report['adaptive_answers_mean']} answers on average")
+        print("\n== Top archetype (completed tests) ==")
+        for arch, count in sorted(report["top_archetype"].items(), key=lambda x: x[1], reverse=True):
+            print(f"  {arch:<12}{count:>8}   in primary cluster: {report['primary_cluster_membership'][arch]}")
+        print("\n== Drop-off (sessions never completed, by answers given) ==")
+        print("  " + " ".join(str(c) for c in report["dropoff_by_answers"]))
+        print("\n== Weakest items (lowest discrimination, full-length tests) ==")
+        items = sorted(report["item_statistics"].items(), key=lambda x: x[1]["discrimination"])
+        for qid, st in items[:10]:
+            print(f"  Q{qid:<4} discrimination={st['discrimination']:+.3f} lift={st['lift']:+.3f} entropy={st['entropy']:.2f}")
+
+
+def cmd_norms(args):
+    from analytics.export import export
+    from analytics.norms import norm_bins, write_norms
+
+    database_url = args.db or settings.DATABASE_URL
+    export(database_url, args.out)
+    # Norms are for the bundled bank; each version is scored with its own questions
+    bins = {}
+    for _, answers, sessions, tables in _groups(args, default_bank_only=True):
+        for arch, counts in norm_bins(answers, sessions, tables).items():
+            merged = bins.setdefault(arch, {})
+            for score, count in counts.items():
+                merged[score] = merged.get(score, 0) + count
+    rows = write_norms(database_url, bins)
+    samples = min((sum(c.values()) for c in bins.values()), default=0)
+    print(f"Norms rebuilt from {samples} completed tests ({rows} bins)")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m analytics")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Incrementally export completed sessions to columnar files")
+    p_export.add_argument("--db", default="", help="Database URL (default: DATABASE_URL)")
+    p_export.add_argument("--out", default=settings.ANALYTICS_DIR)
+    p_export.add_argument("--format", choices=["arrow", "parquet"], default="arrow")
+    p_export.add_argument("--chunk", type=int, default=50_000, help="Rows per part file")
+    p_export.set_defaults(func=cmd_export)
+
+    p_report = sub.add_parser("report", help="Compute aggregates from exported files")
+    p_report.add_argument("--out", default=settings.ANALYTICS_DIR)
+    p_report.add_argument("--json", default="", help="Also write the full report as JSON")
+    p_report.set_defaults(func=cmd_report)
+
+    p_norms = sub.add_parser("norms", help="Rebuild population norms (percentiles) from history")
+    p_norms.add_argument("--db", default="", help="Database URL (default: DATABASE_URL)")
+    p_norms.add_argument("--out", default=settings.ANALYTICS_DIR)
+    p_norms.set_defaults(func=cmd_norms)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
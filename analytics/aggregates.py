@@ -0,0 +1,269 @@
+"""
+Vectorised aggregates over the exported answers/sessions/users files.
+
+Scoring mirrors ArchetypeEngine (points per chosen option, primary cluster
+by the 10% rule) but runs over all sessions at once with numpy. Sessions of
+different bots or question bank versions are split with bank_groups and
+each group is scored with its own bank.
+
+A session counts as completed by the bot's own flag, not by its answer
+count: an adaptive test (ADAPTIVE_MODE) stops early once the result is
+settled. Those early stops are reported separately ("adaptive_stops");
+item statistics and norms use full-length tests only.
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from core.engine import ArchetypeEngine
+from core.models import ArchetypeType
+
+ARCHETYPES: List[str] = [a.value for a in ArchetypeType]
+OPTION_LETTERS = "ABCDEF"
+
+
+class QuestionTables:
+    """Dense lookup tables: (question index, option index) -> archetype index / points."""
+
+    def __init__(self, engine: ArchetypeEngine):
+        self.question_ids = np.array(sorted(engine.questions.keys()), dtype=np.int64)
+        n = len(self.question_ids)
+        self.qid_to_idx = np.full(int(self.question_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+        self.qid_to_idx[self.question_ids] = np.arange(n)
+        self.arch = np.full((n, len(OPTION_LETTERS)), -1, dtype=np.int64)
+        self.points = np.zeros((n, len(OPTION_LETTERS)), dtype=np.int64)
+        arch_idx = {a: i for i, a in enumerate(ARCHETYPES)}
+        for qi, qid in enumerate(self.question_ids):
+            for opt in engine.questions[int(qid)].options:
+                oi = OPTION_LETTERS.find(opt.id)
+                if oi >= 0 and opt.archetype:
+                    self.arch[qi, oi] = arch_idx[opt.archetype.value]
+                    self.points[qi, oi] = opt.points
+
+
+def bank_groups(answers: pa.Table, sessions: pa.Table) -> Dict[Tuple[str, str], Tuple[pa.Table, pa.Table]]:
+    """
+    {(tenant, questions_version): (answers, sessions)}. A NULL tenant is the
+    default bot, a NULL version a session from before content versioning ("").
+    Answers of sessions missing from the export are dropped.
+    """
+    tenants = pc.fill_null(sessions["tenant"], "default").to_pylist()
+    versions = pc.fill_null(sessions["questions_version"], "").to_pylist()
+    keys = sorted(set(zip(tenants, versions)))
+    code = {key: i for i, key in enumerate(keys)}
+    session_group = np.array([code[key] for key in zip(tenants, versions)], dtype=np.int64)
+    session_ids = sessions["id"].to_numpy()
+
+    order = np.argsort(session_ids)
+    answer_sessions = answers["session_id"].to_numpy()
+    pos = np.clip(np.searchsorted(session_ids[order], answer_sessions), 0, max(len(order) - 1, 0))
+    found = session_ids[order][pos] == answer_sessions if len(order) else np.zeros(len(answer_sessions), dtype=bool)
+    answer_group = np.where(found, session_group[order][pos] if len(order) else -1, -1)
+
+    return {
+        key: (answers.filter(pa.array(answer_group == i)), sessions.filter(pa.array(session_group == i)))
+        for key, i in code.items()
+    }
+
+
+def _option_codes(column: pa.ChunkedArray) -> np.ndarray:
+    # Dictionary-encode the single-letter option ids, then map the tiny dictionary
+    encoded = pc.dictionary_encode(column.fill_null("?")).combine_chunks()
+    lut = np.array([OPTION_LETTERS.find(v) for v in encoded.dictionary.to_pylist()], dtype=np.int64)
+    return lut[encoded.indices.to_numpy(zero_copy_only=False)]
+
+
+def _primary_mask(scores: np.ndarray) -> np.ndarray:
+    """Boolean (sessions x archetypes) membership of the primary cluster (10% chain rule)."""
+    order = np.argsort(-scores, axis=1, kind="stable")
+    top = np.take_along_axis(scores, order[:, :3], axis=1).astype(float)
+    s1, s2, s3 = top[:, 0], top[:, 1], top[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inc2 = (s1 > 0) & ((s1 - s2) / s1 <= 0.10)
+        inc3 = inc2 & (s2 > 0) & ((s2 - s3) / s2 <= 0.10)
+    mask = np.zeros_like(scores, dtype=bool)
+    rows = np.arange(len(scores))
+    mask[rows, order[:, 0]] = True
+    mask[rows[inc2], order[inc2, 1]] = True
+    mask[rows[inc3], order[inc3, 2]] = True
+    return mask
+
+
+def score_sessions(answers: pa.Table, tables: QuestionTables):
+    """
+    Latest answer per (session, question), scored in one pass.
+    Returns (uniq_sessions, sess_inv, q_idx, opt_idx, scores, answered); scores is sessions x archetypes,
+    answered the number of distinct questions answered per session.
+    """
+    nq = len(tables.question_ids)
+
+    answer_ids = answers["id"].to_numpy()
+    session_ids = answers["session_id"].to_numpy()
+    q_idx = tables.qid_to_idx[np.clip(answers["question_id"].to_numpy(), 0, len(tables.qid_to_idx) - 1)]
+    opt_idx = _option_codes(answers["option"])
+    valid = (q_idx >= 0) & (opt_idx >= 0)
+    answer_ids, session_ids, q_idx, opt_idx = answer_ids[valid], session_ids[valid], q_idx[valid], opt_idx[valid]
+
+    # Keep only the latest answer per (session, question)
+    uniq_sessions, sess_inv = np.unique(session_ids, return_inverse=True)
+    pair = sess_inv * nq + q_idx
+    latest = np.argsort(answer_ids)[::-1]
+    _, first_pos = np.unique(pair[latest], return_index=True)
+    keep = latest[first_pos]
+    sess_inv, q_idx, opt_idx = sess_inv[keep], q_idx[keep], opt_idx[keep]
+
+    n_sess = len(uniq_sessions)
+    answered = np.bincount(sess_inv, minlength=n_sess)
+
+    arch = tables.arch[q_idx, opt_idx]
+    pts = tables.points[q_idx, opt_idx]
+    scored = arch >= 0
+    scores = np.zeros((n_sess, len(ARCHETYPES)), dtype=np.int64)
+    np.add.at(scores, (sess_inv[scored], arch[scored]), pts[scored])
+    return uniq_sessions, sess_inv, q_idx, opt_idx, scores, answered
+
+
+def session_rows(uniq_sessions: np.ndarray, sessions: pa.Table):
+    """(pos, hit): row pos[i] of uniq_sessions is row i of the sessions table where hit[i]."""
+    n_sess = len(uniq_sessions)
+    pos = np.searchsorted(uniq_sessions, sessions["id"].to_numpy())
+    if not n_sess:
+        return pos, np.zeros(len(pos), dtype=bool)
+    hit = (pos < n_sess) & (uniq_sessions[np.clip(pos, 0, n_sess - 1)] == sessions["id"].to_numpy())
+    return pos, hit
+
+
+def completed_flags(uniq_sessions: np.ndarray, sessions: pa.Table) -> np.ndarray:
+    """The sessions' completed flag per row of uniq_sessions (False for sessions missing from the export)."""
+    pos, hit = session_rows(uniq_sessions, sessions)
+    completed = np.zeros(len(uniq_sessions), dtype=bool)
+    completed[pos[hit]] = pc.fill_null(sessions["completed"], False).to_numpy(zero_copy_only=False)[hit]
+    return completed
+
+
+def compute_aggregates(answers: pa.Table, sessions: pa.Table, users: pa.Table, tables: QuestionTables) -> Dict[str, Any]:
+    nq = len(tables.question_ids)
+    n_opts = len(OPTION_LETTERS)
+
+    uniq_sessions, sess_inv, q_idx, opt_idx, scores, answered = score_sessions(answers, tables)
+    n_sess = len(uniq_sessions)
+    completed = completed_flags(uniq_sessions, sessions)
+    full = completed & (answered >= nq)
+
+    # --- Archetype distributions (completed sessions) ---
+    done_scores = scores[completed]
+    primary_mask = _primary_mask(done_scores) if len(done_scores) else np.zeros((0, len(ARCHETYPES)), dtype=bool)
+    top1 = np.argmax(done_scores, axis=1) if len(done_scores) else np.zeros(0, dtype=np.int64)
+    top1_counts = np.bincount(top1, minlength=len(ARCHETYPES))
+    cluster_counts = primary_mask.sum(axis=0)
+
+    # --- Option frequencies per question ---
+    freq = np.bincount(q_idx * n_opts + opt_idx, minlength=nq * n_opts).reshape(nq, n_opts)
+
+    # --- Drop-off & funnel ---
+    started = sessions.num_rows
+    answered_for_all = np.zeros(started, dtype=np.int64)
+    pos, hit = session_rows(uniq_sessions, sessions)
+    answered_for_all[hit] = answered[pos[hit]]
+    done_for_all = pc.fill_null(sessions["completed"], False).to_numpy(zero_copy_only=False)
+    # Drop-offs are the sessions the bot never completed, whatever their answer count
+    dropoff = np.bincount(np.minimum(answered_for_all[~done_for_all], nq), minlength=nq + 1)[:nq + 1]
+
+    def reached(count: int) -> int:
+        # A completed session passed every stage, also when it stopped early
+        return int(((answered_for_all >= count) | done_for_all).sum())
+
+    user_has_email = dict(zip(users["id"].to_pylist(), users["has_email"].to_pylist()))
+    completed_users = sessions["user_id"].to_numpy()[done_for_all]
+    leads = int(sum(1 for u in np.unique(completed_users) if user_has_email.get(int(u))))
+    adaptive = done_for_all & (answered_for_all < nq)
+    funnel = {
+        "started": started,
+        "answered_1": reached(1),
+        "answered_25pct": reached(nq // 4),
+        "answered_50pct": reached(nq // 2),
+        "answered_75pct": reached(3 * nq // 4),
+        "completed": int(done_for_all.sum()),
+        "adaptive_stops": int(adaptive.sum()),
+        "leads": leads,
+    }
+
+    return {
+        "sessions_with_answers": int(n_sess),
+        "completed_sessions": int(completed.sum()),
+        "full_length_sessions": int(full.sum()),
+        "adaptive_stops": int((completed & ~full).sum()),
+        "adaptive_answers_mean": round(float(answered[completed & ~full].mean()), 1) if (completed & ~full).any() else None,
+        "top_archetype": dict(zip(ARCHETYPES, top1_counts.tolist())),
+        "primary_cluster_membership": dict(zip(ARCHETYPES, cluster_counts.tolist())),
+        "option_frequencies": {
+            int(qid): dict(zip(OPTION_LETTERS, row.tolist())) for qid, row in zip(tables.question_ids, freq)
+        },
+        "dropoff_by_answers": dropoff.tolist(),
+        "funnel": funnel,
+        "item_statistics": item_statistics(sess_inv, q_idx, opt_idx, full, scores, tables),
+    }
+
+
+def item_statistics(sess_inv, q_idx, opt_idx, completed, scores, tables: QuestionTables) -> Dict[int, Dict[str, float]]:
+    """
+    Per question, over completed full-length sessions (`completed` mask):
+      - discrimination: frequency-weighted item-rest correlation between picking an
+        archetype's option and that archetype's score on the other questions
+      - primary_agreement / lift: how often the pick matches the final top archetype,
+        minus what independent picks would give
+      - entropy: normalised entropy of the option distribution (1 = uniform)
+    """
+    nq, n_arch = len(tables.question_ids), len(ARCHETYPES)
+    done_rows = np.flatnonzero(completed)
+    if not len(done_rows):
+        return {}
+    remap = np.full(len(completed), -1, dtype=np.int64)
+    remap[done_rows] = np.arange(len(done_rows))
+    sel = remap[sess_inv] >= 0
+    rows = remap[sess_inv[sel]]
+
+    choice_arch = np.full((len(done_rows), nq), -1, dtype=np.int64)
+    choice_pts = np.zeros((len(done_rows), nq), dtype=np.int64)
+    choice_opt = np.full((len(done_rows), nq), -1, dtype=np.int64)
+    choice_arch[rows, q_idx[sel]] = tables.arch[q_idx[sel], opt_idx[sel]]
+    choice_pts[rows, q_idx[sel]] = tables.points[q_idx[sel], opt_idx[sel]]
+    choice_opt[rows, q_idx[sel]] = opt_idx[sel]
+
+    S = scores[done_rows].astype(float)
+    primary = np.argmax(S, axis=1)
+    p_primary = np.bincount(primary, minlength=n_arch) / len(primary)
+
+    stats = {}
+    for qi, qid in enumerate(tables.question_ids):
+        picks = choice_arch[:, qi]
+        X = np.zeros((len(picks), n_arch))
+        has = picks >= 0
+        X[np.flatnonzero(has), picks[has]] = 1.0
+        rest = S - X * choice_pts[:, qi:qi + 1]
+
+        Xc, Rc = X - X.mean(axis=0), rest - rest.mean(axis=0)
+        denom = np.sqrt((Xc ** 2).sum(axis=0) * (Rc ** 2).sum(axis=0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = (Xc * Rc).sum(axis=0) / denom
+        weights = X.mean(axis=0)
+        ok = np.isfinite(corr) & (weights > 0)
+        discrimination = float((corr[ok] * weights[ok]).sum() / weights[ok].sum()) if ok.any() else 0.0
+
+        agreement = float((picks == primary).mean())
+        expected = float((weights * p_primary).sum())
+
+        opts = choice_opt[:, qi]
+        p_opt = np.bincount(opts[opts >= 0], minlength=len(OPTION_LETTERS)) / max(1, (opts >= 0).sum())
+        nz = p_opt[p_opt > 0]
+        entropy = float(-(nz * np.log(nz)).sum() / np.log(len(OPTION_LETTERS)))
+
+        stats[int(qid)] = {
+            "discrimination": round(discrimination, 4),
+            "primary_agreement": round(agreement, 4),
+            "lift": round(agreement - expected, 4),
+            "entropy": round(entropy, 4),
+        }
+    return stats
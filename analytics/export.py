@@ -0,0 +1,204 @@
+"""
+Incremental export of the bot tables into columnar files.
+
+Answers are upserted in place and a session is marked completed later, so
+rows are not final when they are inserted. A session is exported once it
+has been completed for EXPORT_SETTLE_SECONDS: each run copies the sessions
+completed since the stored watermark (completed_at, id), with all their
+answers, in chunks, as new part files (Arrow IPC by default, Parquet
+optionally). Sessions still open (in progress or abandoned; the retention
+job keeps them few) are re-snapshotted into `open.*` on every run, like
+users. Aggregates are computed from these files only, so reporting never
+queries the live database.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from sqlalchemy import and_, case, create_engine, func, or_, select, true
+from sqlalchemy.engine import make_url
+
+from core.db_models import Answer, Session, User
+
+WATERMARK_FILE = "_watermark.json"
+# A just-completed session may still get its last writes; export it on a later run
+EXPORT_SETTLE_SECONDS = 60
+
+ANSWERS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("session_id", pa.int64()),
+    ("question_id", pa.int32()),
+    ("option", pa.string()),
+    ("has_open_text", pa.bool_()),
+])
+
+SESSIONS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("user_id", pa.int64()),
+    ("started_at", pa.timestamp("us")),
+    ("completed_at", pa.timestamp("us")),
+    ("tenant", pa.string()),
+    ("questions_version", pa.string()),
+    # The bot's is_completed: an adaptive test ends completed with fewer answers than the bank
+    ("completed", pa.bool_()),
+])
+
+USERS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("has_email", pa.bool_()),
+    ("created_at", pa.timestamp("us")),
+])
+
+# Column order must match the schemas
+ANSWERS_COLUMNS = [Answer.id, Answer.session_id, Answer.question_id, Answer.selected_option_id, Answer.open_text_input.is_not(None)]
+# Completed rows from before completed_at existed carry only started_at
+DONE_AT = func.coalesce(Session.completed_at, Session.started_at)
+SESSIONS_COLUMNS = [Session.id, Session.user_id, Session.started_at, case((Session.is_completed == True, DONE_AT)),
+                    Session.tenant, Session.questions_version, func.coalesce(Session.is_completed, False)]
+
+# Users change after creation (email is filled in later), so they are re-snapshotted
+USERS_COLUMNS = [User.id, User.email.is_not(None), User.created_at]
+
+
+def sync_url(database_url: str) -> str:
+    """sqlite+aiosqlite://... -> sqlite://... (the export is a plain batch job)."""
+    url = make_url(database_url)
+    return url.set(drivername=url.get_backend_name()).render_as_string(hide_password=False)
+
+
+def load_watermark(out_dir: str) -> Dict[str, Any]:
+    """{"completed_at": ISO timestamp or None, "session_id": last exported session at that timestamp}"""
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            watermark = json.load(f)
+        if "completed_at" in watermark:
+            return watermark
+        # Id watermark of earlier exports: those parts miss in-place updates, so start over
+        logging.warning(f"{path}: old id watermark, re-exporting from scratch")
+        for name in ("answers", "sessions"):
+            table_dir = os.path.join(out_dir, name)
+            for f in os.listdir(table_dir) if os.path.isdir(table_dir) else []:
+                os.remove(os.path.join(table_dir, f))
+    return {"completed_at": None, "session_id": 0}
+
+
+def save_watermark(out_dir: str, watermark: Dict[str, Any]):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(watermark, f)
+    os.replace(tmp, path)
+
+
+def _write(table: pa.Table, path: str, fmt: str):
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        pq.write_table(table, tmp, compression="zstd")
+    else:
+        feather.write_feather(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _rows_to_table(rows: List[tuple], schema: pa.Schema) -> pa.Table:
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema)
+
+
+def _after(at, session_id: int):
+    """Sessions ordered after (completed_at, id) = (at, session_id)."""
+    if at is None:
+        return true()
+    return or_(DONE_AT > at, and_(DONE_AT == at, Session.id > session_id))
+
+
+def export(database_url: str, out_dir: str, fmt: str = "arrow", chunk_size: int = 50_000) -> Dict[str, int]:
+    """
+    Exports the sessions completed since the watermark (chunk_size sessions per
+    part file) and re-snapshots the open ones. Returns the number of rows
+    exported per table.
+    """
+    ext = "parquet" if fmt == "parquet" else "arrow"
+    for name in ("answers", "sessions"):
+        os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    watermark = load_watermark(out_dir)
+    at = datetime.fromisoformat(watermark["completed_at"]) if watermark["completed_at"] else None
+    cutoff = datetime.utcnow() - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    final = and_(Session.is_completed == True, DONE_AT <= cutoff)
+    exported = {"sessions": 0, "answers": 0}
+
+    engine = create_engine(sync_url(database_url))
+    try:
+        with engine.connect() as conn:
+            while True:
+                query = (select(*SESSIONS_COLUMNS).where(final, _after(at, watermark["session_id"]))
+                         .order_by(DONE_AT, Session.id).limit(chunk_size))
+                sessions = conn.execute(query).fetchall()
+                if not sessions:
+                    break
+                last_at, last_id = sessions[-1][3], sessions[-1][0]
+                # Answers of exactly these sessions: the same key range, no id list
+                in_chunk = and_(final, _after(at, watermark["session_id"]),
+                                or_(DONE_AT < last_at, and_(DONE_AT == last_at, Session.id <= last_id)))
+                answers = conn.execute(
+                    select(*ANSWERS_COLUMNS).join(Session, Answer.session_id == Session.id).where(in_chunk).order_by(Answer.id)
+                ).fetchall()
+                part = f"part-{sessions[0][0]:012d}-{last_id:012d}.{ext}"
+                _write(_rows_to_table(answers, ANSWERS_SCHEMA), os.path.join(out_dir, "answers", part), fmt)
+                _write(_rows_to_table(sessions, SESSIONS_SCHEMA), os.path.join(out_dir, "sessions", part), fmt)
+                exported["sessions"] += len(sessions)
+                exported["answers"] += len(answers)
+                # Persist after every chunk so an interrupted export resumes where it stopped
+                at = last_at
+                watermark = {"completed_at": last_at.isoformat(), "session_id": last_id}
+                save_watermark(out_dir, watermark)
+
+            # Open sessions may still change: replace their snapshot every run
+            open_sessions = conn.execute(select(*SESSIONS_COLUMNS).where(~final).order_by(Session.id)).fetchall()
+            open_answers = conn.execute(
+                select(*ANSWERS_COLUMNS).join(Session, Answer.session_id == Session.id).where(~final).order_by(Answer.id)
+            ).fetchall()
+            for name, rows, schema in (("sessions", open_sessions, SESSIONS_SCHEMA), ("answers", open_answers, ANSWERS_SCHEMA)):
+                for stale in ("open.arrow", "open.parquet"):
+                    if os.path.exists(os.path.join(out_dir, name, stale)):
+                        os.remove(os.path.join(out_dir, name, stale))
+                _write(_rows_to_table(rows, schema), os.path.join(out_dir, name, f"open.{ext}"), fmt)
+            exported["open_sessions"] = len(open_sessions)
+
+            users = conn.execute(select(*USERS_COLUMNS).order_by(User.id)).fetchall()
+            _write(_rows_to_table(users, USERS_SCHEMA), os.path.join(out_dir, f"users.{ext}"), fmt)
+            exported["users"] = len(users)
+    finally:
+        engine.dispose()
+
+    logging.info(f"Analytics export done: {exported}")
+    return exported
+
+
+def read_table(out_dir: str, name: str) -> pa.Table:
+    """Reads every part file of an exported table (both formats may be mixed)."""
+    schema = {"answers": ANSWERS_SCHEMA, "sessions": SESSIONS_SCHEMA, "users": USERS_SCHEMA}[name]
+    if name == "users":
+        paths = [os.path.join(out_dir, f) for f in ("users.arrow", "users.parquet") if os.path.exists(os.path.join(out_dir, f))]
+    else:
+        table_dir = os.path.join(out_dir, name)
+        paths = sorted(os.path.join(table_dir, f) for f in os.listdir(table_dir)) if os.path.isdir(table_dir) else []
+        paths = [p for p in paths if not p.endswith(".tmp")]
+    if not paths:
+        return schema.empty_table()
+    if name == "users":
+        paths = [max(paths, key=os.path.getmtime)]
+    tables = []
+    for p in paths:
+        table = pq.read_table(p) if p.endswith(".parquet") else feather.read_table(p)
+        if name == "sessions" and "completed" not in table.column_names:
+            # Parts written before the column existed: a part-* holds completed sessions only
+            done = not os.path.basename(p).startswith("open.")
+            table = table.append_column("completed", pa.array([done] * table.num_rows, type=pa.bool_()))
+        tables.append(table.select(schema.names).cast(schema))
+    return pa.concat_tables(tables)
@@ -0,0 +1,49 @@
+"""
+Rebuild of the population norms (`norm_bins`) from the exported history.
+
+The bot keeps the histograms up to date one result at a time; this
+recomputes them from scratch (first deploy, changed scoring, drift after
+deleted sessions): all completed sessions are scored at once and binned
+with a single bincount, then the table is replaced in one transaction.
+Like the live update, only full-length tests count: an adaptive early stop
+has fewer points to compare.
+"""
+from typing import Dict
+
+import numpy as np
+import pyarrow as pa
+from sqlalchemy import create_engine, delete, insert
+
+from analytics.aggregates import ARCHETYPES, QuestionTables, completed_flags, score_sessions
+from analytics.export import sync_url
+from core.db_models import Base, NormBin
+
+
+def norm_bins(answers: pa.Table, sessions: pa.Table, tables: QuestionTables) -> Dict[str, Dict[int, int]]:
+    """{archetype: {score: completed full-length sessions with that score}}"""
+    uniq_sessions, *_, scores, answered = score_sessions(answers, tables)
+    done = scores[completed_flags(uniq_sessions, sessions) & (answered >= len(tables.question_ids))]
+    if not len(done):
+        return {}
+    width = int(done.max()) + 1
+    # Row a of the histogram holds archetype a: offset each column into its own range
+    flat = (np.arange(len(ARCHETYPES)) * width + done).ravel()
+    hist = np.bincount(flat, minlength=len(ARCHETYPES) * width).reshape(len(ARCHETYPES), width)
+    return {
+        arch: {int(score): int(hist[a, score]) for score in np.flatnonzero(hist[a])}
+        for a, arch in enumerate(ARCHETYPES)
+    }
+
+
+def write_norms(database_url: str, bins: Dict[str, Dict[int, int]]) -> int:
+    rows = [{"archetype": arch, "score": score, "count": count} for arch, counts in bins.items() for score, count in counts.items()]
+    engine = create_engine(sync_url(database_url))
+    try:
+        Base.metadata.create_all(engine, tables=[NormBin.__table__])
+        with engine.begin() as conn:
+            conn.execute(delete(NormBin))
+            if rows:
+                conn.execute(insert(NormBin), rows)
+    finally:
+        engine.dispose()
+    return len(rows)
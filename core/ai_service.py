@@ -1,8 +1,15 @@
 from typing import List, Dict, Optional
 import json
 import asyncio
+import hashlib
+import time
+from collections import deque
 from .config import settings
 from .models import ArchetypeType
+from .archetype_info import build_fallback_strategy
+from .content import content_store
+from .prompt_builder import StrategyPromptBuilder, estimate_tokens
+from .io_replay import llm_io
 import logging
 
 # Placeholder for actual API client
@@ -15,12 +22,92 @@ class AIService:
         # Initialize OpenRouter Client
         # OpenRouter uses the OpenAI SDK but with a custom base_url
         self.client = AsyncOpenAI(
-            api_key=settings.OPENROUTER_API_KEY,
-            base_url="https://openrouter.ai/api/v1",
+            # replay/synthetic never reach the API, so they run without a key
+            api_key=settings.OPENROUTER_API_KEY or ("offline" if llm_io.offline else ""),
+            base_url=settings.OPENROUTER_BASE_URL,
             timeout=30.0,
             max_retries=1
         )
         self.model = settings.OPENROUTER_MODEL
+        # One prompt builder (and profile cache) per archetype_info.json version
+        self._prompts: Dict[str, StrategyPromptBuilder] = {}
+        # Token accounting: one record per LLM call (recent ones) + running totals
+        self.calls = deque(maxlen=1000)
+        self.totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        # Single-flight: identical requests in flight share one API call (key -> task)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.single_flight = {"requests": 0, "coalesced": 0}
+
+    @property
+    def prompts(self) -> StrategyPromptBuilder:
+        return self.prompts_for()
+
+    def prompts_for(self, info_version: Optional[str] = None) -> StrategyPromptBuilder:
+        kb = content_store.knowledge_base(info_version)
+        builder = self._prompts.get(kb.version)
+        if builder is None:
+            if len(self._prompts) >= settings.CONTENT_KEEP_VERSIONS:
+                self._prompts.pop(next(iter(self._prompts)))
+            builder = self._prompts[kb.version] = StrategyPromptBuilder(kb.info, settings.STRATEGY_PROMPT_TOKEN_BUDGET)
+        return builder
+
+    def coalescing_ratio(self) -> float:
+        return self.single_flight["coalesced"] / max(1, self.single_flight["requests"])
+
+    def _request_key(self, messages: List[Dict[str, str]], kwargs: Dict) -> str:
+        canonical = json.dumps({"model": self.model, "messages": messages, "options": kwargs}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def _complete(self, kind: str, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        Chat completion with single-flight: concurrent identical requests (same model,
+        messages and options) wait on one API call and all get its result or its exception.
+        """
+        key = self._request_key(messages, kwargs)
+        self.single_flight["requests"] += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(kind, messages, key, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._flight_done(key, t))
+        else:
+            self.single_flight["coalesced"] += 1
+            logging.info(f"LLM {kind}: joined an identical in-flight request")
+        # shield: a waiter that times out or is cancelled leaves the shared call running for the others
+        return await asyncio.shield(task)
+
+    def _flight_done(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every waiter gave up
+
+    async def _request(self, kind: str, messages: List[Dict[str, str]], key: str, **kwargs) -> str:
+        """One chat completion; records latency and prompt/completion tokens (API usage, else local estimate)."""
+        started = time.perf_counter()
+        # LLM_IO_MODE: real call, or recorded / replayed / synthetic (core/io_replay.py)
+        response = await llm_io.create(
+            kind, key, self.model, messages, kwargs,
+            lambda: self.client.chat.completions.create(model=self.model, messages=messages, **kwargs),
+        )
+        content = response.choices[0].message.content
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        record = {
+            "kind": kind,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "prompt_tokens": usage.prompt_tokens if usage else sum(estimate_tokens(m["content"]) for m in messages),
+            "completion_tokens": usage.completion_tokens if usage else estimate_tokens(content or ""),
+            "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+            "estimated": usage is None,
+        }
+        self.calls.append(record)
+        self.totals["calls"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            self.totals[field] += record[field]
+        logging.info(f"LLM {kind}: prompt={record['prompt_tokens']} completion={record['completion_tokens']} "
+                     f"cached={record['cached_tokens']} {record['latency_ms']}ms")
+        return content
 
     async def analyze_open_text(self, text: str, context: str) -> Optional[Dict[str, any]]:
         """
@@ -30,113 +117,57 @@ class AIService:
         prompt_text = f"Context: {context}\nUser Answer: {text}\nTask: Identify Jungian Archetype."
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            content = await self._complete(
+                "open_text",
+                [
                     {"role": "system", "content": "You are an expert Jungian Analyst. return valid JSON only: { 'archetype': 'Hero', 'confidence': 0.9 } "},
                     {"role": "user", "content": prompt_text}
                 ],
                 response_format={"type": "json_object"}
             )
-            content = response.choices[0].message.content
             return json.loads(content)
         except Exception as e:
-            print(f"AI Error: {e}")
+            logging.error(f"AI Error: {e}")
             return None
 
     async def synthesize_meta_archetype(self, primary_archetypes: List[str]) -> Dict[str, str]:
         """
         Generates a unique title and description for a combination of archetypes.
         """
-        arch_str = ", ".join(primary_archetypes)
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a poetic archetype synthesizer. Return JSON: { 'title': '...', 'description': '...' }"},
-                    {"role": "user", "content": f"Dominant Archetypes: {', '.join(primary_archetypes)}. Synthesize a Meta-Archetype title and description."}
-                ],
-                response_format={"type": "json_object"}
-            )
-            return json.loads(response.choices[0].message.content)
+            return await self.request_meta_archetype(primary_archetypes)
         except Exception as e:
-            print(f"AI Synthesis Error: {e}")
+            logging.error(f"AI Synthesis Error: {e}")
             return {"title": "The Unified Soul", "description": "Complex integration."}
 
-    async def generate_report_strategy(self, scores: Dict[str, int]) -> str:
+    async def request_meta_archetype(self, primary_archetypes: List[str]) -> Dict[str, str]:
+        """LLM meta-archetype only; raises on failure (no fallback)."""
+        content = await self._complete(
+            "meta",
+            [
+                {"role": "system", "content": "You are a poetic archetype synthesizer. Return JSON: { 'title': '...', 'description': '...' }"},
+                {"role": "user", "content": f"Dominant Archetypes: {', '.join(primary_archetypes)}. Synthesize a Meta-Archetype title and description."}
+            ],
+            response_format={"type": "json_object"}
+        )
+        return json.loads(content)
+
+    async def generate_report_strategy(self, scores: Dict[str, int], info_version: Optional[str] = None) -> str:
         """
         Generates the full markdown content for the strategy section of the report.
+        Falls back to the local knowledge base when the LLM is unavailable.
+        `info_version`: the archetype_info.json version the test started with.
         """
-        # Load archetype descriptions for context
-        import os
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        info_path = os.path.join(base_dir, "data", "archetype_info.json")
-        descriptions = {}
-        try:
-            with open(info_path, "r", encoding="utf-8") as f:
-                descriptions = json.load(f)
-        except Exception as e:
-            print(f"Error loading descriptions: {e}")
-
-        # Construct context
-        context_str = "\n".join([f"{k}: {v.get('title')} - {v.get('core_desire')}" for k, v in descriptions.items()])
-
-        prompt = (
-            f"Archetype Scores: {scores}. \n"
-            f"Archetype Context:\n{context_str}\n\n"
-            "Завдання: Створіть професійну маркетингову та брендингову стратегію для клієнта на основі його балів архетипів. "
-            "Зверніть увагу на комбінацію домінантних архетипів (тих, що мають найвищі бали).\n\n"
-            "Звіт ПОВИНЕН містити:\n"
-            "1. **Глибинний аналіз комбінації**: Як ваші архетипи взаємодіють між собою? Яку унікальну 'суперсилу' вони дають?\n"
-            "2. **Ваш Тіньовий аспект**: Чого варто остерігатися (слабкі місця).\n"
-            "3. **Маркетингова стратегія (Plan)**: Конкретні кроки з позиціонування, вибору голосу бренду (Tone of Voice) та візуального стилю.\n"
-            "4. **Рекомендації для росту**: Як масштабувати свій вплив, використовуючи ці архетипи.\n\n"
-            "Мова: Українська. Форматування: Markdown (заголовки ##, списки)."
-        )
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ви — експерт з брендингу, психології архетипів та стратегічного маркетингу. Створюйте контент, який виглядає як дорогий консалтинговий звіт."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
+            return await self.request_report_strategy(scores, info_version)
         except Exception as e:
             logging.error(f"AI Strategy Error (Check API Key): {e}")
-            # ENHANCED Fallback from local DB
-            top_archs = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:3]
-            
-            fallback = "## Ваш стратегічний аналіз (PRO версія)\n\n"
-            fallback += "Цей розділ побудовано на основі вашої унікальної архітектури особистості. "
-            fallback += "Навіть без прямого підключення до ШІ, ми підготували глибокий аналіз за вашими домінантними векторами.\n\n"
-
-            # 1. Combination Analysis
-            fallback += "### 1. Глибинний аналіз комбінації\n"
-            primary_info = [descriptions.get(k, {}) for k, v in top_archs[:2]]
-            titles = [i.get('title', '') for i in primary_info if i]
-            fallback += f"Ви поєднуєте в собі енергії **{', '.join(titles)}**. Це створює унікальний баланс між вашими цілями та методами їх досягнення.\n\n"
-
-            # 2. Detailed Breakdown per Archetype
-            fallback += "### 2. Позиціонування та Тональність\n"
-            for arch_key, score in top_archs:
-                info = descriptions.get(arch_key, {})
-                if not info: continue
-                fallback += f"#### {info.get('title')} ({score} балів)\n"
-                fallback += f"- **Тіньовий аспект:** {info.get('shadow')}\n"
-                fallback += f"- **Голос бренду (Tone of Voice):** {info.get('tone')}\n"
-                fallback += f"- **Ключовий словник:** {', '.join(info.get('vocabulary', []))}\n"
-                fallback += f"- **Візуальні коди:** {info.get('visuals')}\n\n"
-
-            # 3. Actionable advice
-            fallback += "### 3. Рекомендації для росту\n"
-            fallback += "- **Позиціонування:** Використовуйте свій словник бренду в усіх комунікаціях.\n"
-            fallback += "- **Автентичність:** Не ігноруйте тіньовий аспект — усвідомлення слабкості робить бренд людянішим.\n"
-            fallback += "- **Візуал:** Орієнтуйтеся на візуальні коди ваших топ-архетипів для створення впізнаваного стилю.\n\n"
-            
-            fallback += "> [!NOTE]\n"
-            fallback += "> Це автоматичне резюме, згенероване на основі бази знань."
-            
-            return fallback
+            return build_fallback_strategy(scores, self.prompts_for(info_version).descriptions)
+
+    async def request_report_strategy(self, scores: Dict[str, int], info_version: Optional[str] = None) -> str:
+        """LLM strategy text only; raises on failure (no fallback)."""
+        prompt = self.prompts_for(info_version).build(scores)
+        return await self._complete("strategy", prompt.messages)
+
 
 ai_service = AIService()
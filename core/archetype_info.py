@@ -0,0 +1,58 @@
+"""
+Local archetype knowledge base (data/archetype_info.json) and the report
+strategy text built from it when no LLM answer is available.
+Kept free of API clients so offline tools can import it.
+"""
+import json
+import logging
+import os
+from typing import Dict
+
+
+def load_archetype_info() -> Dict[str, dict]:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    info_path = os.path.join(base_dir, "data", "archetype_info.json")
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"Error loading descriptions: {e}")
+        return {}
+
+
+def build_fallback_strategy(scores: Dict[str, int], descriptions: Dict[str, dict]) -> str:
+    """Strategy markdown built from data/archetype_info.json alone (no LLM)."""
+    # ENHANCED Fallback from local DB
+    top_archs = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:3]
+    
+    fallback = "## Ваш стратегічний аналіз (PRO версія)\n\n"
+    fallback += "Цей розділ побудовано на основі вашої унікальної архітектури особистості. "
+    fallback += "Навіть без прямого підключення до ШІ, ми підготували глибокий аналіз за вашими домінантними векторами.\n\n"
+
+    # 1. Combination Analysis
+    fallback += "### 1. Глибинний аналіз комбінації\n"
+    primary_info = [descriptions.get(k, {}) for k, v in top_archs[:2]]
+    titles = [i.get('title', '') for i in primary_info if i]
+    fallback += f"Ви поєднуєте в собі енергії **{', '.join(titles)}**. Це створює унікальний баланс між вашими цілями та методами їх досягнення.\n\n"
+
+    # 2. Detailed Breakdown per Archetype
+    fallback += "### 2. Позиціонування та Тональність\n"
+    for arch_key, score in top_archs:
+        info = descriptions.get(arch_key, {})
+        if not info: continue
+        fallback += f"#### {info.get('title')} ({score} балів)\n"
+        fallback += f"- **Тіньовий аспект:** {info.get('shadow')}\n"
+        fallback += f"- **Голос бренду (Tone of Voice):** {info.get('tone')}\n"
+        fallback += f"- **Ключовий словник:** {', '.join(info.get('vocabulary', []))}\n"
+        fallback += f"- **Візуальні коди:** {info.get('visuals')}\n\n"
+
+    # 3. Actionable advice
+    fallback += "### 3. Рекомендації для росту\n"
+    fallback += "- **Позиціонування:** Використовуйте свій словник бренду в усіх комунікаціях.\n"
+    fallback += "- **Автентичність:** Не ігноруйте тіньовий аспект — усвідомлення слабкості робить бренд людянішим.\n"
+    fallback += "- **Візуал:** Орієнтуйтеся на візуальні коди ваших топ-архетипів для створення впізнаваного стилю.\n\n"
+    
+    fallback += "> [!NOTE]\n"
+    fallback += "> Це автоматичне резюме, згенероване на основі бази знань."
+    
+    return fallback
@@ -14,6 +14,7 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str = ""
     OPENROUTER_API_KEY: str = ""
     OPENROUTER_MODEL: str = "google/gemini-2.0-flash-exp:free"
+    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     
     @field_validator("OPENAI_API_KEY", "GEMINI_API_KEY", "OPENROUTER_API_KEY", mode="before")
     @classmethod
@@ -34,12 +35,130 @@ class Settings(BaseSettings):
     SMTP_PORT: int = 587
     SMTP_USER: str = ""
     SMTP_PASSWORD: str = ""
+    # Set to False for a plain local relay (e.g. the load-test SMTP sink on SMTP_PORT)
+    SMTP_USE_TLS: bool = True
+    # Concurrent SMTP transfers; aiosmtplib holds several copies of each message while sending
+    SMTP_MAX_CONCURRENT: int = 2
     
     @field_validator("SMTP_PASSWORD", "SMTP_USER", mode="before")
     @classmethod
     def clean_smtp(cls, v):
         return v.strip() if isinstance(v, str) else v
     
+    # Empty = official Bot API. Point at a local server for load tests.
+    TELEGRAM_API_URL: str = ""
+
+    # Update ingress: "polling" (default) or "webhook"
+    BOT_MODE: str = "polling"
+    WEBHOOK_BASE_URL: str = ""  # Public https URL Telegram should call, e.g. https://bot.example.com
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_MAX_IN_FLIGHT: int = 100
+    # Shutdown wait for handlers and their background tails (adapters/telegram_bot/background.py): must outlast
+    # the results countdown (RESULTS_COUNTDOWN_SECONDS + meta wait) and the report path
+    WEBHOOK_DRAIN_TIMEOUT: float = 180.0
+
+    # Logging: written by a background thread (core/logging_setup.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" or "text"
+    LOG_DEBUG_SAMPLE_RATE: float = 0.01  # share of updates whose DEBUG records are kept
+    LOG_QUEUE_SIZE: int = 10000  # records waiting for the writer thread; overflow is dropped
+
+    # Record / replay / synthetic LLM and SMTP calls for offline perf runs (core/io_replay.py):
+    # "off" (real calls), "record", "replay" or "synthetic"
+    LLM_IO_MODE: str = "off"
+    SMTP_IO_MODE: str = "off"
+    IO_FIXTURES_DIR: str = "./fixtures/io"  # llm.jsonl / smtp.jsonl
+    IO_REPLAY_LATENCY_SCALE: float = 1.0  # recorded latency x this (0 = no delay)
+    IO_REPLAY_MATCH: str = "kind"  # LLM miss: "kind" = a recording of the same kind, "exact" = fail
+    IO_SYNTHETIC_LLM_MS: int = 0
+    IO_SYNTHETIC_SMTP_MS: int = 0
+    IO_SYNTHETIC_STRATEGY_CHARS: int = 6000
+
+    # Event-loop lag monitor (core/loop_monitor.py)
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: int = 50  # heartbeat period
+    LOOP_LAG_THRESHOLD_MS: int = 100  # stalls longer than this are logged with the blocking stack
+    LOOP_LAG_REPORT_SECONDS: int = 300  # lag histogram log line (0 = off)
+    LOOP_SLOW_CALLBACK_MS: int = 0  # >0: asyncio debug mode, logs every slower callback (debugging only)
+
+    # Multi-worker mode: >1 starts an ingress process plus N workers with chat affinity
+    WORKERS: int = 1
+    WORKER_MAX_IN_FLIGHT: int = 100
+    # FSM storage: "memory" or "db" (forced to "db" when WORKERS > 1)
+    FSM_STORAGE: str = "memory"
+
+    # Multi-tenant: JSON list of bots served by this process (adapters/telegram_bot/tenants.py).
+    # Empty = one bot, BOT_TOKEN with the bundled question bank
+    TENANTS_FILE: str = ""
+    TENANT_MAX_IN_FLIGHT: int = 100  # updates of one tenant handled at once (per process)
+    TENANT_MAX_REPORTS: int = 2  # PDFs of one tenant waiting for / in the render thread
+    TENANT_STATS_INTERVAL: int = 300  # seconds between per-tenant stats log lines (0 = off)
+
+    # Content hot reload (core/content.py): questions.json / archetype_info.json changes are picked up
+    # without a restart; running tests keep the version they started with
+    CONTENT_RELOAD_SECONDS: int = 30  # how often the files are checked (0 = only on /reload)
+    CONTENT_KEEP_VERSIONS: int = 8  # versions of each file kept in memory for running tests
+    ADMIN_USER_IDS: str = ""  # Telegram user ids allowed to run /reload, comma-separated
+
+    # Per-user flood limits, "burst/seconds" (burst at once, refilled over seconds); "0" = off.
+    # Over the limit, updates are dropped before any FSM/DB work (adapters/telegram_bot/throttle.py)
+    THROTTLE_ENABLED: bool = True
+    THROTTLE_START: str = "3/60"  # /start: each one creates a DB session
+    THROTTLE_REPORT: str = "5/60"  # /report
+    THROTTLE_TEXT: str = "10/20"  # other messages: open answers, lead form
+    THROTTLE_CALLBACK: str = "30/30"  # button taps (answers keep their own duplicate guard)
+
+    @field_validator("BOT_MODE", "FSM_STORAGE", "RETENTION_MODE", "ADAPTIVE_SCOPE", "LOG_FORMAT",
+                     "LLM_IO_MODE", "SMTP_IO_MODE", "IO_REPLAY_MATCH", mode="before")
+    @classmethod
+    def clean_mode(cls, v):
+        return v.strip().lower() if isinstance(v, str) else v
+
+    # Rendered report artifacts (charts, PDFs) + Telegram file_ids
+    ARTIFACT_DIR: str = "./artifacts"
+    ARTIFACT_MAX_MB: int = 500
+    # Reports above this size are spooled to disk and memory-mapped while being delivered
+    REPORT_SPOOL_MB: int = 4
+
+    # PDF: render the dominant-archetypes section once per cluster and splice it into each
+    # report (pypdf). Off by default: with the current content the merge costs more than the
+    # skipped layout saves, +9% per report warm (tools/bench_pdf_assembly.py, README)
+    PDF_FRAGMENT_CACHE: bool = False
+
+    # Retention: abandoned sessions, stale FSM rows, SQLite compaction
+    RETENTION_ENABLED: bool = True
+    RETENTION_INTERVAL_MINUTES: int = 60
+    RETENTION_ABANDONED_HOURS: int = 72
+    RETENTION_COMPLETED_DAYS: int = 0  # 0 = keep completed sessions forever
+    RETENTION_FSM_DAYS: int = 7
+    RETENTION_MODE: str = "delete"  # "delete" or "archive" (JSONL in RETENTION_ARCHIVE_DIR, then delete)
+    RETENTION_ARCHIVE_DIR: str = "./archive"
+    RETENTION_BATCH_SIZE: int = 200
+    RETENTION_BATCH_PAUSE: float = 0.05
+    RETENTION_VACUUM_PAGES: int = 1000
+
+    # Columnar analytics export (python -m analytics)
+    ANALYTICS_DIR: str = "./analytics_data"
+
+    # "Analysis" countdown shown before results (seconds)
+    RESULTS_COUNTDOWN_SECONDS: int = 120
+    RESULTS_COUNTDOWN_STEP: int = 5
+
+    # Strategy prompt: cluster context is trimmed until the prompt fits (local token estimate)
+    STRATEGY_PROMPT_TOKEN_BUDGET: int = 600
+
+    # Population norms (percentiles next to raw scores)
+    NORMS_MIN_SAMPLES: int = 30  # completed tests needed before percentiles are shown
+    NORMS_REFRESH_SECONDS: int = 300  # how often each process re-reads the shared histograms
+
+    # Adaptive test: stop once the remaining questions can no longer change the result
+    ADAPTIVE_MODE: bool = False
+    ADAPTIVE_MIN_QUESTIONS: int = 12
+    ADAPTIVE_SCOPE: str = "clusters"  # "clusters" (primary + secondary fixed) or "primary"
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,249 @@
+"""
+Versioned content: the question banks (questions.json, one per tenant data_dir)
+and the archetype knowledge base (data/archetype_info.json), reloadable
+without a restart.
+
+A version id is the sha256 prefix of the file. Each test session records the
+versions it started with (FSM data + sessions row), and every later step
+looks its content up by those ids. A reload therefore never changes the
+questions, scoring or report text of a test already under way.
+
+`content_store.reload()` (run by the watcher every CONTENT_RELOAD_SECONDS and
+by the admin /reload command) re-reads the files whose mtime/size changed.
+Reading, validation and the engine build happen in a thread; only the final
+swap runs on the event loop, so updates are never blocked on it. A file that
+fails validation is logged and ignored; the current version keeps serving.
+
+The last CONTENT_KEEP_VERSIONS versions of each file stay in memory. Every
+version is also written once to ARTIFACT_DIR/content/, so a session from an
+older version (FSM_STORAGE=db across a restart, or another worker that
+reloaded later) can still be served. A version that cannot be found at all
+falls back to the current one, with a warning.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .config import settings
+from .engine import ArchetypeEngine
+from .models import ArchetypeType, Question
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INFO_PATH = os.path.join(BASE_DIR, "data", "archetype_info.json")
+# Keyboard rows and answers.selected_option_id (String(1)) expect single-letter option ids
+OPTION_IDS = set("ABCDEF")
+
+
+class ContentError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    version: str
+    info: Dict[str, dict]
+
+
+def content_version(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def parse_questions(raw: bytes) -> List[Question]:
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise ContentError(f"not valid JSON: {e}")
+    if not isinstance(data, list) or not data:
+        raise ContentError("expected a non-empty list of questions")
+    questions = []
+    for i, item in enumerate(data, 1):
+        try:
+            q = Question(**item)
+        except (TypeError, ValidationError) as e:
+            raise ContentError(f"question #{i}: {e}")
+        option_ids = [o.id for o in q.options]
+        if len(set(option_ids)) != len(option_ids) or not set(option_ids) <= OPTION_IDS:
+            raise ContentError(f"question {q.id}: option ids must be distinct letters A-F, got {option_ids}")
+        if not any(o.archetype for o in q.options):
+            raise ContentError(f"question {q.id}: no option scores an archetype")
+        questions.append(q)
+    ids = [q.id for q in questions]
+    if len(set(ids)) != len(ids):
+        raise ContentError("duplicate question ids")
+    return questions
+
+
+def parse_info(raw: bytes) -> Dict[str, dict]:
+    try:
+        info = json.loads(raw)
+    except ValueError as e:
+        raise ContentError(f"not valid JSON: {e}")
+    if not isinstance(info, dict):
+        raise ContentError("expected an object keyed by archetype")
+    missing = [a.value for a in ArchetypeType if not isinstance(info.get(a.value), dict) or not info[a.value].get("title")]
+    if missing:
+        raise ContentError(f"archetypes missing or without a title: {', '.join(missing)}")
+    return info
+
+
+class ContentStore:
+    def __init__(self, info_path: str = INFO_PATH):
+        self.info_path = info_path
+        # file path -> version -> ArchetypeEngine / KnowledgeBase (oldest first), and the current version
+        self._versions: Dict[str, "OrderedDict[str, object]"] = {}
+        self._current: Dict[str, str] = {}
+        self._stamps: Dict[str, Tuple[int, int]] = {}
+        self._missing = set()  # pinned versions neither in memory nor in a snapshot
+        self._mutate = threading.Lock()  # the report thread may load a pinned version too
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self.stats = {"reloads": 0, "swapped": 0, "rejected": 0, "restored": 0, "missing": 0}
+
+    # --- lookups (hot path: dict reads only) ---
+
+    def engine(self, path: str, version: Optional[str] = None) -> ArchetypeEngine:
+        """The question bank at `path`: version `version` if given, else the current one."""
+        return self._get(path, version, "questions")
+
+    def knowledge_base(self, version: Optional[str] = None) -> KnowledgeBase:
+        return self._get(self.info_path, version, "archetype_info")
+
+    def current_version(self, path: str) -> str:
+        return self._current.get(path, "")
+
+    def _get(self, path: str, version: Optional[str], kind: str):
+        versions = self._versions.get(path)
+        if versions is None:
+            self._install(path, *self._read(path, kind))  # first use: invalid content is fatal here
+            versions = self._versions[path]
+        if version:
+            found = versions.get(version)
+            if found is not None:
+                return found
+            if version not in self._missing:
+                found = self._restore(path, version, kind)
+                if found is not None:
+                    return found
+                self._missing.add(version)
+                self.stats["missing"] += 1
+                logging.warning(f"{os.path.basename(path)} version {version} not found, using the current one")
+        return versions[self._current[path]]
+
+    # --- loading ---
+
+    def _build(self, raw: bytes, kind: str):
+        version = content_version(raw)
+        if kind == "questions":
+            return version, ArchetypeEngine(questions=parse_questions(raw), version=version)
+        return version, KnowledgeBase(version, parse_info(raw))
+
+    def _read(self, path: str, kind: str) -> Tuple[str, object, Tuple[int, int]]:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+        version, content = self._build(raw, kind)
+        self._snapshot(kind, version, raw)
+        return version, content, (st.st_mtime_ns, st.st_size)
+
+    def _install(self, path: str, version: str, content, stamp: Optional[Tuple[int, int]]):
+        """Adds a version; with a file `stamp` it also becomes the current one (the swap)."""
+        with self._mutate:
+            versions = self._versions.setdefault(path, OrderedDict())
+            versions[version] = content
+            versions.move_to_end(version)
+            if stamp is not None:
+                self._current[path] = version
+                self._stamps[path] = stamp
+            while len(versions) > max(1, settings.CONTENT_KEEP_VERSIONS):
+                oldest = next(iter(versions))
+                if oldest == self._current.get(path):
+                    versions.move_to_end(oldest)
+                else:
+                    del versions[oldest]
+
+    def _snapshot_path(self, kind: str, version: str) -> str:
+        return os.path.join(settings.ARTIFACT_DIR, "content", f"{kind}-{version}.json")
+
+    def _snapshot(self, kind: str, version: str, raw: bytes):
+        path = self._snapshot_path(kind, version)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"Content snapshot {path} not written: {e}")
+
+    def _restore(self, path: str, version: str, kind: str):
+        try:
+            with open(self._snapshot_path(kind, version), "rb") as f:
+                raw = f.read()
+            _, content = self._build(raw, kind)
+        except (OSError, ContentError):
+            return None
+        self._install(path, version, content, None)  # kept for the session, not made current
+        self.stats["restored"] += 1
+        return content
+
+    # --- reload ---
+
+    async def reload(self, force: bool = False) -> List[str]:
+        """Re-reads changed files (all loaded ones with `force`). Returns one line per file that changed."""
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            self.stats["reloads"] += 1
+            changes = []
+            for path, kind in [(p, "questions") for p in self._versions if p != self.info_path] + [(self.info_path, "archetype_info")]:
+                line = await self._reload_file(path, kind, force)
+                if line:
+                    changes.append(line)
+            return changes
+
+    async def _reload_file(self, path: str, kind: str, force: bool) -> Optional[str]:
+        name = os.path.relpath(path, BASE_DIR) if path.startswith(BASE_DIR + os.sep) else path
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return f"{name}: {e}"
+        stamp = (st.st_mtime_ns, st.st_size)
+        if not force and stamp == self._stamps.get(path):
+            return None
+        previous = self.current_version(path)
+        try:
+            version, content, stamp = await asyncio.to_thread(self._read, path, kind)
+        except (OSError, ContentError) as e:
+            self._stamps[path] = stamp  # reported once; checked again when the file changes
+            self.stats["rejected"] += 1
+            logging.error("content rejected, keeping the current version",
+                          extra={"file": name, "version": previous, "error": str(e)})
+            return f"{name}: rejected ({e}), still {previous}"
+        if version == previous:
+            self._stamps[path] = stamp
+            return None
+        self._install(path, version, content, stamp)
+        self.stats["swapped"] += 1
+        logging.info("content reloaded", extra={"file": name, "version": version, "previous": previous})
+        size = f", {len(content.questions)} questions" if kind == "questions" else ""
+        return f"{name}: {previous} -> {version}{size}"
+
+    async def watch_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logging.error(f"Content reload failed: {e}")
+
+
+content_store = ContentStore()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -20,13 +20,23 @@ class Session(Base):
     __tablename__ = "sessions"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     started_at = Column(DateTime, default=datetime.utcnow)
     is_completed = Column(Boolean, default=False)
+    completed_at = Column(DateTime, nullable=True)
+    tenant = Column(String, nullable=True)  # bot that ran the test (multi-tenant mode); NULL = default
+    # Content versions the test ran with (core/content.py); NULL for sessions from before versioning
+    questions_version = Column(String, nullable=True)
+    info_version = Column(String, nullable=True)
     
     user = relationship("User", back_populates="sessions")
     answers = relationship("Answer", back_populates="session")
 
+    # Retention job scans abandoned (not completed, old) sessions
+    __table_args__ = (
+        Index("ix_sessions_completed_started", "is_completed", "started_at"),
+    )
+
 class Answer(Base):
     __tablename__ = "answers"
     
@@ -37,3 +47,26 @@ class Answer(Base):
     open_text_input = Column(Text, nullable=True)
     
     session = relationship("Session", back_populates="answers")
+
+    # One answer per question per session; also serves lookups by session_id alone
+    # (existing databases get it via adapters/migrations.py)
+    __table_args__ = (
+        Index("uq_answers_session_question", "session_id", "question_id", unique=True),
+    )
+
+class FSMRecord(Base):
+    """Shared FSM state (multi-worker mode), one row per aiogram StorageKey."""
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True) # JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NormBin(Base):
+    """Population norms: how many completed tests scored `score` on `archetype` (see adapters/norms.py)."""
+    __tablename__ = "norm_bins"
+
+    archetype = Column(String, primary_key=True)
+    score = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
@@ -1,73 +1,130 @@
 import aiosmtplib
+import asyncio
+import base64
+from email import policy
 from email.message import EmailMessage
 import io
+from typing import Union
 from .config import settings
+from .io_replay import smtp_io
 import logging
 
-async def send_report_email(to_email: str, user_name: str, user_phone: str, pdf_buf: io.BytesIO, filename: str = "Archetype_Strategy.pdf"):
+# Stands in for the attachment body while the headers are generated, then gets replaced
+_PLACEHOLDER = b"archetype-pdf-attachment"
+_PLACEHOLDER_LINE = base64.b64encode(_PLACEHOLDER) + b"\r\n"
+
+# aiosmtplib rebuilds the message several times while sending DATA (line endings,
+# dot-stuffing), so concurrent transfers, not attachments, dominate peak memory
+_smtp_slots = asyncio.Semaphore(max(1, settings.SMTP_MAX_CONCURRENT))
+
+
+class PDFAttachment:
     """
-    Sends the PDF report to the specified email.
+    A PDF base64-encoded once, then spliced into every message that carries it
+    (user + admin copy) instead of each EmailMessage encoding its own copy.
     """
-    if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
-        logging.warning("SMTP settings missing, skipping email send.")
-        return False
 
+    def __init__(self, pdf: Union[bytes, memoryview, io.BytesIO], filename: str):
+        self.filename = filename
+        view = pdf.getbuffer() if isinstance(pdf, io.BytesIO) else memoryview(pdf)
+        self.encoded = self._encode(view)
+
+    @staticmethod
+    def _encode(view: memoryview) -> bytearray:
+        # 76-char CRLF lines (57 input bytes each), written into one preallocated buffer
+        n = view.nbytes
+        out = bytearray(4 * -(-n // 3) + 2 * -(-n // 57))
+        pos = 0
+        step = 57 * 1024
+        for start in range(0, n, step):
+            lines = base64.encodebytes(view[start:start + step]).replace(b"\n", b"\r\n")
+            out[pos:pos + len(lines)] = lines
+            pos += len(lines)
+        return out
+
+
+def build_message(to_email: str, subject: str, body: str, attachment: PDFAttachment) -> bytes:
+    """Flattened message, ready for SMTP; built once even if several ports are tried."""
     message = EmailMessage()
     message["From"] = settings.SMTP_USER
     message["To"] = to_email
-    message["Subject"] = f"Ваша стратегія Архетипів - {user_name}"
-    message.set_content(f"Вітаємо, {user_name}!\n\nДякуємо за проходження тесту. Ваш персональний звіт у форматі PDF додано до цього листа.\n\nЗ повагою,\nКоманда Твій Архетип")
+    message["Subject"] = subject
+    message.set_content(body)
+    message.add_attachment(_PLACEHOLDER, maintype="application", subtype="pdf", filename=attachment.filename)
+    head, tail = message.as_bytes(policy=policy.SMTP).split(_PLACEHOLDER_LINE, 1)
+    return b"".join((head, attachment.encoded, tail))
+
+
+async def send_report_email(to_email: str, user_name: str, user_phone: str, pdf: Union[bytes, memoryview, io.BytesIO, PDFAttachment], filename: str = "Archetype_Strategy.pdf", notify_admin: bool = True):
+    """
+    Sends the PDF report to the specified email.
+    `notify_admin=False` skips the new-lead copy (e.g. bulk re-sends).
+    """
+    if (not settings.SMTP_USER or not settings.SMTP_PASSWORD) and not smtp_io.offline:
+        logging.warning("SMTP settings missing, skipping email send.")
+        return False
 
     # Attachment
-    pdf_buf.seek(0)
-    message.add_attachment(
-        pdf_buf.read(),
-        maintype="application",
-        subtype="pdf",
-        filename=filename
+    attachment = pdf if isinstance(pdf, PDFAttachment) else PDFAttachment(pdf, filename)
+    message = build_message(
+        to_email,
+        f"Ваша стратегія Архетипів - {user_name}",
+        f"Вітаємо, {user_name}!\n\nДякуємо за проходження тесту. Ваш персональний звіт у форматі PDF додано до цього листа.\n\nЗ повагою,\nКоманда Твій Архетип",
+        attachment,
     )
 
     async def try_send(port, use_tls, start_tls, timeout):
         try:
-            await aiosmtplib.send(
-                message,
-                hostname=settings.SMTP_HOST,
-                port=port,
-                username=settings.SMTP_USER,
-                password=settings.SMTP_PASSWORD,
-                use_tls=use_tls,
-                start_tls=start_tls,
-                timeout=timeout
-            )
+            async with _smtp_slots:
+                await smtp_io.send(
+                    message,
+                    aiosmtplib.send,
+                    sender=settings.SMTP_USER,
+                    recipients=[to_email],
+                    hostname=settings.SMTP_HOST,
+                    port=port,
+                    username=settings.SMTP_USER,
+                    password=settings.SMTP_PASSWORD,
+                    use_tls=use_tls,
+                    start_tls=start_tls,
+                    timeout=timeout
+                )
             return True
         except Exception as e:
             logging.warning(f"SMTP failed on port {port}: {e}")
             return False
 
     try:
-        # Step 1: Try Port 465 (SSL) - often preferred by Gmail
-        success = await try_send(465, True, False, 15.0)
-        
-        # Step 2: Try Port 587 (STARTTLS) - fallback
-        if not success:
-            logging.info("Attempting fallback to port 587...")
-            success = await try_send(587, False, True, 15.0)
-            
+        if not settings.SMTP_USE_TLS:
+            # Plain local relay, single attempt on the configured port
+            success = await try_send(settings.SMTP_PORT, False, False, 15.0)
+        else:
+            # Step 1: Try Port 465 (SSL) - often preferred by Gmail
+            success = await try_send(465, True, False, 15.0)
+
+            # Step 2: Try Port 587 (STARTTLS) - fallback
+            if not success:
+                logging.info("Attempting fallback to port 587...")
+                success = await try_send(587, False, True, 15.0)
+
         if success:
             logging.info(f"Email successfully sent to {to_email}")
+            message = None  # only one flattened message alive at a time
             # Admin notification (simplified port logic here for brevity or repeat)
-            if settings.ADMIN_EMAIL and settings.ADMIN_EMAIL != to_email:
-                 admin_msg = EmailMessage()
-                 admin_msg["From"] = settings.SMTP_USER
-                 admin_msg["To"] = settings.ADMIN_EMAIL
-                 admin_msg["Subject"] = f"Новий Ліда: {user_name} ({user_phone})"
-                 admin_msg.set_content(f"Користувач завершив тест!\n\nІм'я: {user_name}\nEmail: {to_email}\nТелефон: {user_phone}\n\nЗвіт додано до листа.")
-                 admin_msg.add_attachment(message.get_payload()[1].get_content(), maintype="application", subtype="pdf", filename=filename)
+            if notify_admin and settings.ADMIN_EMAIL and settings.ADMIN_EMAIL != to_email:
+                 admin_msg = build_message(
+                     settings.ADMIN_EMAIL,
+                     f"Новий Ліда: {user_name} ({user_phone})",
+                     f"Користувач завершив тест!\n\nІм'я: {user_name}\nEmail: {to_email}\nТелефон: {user_phone}\n\nЗвіт додано до листа.",
+                     attachment,
+                 )
                  # Direct try on 587 for admin if it's the one that worked or just simpler
-                 await aiosmtplib.send(admin_msg, hostname=settings.SMTP_HOST, port=587, username=settings.SMTP_USER, password=settings.SMTP_PASSWORD, use_tls=False, start_tls=True, timeout=10)
+                 admin_port = 587 if settings.SMTP_USE_TLS else settings.SMTP_PORT
+                 async with _smtp_slots:
+                     await smtp_io.send(admin_msg, aiosmtplib.send, sender=settings.SMTP_USER, recipients=[settings.ADMIN_EMAIL], hostname=settings.SMTP_HOST, port=admin_port, username=settings.SMTP_USER, password=settings.SMTP_PASSWORD, use_tls=False, start_tls=settings.SMTP_USE_TLS, timeout=10)
         else:
             raise Exception("All SMTP ports (465, 587) timed out or failed.")
-            
+
 
         logging.info(f"Report sent to {to_email}")
         return True
@@ -1,6 +1,7 @@
 import json
+import logging
 import os
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
 from .models import UserSession, ScoringResult, ArchetypeType, Question, QuestionOption
 
@@ -10,20 +11,33 @@ SECONDARY_SCORE_THRESHOLD_END = 5
 SECONDARY_PERCENTAGE_DIFF = 0.10
 
 class ArchetypeEngine:
-    def __init__(self, questions_path: str = "data/questions.json"):
+    def __init__(self, questions_path: str = "data/questions.json", questions: Optional[List[Question]] = None, version: str = ""):
         self.questions: Dict[int, Question] = {}
-        self.load_questions(questions_path)
+        # Content version of the bank (core/content.py); empty when loaded from a path directly
+        self.version = version
+        if questions is None:
+            self.load_questions(questions_path)
+        else:
+            self.questions = {q.id: q for q in questions}
+        # Best points each question can still give to each archetype (adaptive mode)
+        self.max_points: Dict[int, Dict[ArchetypeType, int]] = {}
+        for q in self.questions.values():
+            best: Dict[ArchetypeType, int] = {}
+            for opt in q.options:
+                if opt.archetype:
+                    best[opt.archetype] = max(best.get(opt.archetype, 0), opt.points)
+            self.max_points[q.id] = best
 
     def load_questions(self, path: str):
-        # Determine strict absolute path relative to this file
+        # Relative paths are resolved against the project root, not the working directory
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        target_path = os.path.join(base_dir, "data", "questions.json")
+        target_path = os.path.join(base_dir, path)
         
         if not os.path.exists(target_path):
-            print(f"CRITICAL ERROR: Questions file not found at {target_path}")
+            logging.critical(f"Questions file not found at {target_path}")
             # Try plain relative just in case
-            if os.path.exists("data/questions.json"):
-                target_path = "data/questions.json"
+            if os.path.exists(path):
+                target_path = path
         
         try:
             with open(target_path, "r", encoding="utf-8") as f:
@@ -31,9 +45,9 @@ class ArchetypeEngine:
                 for q_data in data:
                     q = Question(**q_data)
                     self.questions[q.id] = q
-            print(f"Loaded {len(self.questions)} questions from {target_path}.")
+            logging.info(f"Loaded {len(self.questions)} questions from {target_path}.")
         except Exception as e:
-            print(f"Error loading questions from {target_path}: {e}")
+            logging.error(f"Error loading questions from {target_path}: {e}")
 
     def calculate_scores(self, session: UserSession) -> ScoringResult:
         scores: Dict[ArchetypeType, int] = defaultdict(int)
@@ -50,7 +64,8 @@ class ArchetypeEngine:
                     
         return self.process_results(scores)
 
-    def process_results(self, raw_scores: Dict[ArchetypeType, int]) -> ScoringResult:
+    @staticmethod
+    def process_results(raw_scores: Dict[ArchetypeType, int]) -> ScoringResult:
         if not raw_scores:
              return ScoringResult(archetype_scores={}, primary_cluster=[], secondary_cluster=[])
         
@@ -92,6 +107,94 @@ class ArchetypeEngine:
             meta_archetype_title=None
         )
 
+    # --- Adaptive mode ---
+
+    def option_score(self, question_id: int, option_id: str) -> Tuple[Optional[ArchetypeType], int]:
+        question = self.questions.get(question_id)
+        opt = next((o for o in question.options if o.id == option_id), None) if question else None
+        if opt and opt.archetype:
+            return opt.archetype, opt.points
+        return None, 0
+
+    def remaining_max(self, remaining_ids: List[int]) -> Dict[ArchetypeType, int]:
+        """Upper bound on the points each archetype can still gain."""
+        gain = {arch: 0 for arch in ArchetypeType}
+        for q_id in remaining_ids:
+            for arch, pts in self.max_points.get(q_id, {}).items():
+                gain[arch] += pts
+        return gain
+
+    def is_settled(self, scores: Dict[ArchetypeType, int], remaining_ids: List[int], include_secondary: bool = True) -> bool:
+        """
+        True when no way of answering `remaining_ids` can change the primary
+        cluster and (with `include_secondary`) the secondary cluster, as sets. Every archetype's final score lies in
+        [current, current + remaining max]; the check is done on those
+        intervals, which ignores that one question feeds only one archetype,
+        so it may stop late but never early.
+        """
+        if not remaining_ids:
+            return True
+        gain = self.remaining_max(remaining_ids)
+        low = {arch: scores.get(arch, 0) for arch in ArchetypeType}
+        high = {arch: low[arch] + gain[arch] for arch in ArchetypeType}
+        if not any(low.values()):
+            return False
+
+        # Bounds on the 1st/2nd/3rd highest final scores, whichever archetypes they belong to
+        lows = sorted(low.values(), reverse=True)
+        highs = sorted(high.values(), reverse=True)
+
+        def within_10pct(i: int) -> Optional[bool]:
+            # The 10% rule between the i-th and (i+1)-th score, if it comes out the same for every completion
+            l1, h1, l2, h2 = lows[i], highs[i], lows[i + 1], highs[i + 1]
+            if l1 > 0 and (h1 - l2) / h1 <= SECONDARY_PERCENTAGE_DIFF:
+                return True
+            if l1 > 0 and (l1 - h2) / l1 > SECONDARY_PERCENTAGE_DIFF:
+                return False
+            return None
+
+        size = 1
+        for i in range(2):
+            rule = within_10pct(i)
+            if rule is None:
+                return False
+            if not rule:
+                break
+            size += 1
+
+        # Primary = top `size`, secondary = the next 3: both boundaries must be strictly separated
+        ranked = sorted(ArchetypeType, key=lambda a: low[a], reverse=True)
+        for cut in ((size, size + 3) if include_secondary else (size,)):
+            inside, outside = ranked[:cut], ranked[cut:]
+            if outside and min(low[a] for a in inside) <= max(high[b] for b in outside):
+                return False
+        return True
+
+    def pick_next(self, scores: Dict[ArchetypeType, int], remaining_ids: List[int], include_secondary: bool = True) -> int:
+        """
+        The remaining question that can move the contested archetypes the most:
+        those whose score interval still overlaps a cluster boundary.
+        Ties keep the (shuffled) order of `remaining_ids`.
+        """
+        gain = self.remaining_max(remaining_ids)
+        low = {arch: scores.get(arch, 0) for arch in ArchetypeType}
+        ranked = sorted(ArchetypeType, key=lambda a: low[a], reverse=True)
+        contested = set()
+        for cut in range(1, 7 if include_secondary else 4):
+            inside, outside = ranked[:cut], ranked[cut:]
+            floor = min(low[a] for a in inside)
+            for b in outside:
+                if low[b] + gain[b] >= floor:
+                    contested.add(b)
+                    contested.update(a for a in inside if low[a] <= low[b] + gain[b])
+        if not contested:
+            return remaining_ids[0]
+
+        def weight(q_id: int) -> int:
+            return sum(pts for arch, pts in self.max_points.get(q_id, {}).items() if arch in contested)
+
+        return max(remaining_ids, key=weight)
+
     def needs_meta_archetype(self, result: ScoringResult) -> bool:
         # User feedback: > 2 archetypes
         return len(result.primary_cluster) > 2
@@ -0,0 +1,272 @@
+"""
+Record / replay / synthetic mode for the bot's external calls (LLM and SMTP),
+so the finish_test -> process_email path can be measured offline and repeatably.
+
+LLM_IO_MODE and SMTP_IO_MODE (separately):
+- "off": real calls (default)
+- "record": real calls, and each request/response pair is appended to
+  IO_FIXTURES_DIR/llm.jsonl or smtp.jsonl with its latency
+- "replay": no network; answers come from those fixtures after the recorded
+  latency times IO_REPLAY_LATENCY_SCALE (1 = real, 0.5 = twice as fast, 0 = none)
+- "synthetic": no network, no fixtures; generated answers of realistic length
+  (strategy markdown of about IO_SYNTHETIC_STRATEGY_CHARS) after a fixed
+  IO_SYNTHETIC_LLM_MS / IO_SYNTHETIC_SMTP_MS
+
+LLM replay looks a request up by its single-flight key (model, messages,
+options). Test answers vary from run to run, so the scores in the strategy
+prompt rarely repeat exactly. On a miss, IO_REPLAY_MATCH="kind" serves a
+recording of the same kind (strategy, meta, open_text), picked by a hash of
+the key, so each request always gets the same recording. "exact" raises
+ReplayMiss instead, and the caller falls back as it would on an API error.
+Recorded failures are replayed as failures.
+
+SMTP fixtures keep only metadata (recipients count, size, port, latency,
+error), never the message. They are replayed in order per port, so a
+recorded 465 timeout followed by a 587 success replays the same fallback path.
+A port with no recordings (e.g. a relay on another port) replays them all in order.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .config import settings
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+class ReplayedError(Exception):
+    """A failure that was recorded, raised again on replay."""
+
+
+def _append(path: str, record: Dict[str, Any]):
+    # Blocking file I/O: record mode calls it via asyncio.to_thread
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _load(path: str) -> List[Dict[str, Any]]:
+    # Blocking file I/O: replay mode calls it once via asyncio.to_thread
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No recorded fixtures at {path} (run once with the *_IO_MODE=record)")
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _replay_delay(latency_ms: float):
+    scale = settings.IO_REPLAY_LATENCY_SCALE
+    if scale > 0 and latency_ms > 0:
+        await asyncio.sleep(latency_ms * scale / 1000)
+
+
+# --- synthetic content ---
+
+_WORDS = ("бренд стратегія голос аудиторія цінність довіра візуал позиціонування ріст сила тінь "
+          "енергія місія клієнт історія контент партнерство вплив лідерство баланс").split()
+_SECTIONS = ("Глибинний аналіз комбінації", "Ваш Тіньовий аспект",
+             "Маркетингова стратегія (Plan)", "Рекомендації для росту")
+
+
+def synthetic_strategy(seed: str, chars: int) -> str:
+    """Markdown in the shape the strategy prompt asks for: numbered ## sections, bold leads, lists."""
+    rng = random.Random(seed)
+    parts = ["## Ваша персональна стратегія", ""]
+    size = 0
+    section = 0
+    while size < chars:
+        title = _SECTIONS[section % len(_SECTIONS)]
+        block = [f"### {section + 1}. {title}",
+                 f"**{rng.choice(_WORDS).capitalize()}**: " + " ".join(rng.choices(_WORDS, k=rng.randint(40, 70))) + ".",
+                 ""]
+        block += [f"- **{rng.choice(_WORDS).capitalize()}:** {' '.join(rng.choices(_WORDS, k=rng.randint(8, 16)))}"
+                  for _ in range(rng.randint(3, 5))]
+        block.append("")
+        parts += block
+        size += sum(len(line) + 1 for line in block)
+        section += 1
+    return "\n".join(parts)
+
+
+def _synthetic_content(kind: str, key: str) -> str:
+    rng = random.Random(key)
+    if kind == "strategy":
+        return synthetic_strategy(key, settings.IO_SYNTHETIC_STRATEGY_CHARS)
+    if kind == "meta":
+        return json.dumps({
+            "title": " ".join(rng.choices(_WORDS, k=2)).title(),
+            "description": " ".join(rng.choices(_WORDS, k=40)) + ".",
+        }, ensure_ascii=False)
+    # open_text
+    from .models import ArchetypeType
+    return json.dumps({"archetype": rng.choice(list(ArchetypeType)).value,
+                       "confidence": round(rng.uniform(0.5, 0.95), 2)})
+
+
+# --- LLM ---
+
+class LLMIO:
+    def __init__(self):
+        self._by_key: Optional[Dict[str, Dict[str, Any]]] = None
+        self._by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        self._loading = asyncio.Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "replayed_by_kind": 0, "misses": 0, "synthetic": 0}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.IO_FIXTURES_DIR, "llm.jsonl")
+
+    @property
+    def offline(self) -> bool:
+        return settings.LLM_IO_MODE in ("replay", "synthetic")
+
+    async def create(self, kind: str, key: str, model: str, messages: List[Dict[str, str]], options: Dict,
+                     call: Callable[[], Awaitable[Any]]):
+        """Stands in for client.chat.completions.create(); returns a ChatCompletion."""
+        mode = settings.LLM_IO_MODE
+        if mode == "record":
+            return await self._record(kind, key, model, messages, options, call)
+        if mode == "replay":
+            return await self._replay(kind, key)
+        if mode == "synthetic":
+            return await self._synthetic(kind, key, model)
+        return await call()
+
+    async def _record(self, kind, key, model, messages, options, call):
+        started = time.perf_counter()
+        record = {"key": key, "kind": kind, "model": model, "messages": messages, "options": options}
+        try:
+            response = await call()
+        except Exception as e:
+            record.update(latency_ms=round((time.perf_counter() - started) * 1000, 1), error=f"{type(e).__name__}: {e}")
+            await asyncio.to_thread(_append, self.path, record)
+            self.stats["recorded"] += 1
+            raise
+        record.update(latency_ms=round((time.perf_counter() - started) * 1000, 1),
+                      response=response.model_dump(mode="json"))
+        await asyncio.to_thread(_append, self.path, record)
+        self.stats["recorded"] += 1
+        return response
+
+    async def _index(self):
+        async with self._loading:
+            if self._by_key is not None:
+                return
+            records = await asyncio.to_thread(_load, self.path)
+            self._by_key = {}
+            for record in records:
+                self._by_key[record["key"]] = record  # the latest recording of a request wins
+                self._by_kind.setdefault(record["kind"], []).append(record)
+            logging.info(f"LLM replay: {len(self._by_key)} recorded requests from {self.path}")
+
+    async def _replay(self, kind: str, key: str):
+        from openai.types.chat import ChatCompletion
+        await self._index()
+        record = self._by_key.get(key)
+        if record is not None:
+            self.stats["replayed"] += 1
+        else:
+            same_kind = self._by_kind.get(kind)
+            if settings.IO_REPLAY_MATCH != "kind" or not same_kind:
+                self.stats["misses"] += 1
+                raise ReplayMiss(f"No recorded {kind} LLM response for this request")
+            record = same_kind[int(key[:8], 16) % len(same_kind)]
+            self.stats["replayed_by_kind"] += 1
+        await _replay_delay(record["latency_ms"])
+        if "error" in record:
+            raise ReplayedError(record["error"])
+        return ChatCompletion.model_validate(record["response"])
+
+    async def _synthetic(self, kind: str, key: str, model: str):
+        from openai.types.chat import ChatCompletion
+        if settings.IO_SYNTHETIC_LLM_MS > 0:
+            await asyncio.sleep(settings.IO_SYNTHETIC_LLM_MS / 1000)
+        self.stats["synthetic"] += 1
+        # No usage: AIService falls back to its local token estimate
+        return ChatCompletion.model_validate({
+            "id": f"synthetic-{key[:12]}", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": _synthetic_content(kind, key)}}],
+        })
+
+
+# --- SMTP ---
+
+class SMTPIO:
+    def __init__(self):
+        self._by_port: Optional[Dict[int, List[Dict[str, Any]]]] = None
+        self._next: Dict[int, int] = {}
+        self._loading = asyncio.Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "synthetic": 0}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.IO_FIXTURES_DIR, "smtp.jsonl")
+
+    @property
+    def offline(self) -> bool:
+        return settings.SMTP_IO_MODE in ("replay", "synthetic")
+
+    async def send(self, message: bytes, send: Callable[..., Awaitable[Any]], **kwargs):
+        """Stands in for aiosmtplib.send(message, **kwargs)."""
+        mode = settings.SMTP_IO_MODE
+        if mode == "record":
+            return await self._record(message, send, kwargs)
+        if mode == "replay":
+            return await self._replay(kwargs["port"])
+        if mode == "synthetic":
+            if settings.IO_SYNTHETIC_SMTP_MS > 0:
+                await asyncio.sleep(settings.IO_SYNTHETIC_SMTP_MS / 1000)
+            self.stats["synthetic"] += 1
+            return {}, "OK (synthetic)"
+        return await send(message, **kwargs)
+
+    async def _record(self, message: bytes, send, kwargs):
+        record = {"port": kwargs["port"], "recipients": len(kwargs.get("recipients") or ()), "bytes": len(message),
+                  "sha256": hashlib.sha256(message).hexdigest()[:16]}
+        started = time.perf_counter()
+        try:
+            return await send(message, **kwargs)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            await asyncio.to_thread(_append, self.path, record)
+            self.stats["recorded"] += 1
+
+    async def _index(self):
+        async with self._loading:
+            if self._by_port is not None:
+                return
+            records = await asyncio.to_thread(_load, self.path)
+            self._by_port = {}
+            for record in records:
+                self._by_port.setdefault(record["port"], []).append(record)
+                self._by_port.setdefault(None, []).append(record)
+
+    async def _replay(self, port: int):
+        await self._index()
+        if not self._by_port.get(None):
+            raise ReplayMiss(f"No recorded SMTP transfers in {self.path}")
+        if port not in self._by_port:
+            port = None
+        records = self._by_port[port]
+        i = self._next.get(port, 0)
+        self._next[port] = i + 1
+        record = records[i % len(records)]
+        self.stats["replayed"] += 1
+        await _replay_delay(record["latency_ms"])
+        if "error" in record:
+            raise ReplayedError(record["error"])
+        return {}, "OK (replayed)"
+
+
+llm_io = LLMIO()
+smtp_io = SMTPIO()
@@ -0,0 +1,176 @@
+"""
+Structured, non-blocking logging.
+
+setup_logging() routes every record through a bounded in-memory queue to a
+background thread (QueueListener), which formats and writes it. The event
+loop only does an in-memory put and never waits on stdout. If the queue is
+full, records are dropped and counted instead of blocking.
+
+Records are JSON lines (LOG_FORMAT=json) carrying the current log context.
+The context lives in a contextvar, so every task sees only its own:
+  - a correlation id and update/user/chat/FSM state per Telegram update,
+    set by the dispatcher middleware (adapters/telegram_bot/middlewares.py)
+  - the test session id, bound by the handlers
+  - static process fields such as the worker index
+
+DEBUG records are high-volume (one per tap), so they are sampled per update.
+LOG_DEBUG_SAMPLE_RATE of the updates keep all their debug records and the
+rest keep none, so each sampled trace stays complete.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["DroppingQueueHandler"] = None
+_static_fields: set = set()  # process-wide fields kept across updates (setup_logging)
+
+# LogRecord attributes that are not user context
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "log_context"}
+
+
+def bind_log_context(**fields) -> contextvars.Token:
+    """Adds fields to the current task's log context; returns a token for reset_log_context."""
+    return _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+
+def current_log_context() -> Dict[str, Any]:
+    return _log_context.get()
+
+
+def reset_log_context(token: contextvars.Token):
+    _log_context.reset(token)
+
+
+def new_update_context(**fields) -> contextvars.Token:
+    """Fresh context for one update: correlation id + sampling decision, on top of the process fields."""
+    base = {k: v for k, v in _log_context.get().items() if k in _static_fields}
+    fields = {k: v for k, v in fields.items() if v is not None}
+    return _log_context.set({
+        **base,
+        "cid": f"{random.getrandbits(48):012x}",
+        "sampled": random.random() < settings.LOG_DEBUG_SAMPLE_RATE,
+        **fields,
+    })
+
+
+class ContextFilter(logging.Filter):
+    """Copies the log context onto the record (in the emitting task) and samples DEBUG."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if record.levelno <= logging.DEBUG:
+            sampled = context.get("sampled")
+            if sampled is None:
+                sampled = random.random() < settings.LOG_DEBUG_SAMPLE_RATE
+            if not sampled:
+                return False
+        record.log_context = context
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: a full queue drops the record (counted in `dropped`)."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args here (they may change later) but leave the layout to the formatter thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # at shutdown, waiting for room is fine
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in getattr(record, "log_context", {}).items() if k != "sampled"})
+        # logging.info(..., extra={...}) fields
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = " ".join(f"{k}={v}" for k, v in getattr(record, "log_context", {}).items() if k != "sampled")
+        return f"{line} [{context}]" if context else line
+
+
+def setup_logging(**static_fields):
+    """
+    Configures the root logger once per process. `static_fields` (e.g. worker=2)
+    are added to every record of this process.
+    """
+    global _listener, _handler
+    _static_fields.update(static_fields)
+    bind_log_context(**static_fields)
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, settings.LOG_QUEUE_SIZE))
+    _handler = handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    # Per-request chatter from the HTTP clients is not worth a record each
+    for noisy in ("httpx", "httpx2", "aiosqlite"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _listener = _Listener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flushes what is still queued and stops the writer thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _handler is not None and _handler.dropped:
+        sys.stderr.write(f"logging: {_handler.dropped} records dropped (queue full, LOG_QUEUE_SIZE={settings.LOG_QUEUE_SIZE})\n")
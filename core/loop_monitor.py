@@ -0,0 +1,172 @@
+"""
+Event-loop lag monitor.
+
+A heartbeat task sleeps LOOP_MONITOR_INTERVAL_MS at a time and records how
+late it wakes up (scheduling delay = time some callback held the loop) in a
+histogram. A watchdog thread checks the heartbeat. When it is more than
+LOOP_LAG_THRESHOLD_MS overdue, the loop is blocked right now, and the watchdog
+captures the loop thread's stack. It also captures the running task and the log
+context of the update that task is handling (registered by LogContextMiddleware).
+Once the loop is back, the stall is logged as one WARNING with its full duration,
+the blocking call site, the handler and the stack.
+
+Every LOOP_LAG_REPORT_SECONDS the histogram (and the worst call sites) is
+logged at INFO and reset. LOOP_SLOW_CALLBACK_MS > 0 also turns on asyncio
+debug mode, which logs every callback/task step slower than that (debug
+only: it slows everything down).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_HANDLER_FILES = (os.path.join("adapters", "telegram_bot", "handlers.py"),)
+log = logging.getLogger("loop_monitor")
+
+
+def _project_frame(frame: traceback.FrameSummary) -> bool:
+    return frame.filename.startswith(_ROOT) and "site-packages" not in frame.filename \
+        and not frame.filename.endswith("loop_monitor.py")
+
+
+class LoopMonitor:
+    def __init__(self):
+        self.histogram: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.max_ms = 0.0
+        self.stalls = 0
+        # "file:line function [in handler]" of the blocking call -> [stalls, total ms]
+        self.sites: Dict[str, List[float]] = {}
+        # task -> log context of the update it handles
+        self.active: Dict[asyncio.Task, Dict[str, Any]] = {}
+        self._beat = time.monotonic()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stop = threading.Event()
+
+    # --- update registry (LogContextMiddleware) ---
+
+    def track(self, context: Dict[str, Any]):
+        task = asyncio.current_task()
+        if task is not None:
+            self.active[task] = context
+
+    def untrack(self):
+        self.active.pop(asyncio.current_task(), None)
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Starts the heartbeat, watchdog and periodic report on the running loop."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        if settings.LOOP_SLOW_CALLBACK_MS > 0:
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = settings.LOOP_SLOW_CALLBACK_MS / 1000
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._tasks = [asyncio.create_task(self._heartbeat())]
+        if settings.LOOP_LAG_REPORT_SECONDS > 0:
+            self._tasks.append(asyncio.create_task(self._report_forever()))
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- loop side ---
+
+    async def _heartbeat(self):
+        interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag_ms = max(0.0, loop.time() - expected) * 1000
+            self._beat = time.monotonic()
+            self._record(lag_ms)
+
+    def _record(self, lag_ms: float):
+        i = 0
+        while i < len(BUCKETS_MS) and lag_ms > BUCKETS_MS[i]:
+            i += 1
+        self.histogram[i] += 1
+        self.max_ms = max(self.max_ms, lag_ms)
+        stall, self._pending = self._pending, None
+        if stall is None or lag_ms < settings.LOOP_LAG_THRESHOLD_MS:
+            return
+        self.stalls += 1
+        key = f"{stall['site']} in {stall['handler']}" if stall["handler"] else stall["site"]
+        site = self.sites.setdefault(key, [0, 0.0])
+        site[0] += 1
+        site[1] += lag_ms
+        log.warning("event loop blocked", extra={"blocked_ms": round(lag_ms, 1), **stall})
+
+    async def _report_forever(self):
+        while True:
+            await asyncio.sleep(settings.LOOP_LAG_REPORT_SECONDS)
+            self.log_report()
+
+    def log_report(self, reset: bool = True):
+        hist = {f"le_{b}ms": n for b, n in zip(BUCKETS_MS, self.histogram)}
+        hist[f"gt_{BUCKETS_MS[-1]}ms"] = self.histogram[-1]
+        worst = sorted(self.sites.items(), key=lambda kv: kv[1][1], reverse=True)[:5]
+        log.info("event loop lag", extra={
+            "samples": sum(self.histogram), "max_ms": round(self.max_ms, 1), "stalls": self.stalls,
+            "histogram": hist, "worst_sites": {s: {"stalls": n, "ms": round(ms)} for s, (n, ms) in worst},
+        })
+        if reset:
+            self.histogram = [0] * len(self.histogram)
+            self.max_ms = 0.0
+            self.stalls = 0
+            self.sites = {}
+
+    # --- watchdog thread ---
+
+    def _watchdog(self):
+        interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+        threshold = settings.LOOP_LAG_THRESHOLD_MS / 1000
+        captured_beat = None
+        while not self._stop.wait(interval / 2):
+            beat = self._beat
+            if beat == captured_beat or time.monotonic() - beat - interval < threshold:
+                continue
+            # Blocked right now: whatever runs on the loop thread is the culprit
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            captured_beat = beat
+            stack = traceback.extract_stack(frame)
+            task = asyncio.current_task(self._loop)
+            self._pending = self._describe(stack, task)
+
+    def _describe(self, stack: traceback.StackSummary, task: Optional[asyncio.Task]) -> Dict[str, Any]:
+        project = [f for f in stack if _project_frame(f)]
+        site = project[-1] if project else stack[-1]
+        handler = next((f.name for f in project if f.filename.endswith(_HANDLER_FILES)), None)
+        context = {k: v for k, v in self.active.get(task, {}).items() if k != "sampled"}
+        return {
+            "site": f"{os.path.relpath(site.filename, _ROOT)}:{site.lineno} {site.name}",
+            "handler": handler,
+            "task": task.get_name() if task else None,
+            "update": context,
+            "stack": "".join(traceback.format_list(stack[-12:])),
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -60,6 +60,10 @@ class ScoringResult(BaseModel):
     primary_cluster: List[ArchetypeType]
     secondary_cluster: List[ArchetypeType]
     meta_archetype_title: Optional[str] = None
+    percentiles: Dict[ArchetypeType, int] = {}  # vs. population norms; empty when unavailable
+    # Content versions the result was scored and reported with (core/content.py)
+    questions_version: str = ""
+    info_version: str = ""
     
 class UserSession(BaseModel):
     user_id: int
@@ -0,0 +1,145 @@
+"""
+Prompt construction for the report strategy.
+
+The old prompt sent a line for all 12 archetypes plus the raw scores dict
+on every request. Here only the primary and secondary clusters get
+knowledge-base context. Primary archetypes get what the report is built
+on (desire, shadow, tone, visuals) and secondary ones a short line.
+Detail is dropped step by step until the prompt fits
+STRATEGY_PROMPT_TOKEN_BUDGET, measured with a local token estimate (no
+tokenizer download, no API call).
+
+Layout, stable part first: the system message holds the role and the task
+instructions and never changes, so providers with prefix caching can reuse
+it. The user message holds the per-archetype profile lines, which are
+rendered and counted once per (archetype, detail level) and cached, then
+the scores.
+"""
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .engine import ArchetypeEngine
+from .models import ArchetypeType
+
+SYSTEM_PROMPT = (
+    "Ви — експерт з брендингу, психології архетипів та стратегічного маркетингу. "
+    "Створюйте контент, який виглядає як дорогий консалтинговий звіт.\n\n"
+    "Завдання: Створіть професійну маркетингову та брендингову стратегію для клієнта на основі його балів архетипів. "
+    "Зверніть увагу на комбінацію домінантних архетипів (тих, що мають найвищі бали).\n\n"
+    "Звіт ПОВИНЕН містити:\n"
+    "1. **Глибинний аналіз комбінації**: Як ваші архетипи взаємодіють між собою? Яку унікальну 'суперсилу' вони дають?\n"
+    "2. **Ваш Тіньовий аспект**: Чого варто остерігатися (слабкі місця).\n"
+    "3. **Маркетингова стратегія (Plan)**: Конкретні кроки з позиціонування, вибору голосу бренду (Tone of Voice) та візуального стилю.\n"
+    "4. **Рекомендації для росту**: Як масштабувати свій вплив, використовуючи ці архетипи.\n\n"
+    "Мова: Українська. Форматування: Markdown (заголовки ##, списки)."
+)
+
+FIELD_LABELS = {
+    "core_desire": "бажання",
+    "shadow": "тінь",
+    "tone": "голос",
+    "visuals": "візуал",
+}
+
+# Richest first; build() walks down until the prompt fits the budget
+DETAIL_LEVELS: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = [
+    (("core_desire", "shadow", "tone", "visuals"), ("core_desire",)),
+    (("core_desire", "shadow", "tone"), ("core_desire",)),
+    (("core_desire", "shadow", "tone"), ()),
+    (("core_desire", "tone"), ()),
+]
+
+PRIMARY_HEADER = "Домінантні архетипи:"
+SECONDARY_HEADER = "Другорядні архетипи:"
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    BPE-style estimate: ~4 chars per token for ASCII words, ~3 for Cyrillic
+    (which current tokenizers split finer), one per punctuation mark.
+    Errs slightly high, so a prompt that fits the estimate fits the budget.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        tokens += max(1, math.ceil(len(piece) / (4 if piece.isascii() else 3)))
+    return tokens + text.count("\n")
+
+
+@dataclass
+class StrategyPrompt:
+    messages: List[Dict[str, str]]
+    estimated_tokens: int
+    detail_level: int  # index into DETAIL_LEVELS, -1 if even the leanest one is over budget
+    primary: List[str]
+    secondary: List[str]
+
+
+PRIMARY_HEADER_TOKENS = estimate_tokens(PRIMARY_HEADER) + 1
+SECONDARY_HEADER_TOKENS = estimate_tokens(SECONDARY_HEADER) + 1
+
+
+class StrategyPromptBuilder:
+    SYSTEM_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+    def __init__(self, descriptions: Dict[str, dict], token_budget: int):
+        self.descriptions = descriptions
+        self.token_budget = token_budget
+        # (archetype, fields) -> (profile line, its token estimate)
+        self._profiles: Dict[Tuple[str, Tuple[str, ...]], Tuple[str, int]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def clusters(scores: Dict) -> Tuple[List[str], List[str]]:
+        result = ArchetypeEngine.process_results({ArchetypeType(getattr(k, "value", k)): v for k, v in scores.items()})
+        return [a.value for a in result.primary_cluster], [a.value for a in result.secondary_cluster]
+
+    def _profile(self, arch: str, fields: Tuple[str, ...]) -> Tuple[str, int]:
+        key = (arch, fields)
+        cached = self._profiles.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+        info = self.descriptions.get(arch, {})
+        parts = [f"{FIELD_LABELS[field]}: {info[field]}" for field in fields if info.get(field)]
+        line = f"- {info.get('title') or arch}" + (f" — {'; '.join(parts)}" if parts else "")
+        self._profiles[key] = (line, estimate_tokens(line) + 1)  # + newline
+        return self._profiles[key]
+
+    def _context(self, primary: Sequence[str], secondary: Sequence[str], level: int) -> Tuple[str, int]:
+        primary_fields, secondary_fields = DETAIL_LEVELS[level]
+        lines = [(PRIMARY_HEADER, PRIMARY_HEADER_TOKENS)] + [self._profile(a, primary_fields) for a in primary]
+        if secondary:
+            lines += [(SECONDARY_HEADER, SECONDARY_HEADER_TOKENS)] + [self._profile(a, secondary_fields) for a in secondary]
+        return "\n".join(line for line, _ in lines), sum(tokens for _, tokens in lines)
+
+    def build(self, scores: Dict, primary: Optional[Sequence[str]] = None, secondary: Optional[Sequence[str]] = None) -> StrategyPrompt:
+        if primary is None or secondary is None:
+            primary, secondary = self.clusters(scores)
+        named = {getattr(k, "value", k): v for k, v in scores.items()}
+        ranked = sorted(named.items(), key=lambda x: x[1], reverse=True)
+        scores_line = "Бали архетипів: " + ", ".join(f"{arch} {score}" for arch, score in ranked if score)
+        reserved = self.SYSTEM_TOKENS + estimate_tokens(scores_line) + 1  # + blank line
+        for level in range(len(DETAIL_LEVELS)):
+            context, context_tokens = self._context(primary, secondary, level)
+            if reserved + context_tokens <= self.token_budget:
+                break
+        else:
+            level = -1
+            logging.warning(f"Strategy prompt over budget ({reserved + context_tokens} > {self.token_budget} est. tokens) at the leanest detail level")
+        return StrategyPrompt(
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"{context}\n\n{scores_line}"},
+            ],
+            estimated_tokens=reserved + context_tokens,
+            detail_level=level,
+            primary=list(primary),
+            secondary=list(secondary),
+        )
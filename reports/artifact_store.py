@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from reports.report_artifact import ReportArtifact
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for rendered report artifacts (chart PNGs, PDFs).
+
+    Layout under `root`:
+        blobs/<key>       rendered bytes, evicted oldest-first above max_bytes
+        meta/<key>.json   filename + Telegram file_ids per bot (kept on eviction,
+                          a file_id stays valid on Telegram's side)
+        aliases/<name>    pointer to a key, e.g. a user's last report
+
+    Writes go through a temp file + os.replace, so several worker
+    processes can share one directory.
+
+    Nothing touches the disk until first use: the directories are created
+    (and the blob size scanned) on the first write. All methods do blocking
+    file I/O, so async code calls them via asyncio.to_thread.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+
+    def _ready(self):
+        if self._total is None:
+            with self._lock:
+                if self._total is None:
+                    for sub in ("blobs", "meta", "aliases"):
+                        os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+                    self._total = self._scan_size()
+
+    @staticmethod
+    def key_for(kind: str, inputs: Dict[str, Any]) -> str:
+        canonical = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{kind}-" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:40]
+
+    # ---- paths / io helpers ----
+
+    def _blob(self, key: str) -> str:
+        return os.path.join(self.root, "blobs", key)
+
+    def _meta(self, key: str) -> str:
+        return os.path.join(self.root, "meta", key + ".json")
+
+    def _alias(self, name: str) -> str:
+        return os.path.join(self.root, "aliases", hashlib.sha1(name.encode("utf-8")).hexdigest())
+
+    def _write_atomic(self, path: str, data: bytes):
+        self._ready()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _scan_size(self) -> int:
+        blobs = os.path.join(self.root, "blobs")
+        return sum(e.stat().st_size for e in os.scandir(blobs) if e.is_file())
+
+    def _read_meta(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._meta(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # ---- blobs ----
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self._blob(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # LRU: reading refreshes the eviction order
+        return data
+
+    def open(self, key: str) -> Optional[ReportArtifact]:
+        """Like get_bytes, but large blobs are memory-mapped instead of read."""
+        path = self._blob(key)
+        try:
+            artifact = ReportArtifact.from_file(path, self.get_filename(key) or key)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return artifact
+
+    def put(self, key: str, data: bytes, filename: str):
+        path = self._blob(key)
+        existed = os.path.exists(path)
+        self._write_atomic(path, data)
+        meta = self._read_meta(key)
+        meta["filename"] = filename
+        meta["size"] = len(data)
+        self._write_atomic(self._meta(key), json.dumps(meta).encode("utf-8"))
+        if not existed:
+            with self._lock:
+                self._total += len(data)
+                if self._total > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        # Other processes write here too, so re-measure before deleting anything
+        entries = [e for e in os.scandir(os.path.join(self.root, "blobs")) if e.is_file()]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for entry in entries:
+            if total <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        self._total = total
+        if removed:
+            logging.info(f"Artifact store evicted {removed} blobs, {total} bytes remain")
+
+    # ---- Telegram file_ids & aliases ----
+
+    def get_file_id(self, key: str, bot_id: int) -> Optional[str]:
+        return self._read_meta(key).get("file_ids", {}).get(str(bot_id))
+
+    def get_filename(self, key: str) -> Optional[str]:
+        return self._read_meta(key).get("filename")
+
+    def set_file_id(self, key: str, bot_id: int, file_id: str):
+        meta = self._read_meta(key)
+        meta.setdefault("file_ids", {})[str(bot_id)] = file_id
+        self._write_atomic(self._meta(key), json.dumps(meta).encode("utf-8"))
+
+    def set_alias(self, name: str, key: str):
+        self._write_atomic(self._alias(name), key.encode("utf-8"))
+
+    def get_alias(self, name: str) -> Optional[str]:
+        try:
+            with open(self._alias(name), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+
+artifact_store = ArtifactStore(settings.ARTIFACT_DIR, settings.ARTIFACT_MAX_MB * 1024 * 1024)
@@ -1,11 +1,12 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Optional
 import io
 
-def create_radar_chart(scores: Dict[str, int]) -> io.BytesIO:
+def create_radar_chart(scores: Dict[str, int], percentiles: Optional[Dict[str, int]] = None) -> io.BytesIO:
     """
     Generates a radar chart from archetype scores.
+    `percentiles` (same keys) adds each archetype's population percentile to its label.
     Returns: BytesIO object containing the image.
     """
     labels = list(scores.keys())
@@ -37,7 +38,10 @@ def create_radar_chart(scores: Dict[str, int]) -> io.BytesIO:
             # Use format: "Укр (Eng)"
             name_uk = arch_enum.ukrainian_name.split(' (')[0]
             name_en = arch_enum.value # Enum value is the English name
-            display_labels.append(f"{name_uk}\n({name_en})")
+            label = f"{name_uk}\n({name_en})"
+            if percentiles and percentiles.get(arch_key) is not None:
+                label += f"\nP{percentiles[arch_key]}"
+            display_labels.append(label)
         except Exception:
             display_labels.append(str(arch_key))
 
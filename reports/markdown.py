@@ -0,0 +1,316 @@
+"""
+Markdown -> reportlab flowables for the strategy section of the PDF.
+
+The text comes from the LLM (or build_fallback_strategy), so it is treated
+as untrusted: everything is XML-escaped before any markup is added, and the
+markup added here is always balanced. A stray `<` or `&` therefore shows up
+as text instead of breaking Paragraph.
+
+Supported: # headings, paragraphs, **bold**, *italic* / _italic_, ***both***,
+~~strike~~, `code`, [links](https://...), nested "-"/"*"/"+" and numbered
+lists, > blockquotes (incl. GitHub-style "> [!NOTE]" callouts), | tables |,
+``` fenced code and --- rules.
+
+parse() is a single pass over the lines with precompiled patterns and is
+memoized per text (the fallback strategy repeats for the same top
+archetypes). It returns plain tuples; MarkdownRenderer turns them into new
+flowables on every call, because reportlab flowables keep layout state and
+must not be shared between documents.
+"""
+import html
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Flowable, Paragraph, Preformatted, Spacer, Table, TableStyle
+from reportlab.platypus.flowables import HRFlowable
+
+Block = Tuple
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d{1,9}[.)])\s+(.*)$")
+_QUOTE = re.compile(r"^\s{0,3}>\s?(.*)$")
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)[`~]*\s*(.*)$")
+_LANGUAGE = re.compile(r"^[\w+#.-]*$")
+_RULE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEP = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_CALLOUT = re.compile(r"^\[!(NOTE|TIP|IMPORTANT|WARNING|CAUTION)\]\s*(.*)$", re.IGNORECASE)
+
+_INLINE = re.compile(
+    r"(?=[`\[*_~])(?:"                                                # fail fast on plain text
+    r"`([^`\n]+)`"                                                   # 1 code
+    r"|\[([^\]\n]+)\]\(((?:https?://|mailto:)[^)\s\"]+)\)"           # 2,3 link
+    r"|\*\*\*(?=\S)(.+?)(?<=\S)\*\*\*"                              # 4 bold italic
+    r"|(\*\*|__)(?=\S)(.+?)(?<=\S)\5"                               # 5,6 bold
+    r"|\*(?=[^\s*])(.+?)(?<=[^\s*])\*"                              # 7 italic
+    r"|(?<!\w)_(?=[^\s_])(.+?)(?<=[^\s_])_(?!\w)"                   # 8 italic
+    r"|~~(?=\S)(.+?)(?<=\S)~~"                                      # 9 strike
+    r")"
+)
+
+CALLOUT_LABELS = {
+    "NOTE": "Примітка",
+    "TIP": "Порада",
+    "IMPORTANT": "Важливо",
+    "WARNING": "Увага",
+    "CAUTION": "Обережно",
+}
+BULLETS = ("•", "◦", "▪")
+
+# Tables whose rows cannot fit the page (reportlab does not split a row) are listed as text instead
+MAX_TABLE_COLUMNS = 6
+MAX_TABLE_CELL_CHARS = 400
+
+
+def _inline_match(m: "re.Match") -> str:
+    if m.group(1) is not None:
+        return f'<font color="#444444">{m.group(1)}</font>'
+    if m.group(2) is not None:
+        return f'<a href="{m.group(3)}" color="blue">{inline(m.group(2), escaped=True)}</a>'
+    if m.group(4) is not None:
+        return f"<b><i>{inline(m.group(4), escaped=True)}</i></b>"
+    if m.group(6) is not None:
+        return f"<b>{inline(m.group(6), escaped=True)}</b>"
+    if m.group(7) is not None:
+        return f"<i>{inline(m.group(7), escaped=True)}</i>"
+    if m.group(8) is not None:
+        return f"<i>{inline(m.group(8), escaped=True)}</i>"
+    return f"<strike>{inline(m.group(9), escaped=True)}</strike>"
+
+
+def inline(text: str, escaped: bool = False) -> str:
+    """Paragraph markup for one line of markdown; unmatched markers stay literal."""
+    if not escaped:
+        text = html.escape(text, quote=False)
+    return _INLINE.sub(_inline_match, text)
+
+
+def _split_row(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line)]
+
+
+@lru_cache(maxsize=256)
+def parse(text: str) -> Tuple[Block, ...]:
+    """
+    Blocks: ("h", level, markup) | ("p", markup) | ("li", depth, bullet, markup)
+    | ("quote", markup) | ("table", rows) | ("code", text) | ("hr",) | ("space",)
+    """
+    lines = text.expandtabs(4).split("\n")
+    blocks: List[Block] = []
+    para: List[str] = []
+    list_indents: List[int] = []   # indent of each open list level
+    counters: List[int] = []       # next number per level (-1: unordered)
+    item = None                    # [depth, bullet, parts] of the list item being read
+
+    def flush_para():
+        if para:
+            blocks.append(("p", " ".join(para)))
+            para.clear()
+
+    def flush_item():
+        nonlocal item
+        if item is not None:
+            blocks.append(("li", item[0], item[1], " ".join(item[2])))
+            item = None
+
+    def close_lists():
+        flush_item()
+        list_indents.clear()
+        counters.clear()
+
+    def space():
+        if blocks and blocks[-1] != ("space",):
+            blocks.append(("space",))
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        stripped = line.strip()
+
+        if not stripped:
+            flush_para()
+            flush_item()
+            space()
+            i += 1
+            continue
+
+        fence = _FENCE.match(line)
+        if fence:
+            flush_para()
+            close_lists()
+            # "```python" names a language; anything else after the fence is code
+            code = [] if _LANGUAGE.match(fence.group(2)) else [fence.group(2)]
+            close = re.compile(r"^\s*" + re.escape(fence.group(1)) + r"[`~]*\s*$")
+            i += 1
+            while i < len(lines) and not close.match(lines[i]):
+                code.append(lines[i].rstrip())
+                i += 1
+            blocks.append(("code", "\n".join(code)))
+            i += 1
+            continue
+
+        m = _LIST_ITEM.match(line)
+        if m and not _RULE.match(line):
+            flush_para()
+            flush_item()
+            indent, marker = len(m.group(1)), m.group(2)
+            while list_indents and indent < list_indents[-1]:
+                list_indents.pop()
+                counters.pop()
+            if not list_indents or indent > list_indents[-1]:
+                if len(list_indents) >= len(BULLETS) * 2:
+                    indent = list_indents[-1]  # deeper than this is never intended
+                else:
+                    list_indents.append(indent)
+                    counters.append(int(marker[:-1]) if marker[0].isdigit() else -1)
+            depth = len(list_indents) - 1
+            if marker[0].isdigit():
+                if counters[depth] < 0:
+                    counters[depth] = int(marker[:-1])
+                bullet = f"{counters[depth]}."
+                counters[depth] += 1
+            else:
+                bullet = BULLETS[depth % len(BULLETS)]
+            item = [depth, bullet, [inline(m.group(3))]]
+            i += 1
+            continue
+
+        # Indented line right after an item: continuation of that item
+        if item is not None and line[:1] == " ":
+            item[2].append(inline(stripped))
+            i += 1
+            continue
+        close_lists()
+
+        m = _HEADING.match(line)
+        if m:
+            flush_para()
+            blocks.append(("h", len(m.group(1)), inline(m.group(2))))
+            i += 1
+            continue
+
+        if _RULE.match(line):
+            flush_para()
+            blocks.append(("hr",))
+            i += 1
+            continue
+
+        if _QUOTE.match(line):
+            flush_para()
+            parts: List[str] = []
+            while i < len(lines):
+                q = _QUOTE.match(lines[i].rstrip())
+                if not q:
+                    break
+                body = q.group(1).strip()
+                callout = _CALLOUT.match(body) if not parts else None
+                if callout:
+                    parts.append(f"<b>{CALLOUT_LABELS[callout.group(1).upper()]}</b><br/>")
+                    body = callout.group(2)
+                    if not body:
+                        i += 1
+                        continue
+                if body:
+                    parts.append(inline(body))
+                elif parts and parts[-1] != "<br/><br/>":
+                    parts.append("<br/><br/>")
+                i += 1
+            while parts and parts[-1] == "<br/><br/>":
+                parts.pop()
+            if parts:
+                blocks.append(("quote", " ".join(parts)))
+            continue
+
+        if _TABLE_ROW.match(line) and i + 1 < len(lines) and _TABLE_SEP.match(lines[i + 1]) and "|" in lines[i + 1]:
+            flush_para()
+            header = _split_row(line)
+            rows = [header]
+            i += 2
+            while i < len(lines) and _TABLE_ROW.match(lines[i]):
+                rows.append(_split_row(lines[i]))
+                i += 1
+            width = max(len(row) for row in rows)
+            rows = [row + [""] * (width - len(row)) for row in rows]
+            if width > MAX_TABLE_COLUMNS or any(len(cell) > MAX_TABLE_CELL_CHARS for row in rows for cell in row):
+                for row in rows:
+                    blocks.append(("li", 0, BULLETS[0], " — ".join(inline(cell) for cell in row if cell)))
+            else:
+                blocks.append(("table", tuple(tuple(inline(cell) for cell in row) for row in rows)))
+            continue
+
+        para.append(inline(stripped))
+        i += 1
+
+    flush_para()
+    flush_item()
+    while blocks and blocks[-1] == ("space",):
+        blocks.pop()
+    return tuple(blocks)
+
+
+class MarkdownRenderer:
+    """Builds flowables from parse() output with styles derived from the report's base styles."""
+
+    def __init__(self, styles: Dict[str, ParagraphStyle], width: float):
+        self.width = width
+        normal, heading = styles["normal"], styles["heading"]
+        font = normal.fontName
+        self.normal = normal
+        self.headings = {
+            1: heading,
+            2: heading,
+            3: ParagraphStyle("MdH3", parent=heading, fontSize=14, leading=17, spaceBefore=14),
+            4: ParagraphStyle("MdH4", parent=heading, fontSize=12, leading=15, spaceBefore=10, spaceAfter=6),
+        }
+        self.items = [
+            ParagraphStyle(f"MdItem{depth}", parent=normal, leftIndent=20 + 16 * depth, bulletIndent=6 + 16 * depth,
+                           bulletFontName=font, spaceAfter=4)
+            for depth in range(len(BULLETS) * 2)
+        ]
+        self.quote = ParagraphStyle("MdQuote", parent=normal, leftIndent=12, rightIndent=6, textColor=colors.HexColor("#333333"),
+                                    backColor=colors.HexColor("#eef2f8"), borderColor=colors.HexColor("#9db1d6"),
+                                    borderWidth=0.5, borderPadding=6, spaceBefore=6, spaceAfter=14)
+        self.cell = ParagraphStyle("MdCell", parent=normal, fontSize=9.5, leading=12, spaceAfter=0)
+        self.code = ParagraphStyle("MdCode", parent=normal, fontSize=9, leading=11.5, leftIndent=10,
+                                   backColor=colors.HexColor("#f4f4f4"), borderPadding=4, spaceBefore=4, spaceAfter=10)
+        self.table_style = TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#9db1d6")),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#dde5f2")),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ])
+
+    def flowables(self, text: str) -> List[Flowable]:
+        story: List[Flowable] = []
+        for block in parse(text):
+            kind = block[0]
+            if kind == "p":
+                story.append(Paragraph(block[1], self.normal))
+            elif kind == "h":
+                story.append(Paragraph(block[2], self.headings[min(block[1], 4)]))
+            elif kind == "li":
+                story.append(Paragraph(block[3], self.items[block[1]], bulletText=block[2]))
+            elif kind == "quote":
+                story.append(Paragraph(block[1], self.quote))
+            elif kind == "table":
+                rows = block[1]
+                data = [[Paragraph(f"<b>{cell}</b>" if r == 0 and cell else cell, self.cell) for cell in row]
+                        for r, row in enumerate(rows)]
+                story.append(Table(data, colWidths=[self.width / len(rows[0])] * len(rows[0]),
+                                   style=self.table_style, repeatRows=1, hAlign="LEFT"))
+                story.append(Spacer(1, 0.15 * inch))
+            elif kind == "code":
+                story.append(Preformatted(block[1], self.code, maxLineLength=90))
+            elif kind == "hr":
+                story.append(HRFlowable(width="100%", thickness=0.5, color=colors.HexColor("#9db1d6"), spaceBefore=6, spaceAfter=10))
+            else:
+                story.append(Spacer(1, 0.1 * inch))
+        return story
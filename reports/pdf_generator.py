@@ -1,55 +1,51 @@
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
+from reportlab import rl_config
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+import html
 import io
+import logging
+import os
 from datetime import datetime
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 
-def generate_pdf_report(
-    user_name: str,
-    user_phone: str,
-    meta_archetype_title: str,
-    scoring_data: Dict[str, Any],
-    strategy_content: str,
-    chart_buffer: io.BytesIO
-) -> io.BytesIO:
-    """
-    Generates a PRO 10-12 page style report (compacted for PDF usability).
-    """
-    import os
-    import json
-    
-    # Load detailed info
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    info_path = os.path.join(base_dir, "data", "archetype_info.json")
-    archetype_info = {}
-    try:
-        with open(info_path, "r", encoding="utf-8") as f:
-            archetype_info = json.load(f)
-    except Exception as e:
-        print(f"Error loading info: {e}")
+from core.config import settings
+from core.content import content_store
+from reports.markdown import MarkdownRenderer
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom Styles
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARGIN = 50
+
+# Bump when the layout of a cached section (or its styles) changes: old fragments stop matching
+FRAGMENT_TEMPLATE_VERSION = 1
+
+# Images go in as binary Flate streams: ASCII85 on top only inflates the file by 25%, and without
+# reportlab's C accelerator encoding the chart was about half of the per-report layout time
+rl_config.useA85 = 0
+
+_font_name = None
+
+
+def _register_font() -> str:
+    """Registers the Cyrillic font once per process (parsing the TTF is the slow part)."""
+    global _font_name
+    if _font_name:
+        return _font_name
     font_name = 'Helvetica'
     # Project bundled font (Arial supports Cyrillic)
-    bundled_font_path = os.path.join(base_dir, "data", "arial.ttf")
-    
+    bundled_font_path = os.path.join(BASE_DIR, "data", "arial.ttf")
+
     if os.path.exists(bundled_font_path):
         try:
             pdfmetrics.registerFont(TTFont('Arial', bundled_font_path))
             font_name = 'Arial'
         except Exception as e:
-            print(f"Error registering bundled font: {e}")
+            logging.warning(f"Error registering bundled font: {e}")
     else:
         # Fallback to system search
         font_paths = [
@@ -63,79 +59,181 @@ def generate_pdf_report(
                     font_name = 'CustomFont'
                     break
                 except: continue
+    _font_name = font_name
+    return font_name
+
+
+def load_report_info(version: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+    """Detailed archetype info + its content version: the test's own version, else the current one."""
+    kb = content_store.knowledge_base(version)
+    return kb.info, kb.version
 
-    title_style = ParagraphStyle('MainTitle', parent=styles['Heading1'], fontName=font_name, fontSize=28, alignment=1, spaceAfter=40, textColor=colors.darkblue)
-    subtitle_style = ParagraphStyle('SubTitle', parent=styles['Heading2'], fontName=font_name, fontSize=18, alignment=1, spaceAfter=20, textColor=colors.blue)
-    heading_pro = ParagraphStyle('HeadingPro', parent=styles['Heading2'], fontName=font_name, fontSize=16, spaceBefore=20, spaceAfter=10, textColor=colors.darkblue)
+
+@lru_cache(maxsize=4)
+def _styles(font_name: str) -> Dict[str, ParagraphStyle]:
+    styles = getSampleStyleSheet()
     normal_pro = ParagraphStyle('NormalPro', parent=styles['Normal'], fontName=font_name, fontSize=11, leading=14, spaceAfter=10)
-    bullet_style = ParagraphStyle('Bullet', parent=normal_pro, leftIndent=20, firstLineIndent=-10)
+    return {
+        "title": ParagraphStyle('MainTitle', parent=styles['Heading1'], fontName=font_name, fontSize=28, alignment=1, spaceAfter=40, textColor=colors.darkblue),
+        "subtitle": ParagraphStyle('SubTitle', parent=styles['Heading2'], fontName=font_name, fontSize=18, alignment=1, spaceAfter=20, textColor=colors.blue),
+        "heading": ParagraphStyle('HeadingPro', parent=styles['Heading2'], fontName=font_name, fontSize=16, spaceBefore=20, spaceAfter=10, textColor=colors.darkblue),
+        "normal": normal_pro,
+        "bullet": ParagraphStyle('Bullet', parent=normal_pro, leftIndent=20, firstLineIndent=-10),
+    }
+
+
+@lru_cache(maxsize=4)
+def _markdown(font_name: str) -> MarkdownRenderer:
+    return MarkdownRenderer(_styles(font_name), A4[0] - 2 * MARGIN)
 
-    # 1. COVER PAGE
-    story.append(Spacer(1, 2 * inch))
-    story.append(Paragraph("БРЕНД-СТРАТЕГІЯ ЗА АРХЕТИПАМИ", title_style))
+
+# ---- sections ----
+
+def _cover(st, user_name: str, user_phone: str, meta_archetype_title: str) -> List[Flowable]:
+    story = [Spacer(1, 2 * inch), Paragraph("БРЕНД-СТРАТЕГІЯ ЗА АРХЕТИПАМИ", st["title"])]
     if meta_archetype_title:
-        story.append(Paragraph(f"Ваш персональний профіль: {meta_archetype_title}", subtitle_style))
+        story.append(Paragraph(f"Ваш персональний профіль: {html.escape(meta_archetype_title, quote=False)}", st["subtitle"]))
     story.append(Spacer(1, 1 * inch))
-    story.append(Paragraph(f"<b>Клієнт:</b> {user_name}", normal_pro))
-    story.append(Paragraph(f"<b>Телефон:</b> {user_phone}", normal_pro))
-    story.append(Paragraph(f"<b>Дата:</b> {datetime.now().strftime('%d.%m.%Y')}", normal_pro))
+    # Typed by the user: escaped, or a stray "<" breaks Paragraph
+    story.append(Paragraph(f"<b>Клієнт:</b> {html.escape(str(user_name), quote=False)}", st["normal"]))
+    story.append(Paragraph(f"<b>Телефон:</b> {html.escape(str(user_phone), quote=False)}", st["normal"]))
+    story.append(Paragraph(f"<b>Дата:</b> {datetime.now().strftime('%d.%m.%Y')}", st["normal"]))
     story.append(PageBreak())
+    return story
 
-    # 2. THE ARCHETYPE WHEEL
-    story.append(Paragraph("Ваша архітектура особистості", heading_pro))
-    story.append(Paragraph("Цей графік відображає баланс 12 базових архетипів у вашому поточному стані. Домінантні архетипи визначають вашу стратегію поведінки та сприйняття світу.", normal_pro))
-    img = Image(chart_buffer, width=5*inch, height=5*inch)
-    story.append(img)
+
+def _wheel(st, chart_buffer: io.BytesIO, scoring_data: Dict[str, Any], archetype_info: Dict[str, Any]) -> List[Flowable]:
+    story = [
+        Paragraph("Ваша архітектура особистості", st["heading"]),
+        Paragraph("Цей графік відображає баланс 12 базових архетипів у вашому поточному стані. Домінантні архетипи визначають вашу стратегію поведінки та сприйняття світу.", st["normal"]),
+        Image(chart_buffer, width=5*inch, height=5*inch),
+    ]
+    # Percentiles vs. other participants (only when norms were available)
+    percentiles = scoring_data.get('percentiles') or {}
+    if percentiles:
+        story.append(Paragraph("Порівняння з іншими учасниками", st["heading"]))
+        scores = scoring_data.get('archetype_scores', {})
+        for key, pct in sorted(percentiles.items(), key=lambda x: x[1], reverse=True):
+            info = archetype_info.get(key, {})
+            name = info.get('title') or key
+            story.append(Paragraph(f"• <b>{name}</b>: {scores.get(key, 0)} балів — вище, ніж у {pct}% учасників", st["bullet"]))
     story.append(PageBreak())
+    return story
+
 
-    # 3. DOMINANT ARCHETYPES (DNA)
-    story.append(Paragraph("Глибинний аналіз домінантних архетипів", heading_pro))
-    primary = scoring_data.get('primary_cluster', [])
-    for arch_key in primary:
-        # Resolve key
-        key = arch_key.value if hasattr(arch_key, 'value') else str(arch_key)
+def _dominant(st, primary: List[str], archetype_info: Dict[str, Any]) -> List[Flowable]:
+    """Depends only on the primary cluster and archetype_info.json: the cached section."""
+    story = [Paragraph("Глибинний аналіз домінантних архетипів", st["heading"])]
+    for key in primary:
         info = archetype_info.get(key, {})
         if not info: continue
-        
-        story.append(Paragraph(f"<b>Архетип: {info.get('title')}</b>", heading_pro))
-        story.append(Paragraph(f"<i>'{info.get('motto')}'</i>", normal_pro))
-        story.append(Paragraph(f"<b>Головне бажання:</b> {info.get('core_desire')}", normal_pro))
-        story.append(Paragraph(f"<b>Ціль:</b> {info.get('goal')}", normal_pro))
-        story.append(Paragraph(f"<b>Стратегія:</b> {info.get('strategy')}", normal_pro))
-        story.append(Paragraph(f"<b>Тіньовий аспект (Shadow Side):</b> {info.get('shadow')}", normal_pro))
-        story.append(Paragraph(f"<b>Словник бренду:</b> {', '.join(info.get('vocabulary', []))}", normal_pro))
+
+        story.append(Paragraph(f"<b>Архетип: {info.get('title')}</b>", st["heading"]))
+        story.append(Paragraph(f"<i>'{info.get('motto')}'</i>", st["normal"]))
+        story.append(Paragraph(f"<b>Головне бажання:</b> {info.get('core_desire')}", st["normal"]))
+        story.append(Paragraph(f"<b>Ціль:</b> {info.get('goal')}", st["normal"]))
+        story.append(Paragraph(f"<b>Стратегія:</b> {info.get('strategy')}", st["normal"]))
+        story.append(Paragraph(f"<b>Тіньовий аспект (Shadow Side):</b> {info.get('shadow')}", st["normal"]))
+        story.append(Paragraph(f"<b>Словник бренду:</b> {', '.join(info.get('vocabulary', []))}", st["normal"]))
         story.append(Spacer(1, 0.2 * inch))
-    
+
     story.append(PageBreak())
+    return story
+
 
-    # 4. AI-GENERATED STRATEGY
-    story.append(Paragraph("Персоналізована стратегія бренду", heading_pro))
-    story.append(Paragraph("Цей розділ згенеровано нейромережею на основі вашої унікальної комбінації архетипів.", normal_pro))
-    story.append(Spacer(1, 0.1 * inch))
-
-    lines = strategy_content.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            story.append(Spacer(1, 0.1 * inch))
-            continue
-        
-        # Simple Markdown parsing
-        import re
-        line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line)
-        
-        if line.startswith('###'):
-            story.append(Paragraph(line.lstrip('#').strip(), heading_pro))
-        elif line.startswith('##'):
-            story.append(Paragraph(line.lstrip('#').strip(), heading_pro))
-        elif line.startswith('#'):
-            story.append(Paragraph(line.lstrip('#').strip(), heading_pro))
-        elif line.startswith('- ') or line.startswith('* '):
-             story.append(Paragraph(f"• {line[2:]}", bullet_style))
-        else:
-            story.append(Paragraph(line, normal_pro))
-
-    # Build
+def _strategy(st, strategy_content: str, font_name: str) -> List[Flowable]:
+    return [
+        Paragraph("Персоналізована стратегія бренду", st["heading"]),
+        Paragraph("Цей розділ згенеровано нейромережею на основі вашої унікальної комбінації архетипів.", st["normal"]),
+        Spacer(1, 0.1 * inch),
+    ] + _markdown(font_name).flowables(strategy_content or "")
+
+
+# ---- assembly ----
+
+class _PageMarker(Flowable):
+    """Zero-size flowable that remembers the page it lands on (where a fragment gets spliced in)."""
+
+    def __init__(self):
+        super().__init__()
+        self.page = None
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.page = self.canv.getPageNumber()
+
+
+def _build(story: List[Flowable]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=MARGIN, leftMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN)
     doc.build(story)
     buffer.seek(0)
     return buffer
+
+
+def dominant_fragment(primary: List[str], archetype_info: Dict[str, Any], version: str, font_name: str) -> bytes:
+    """The dominant-archetypes pages as a standalone PDF, rendered once per (cluster, content version)."""
+    from reports.artifact_store import artifact_store
+
+    key = artifact_store.key_for("pdf-fragment", {
+        "section": "dominant", "primary": primary, "content": version,
+        "template": FRAGMENT_TEMPLATE_VERSION, "font": font_name,
+    })
+    data = artifact_store.get_bytes(key)
+    if data is None:
+        data = _build(_dominant(_styles(font_name), primary, archetype_info)).getvalue()
+        artifact_store.put(key, data, "fragment.pdf")
+    return data
+
+
+def _merge(dynamic: io.BytesIO, split_page: int, fragment: bytes) -> io.BytesIO:
+    from pypdf import PdfReader, PdfWriter
+
+    main = PdfReader(dynamic)
+    writer = PdfWriter()
+    for page in main.pages[:split_page]:
+        writer.add_page(page)
+    for page in PdfReader(io.BytesIO(fragment)).pages:
+        writer.add_page(page)
+    for page in main.pages[split_page:]:
+        writer.add_page(page)
+    if main.metadata:
+        writer.add_metadata(main.metadata)
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+
+def generate_pdf_report(
+    user_name: str,
+    user_phone: str,
+    meta_archetype_title: str,
+    scoring_data: Dict[str, Any],
+    strategy_content: str,
+    chart_buffer: io.BytesIO,
+    info_version: Optional[str] = None
+) -> io.BytesIO:
+    """
+    Generates a PRO 10-12 page style report (compacted for PDF usability).
+
+    With PDF_FRAGMENT_CACHE only the cover, the chart page and the strategy are
+    laid out per lead; the dominant-archetypes section is a cached fragment
+    spliced in between. `info_version` pins archetype_info.json to the
+    version the test started with.
+    """
+    archetype_info, version = load_report_info(info_version)
+    font_name = _register_font()
+    st = _styles(font_name)
+    primary = [a.value if hasattr(a, 'value') else str(a) for a in scoring_data.get('primary_cluster', [])]
+
+    head = _cover(st, user_name, user_phone, meta_archetype_title) + _wheel(st, chart_buffer, scoring_data, archetype_info)
+    if not settings.PDF_FRAGMENT_CACHE:
+        return _build(head + _dominant(st, primary, archetype_info) + _strategy(st, strategy_content, font_name))
+
+    fragment = dominant_fragment(primary, archetype_info, version, font_name)
+    marker = _PageMarker()
+    dynamic = _build(head + [marker] + _strategy(st, strategy_content, font_name))
+    return _merge(dynamic, marker.page - 1, fragment)
@@ -0,0 +1,334 @@
+"""
+Bulk report regeneration.
+
+After a change to data/archetype_info.json, the PDF template or the fallback
+strategy text, re-renders the reports of past leads without the bot:
+  - streams completed sessions from the DB in keyset-ordered chunks
+    (latest completed session per user; --all-sessions for every one)
+  - rescores them with ArchetypeEngine
+  - renders chart + PDF in a process pool
+  - writes the PDFs to --out, optionally e-mails them (--email) and
+    refreshes the artifact behind /report (--store)
+Progress is checkpointed after every chunk, so an interrupted run resumes
+where it stopped (--restart to start over).
+
+LLM text (--llm): "off" uses the local fallback strategy, "cache" reuses
+texts stored by earlier live runs (fallback on a miss), "live" calls the
+API on a miss and stores the answer.
+
+    python -m reports.regenerate --out ./regenerated [--llm off|cache|live] [--workers 4] [--email] [--store] [--tenant NAME]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import aliased, selectinload
+
+from core.archetype_info import build_fallback_strategy
+from core.config import settings
+from core.content import content_store
+from core.db_models import Session, User
+from core.models import ArchetypeType, UserAnswer, UserSession
+from adapters.db_repo import db_repo
+from adapters.norms import norms_store
+from adapters.telegram_bot.tenants import DEFAULT_TENANT, find_tenant
+from reports.artifact_store import artifact_store
+
+CHECKPOINT_FILE = "_checkpoint.json"
+DEFAULT_META_TITLE = "Архетипний Профіль"
+
+
+def render_report(job: Dict):
+    """Process-pool entry point: radar chart + PDF for one session. Returns (pdf bytes, render seconds)."""
+    from reports.chart_maker import create_radar_chart
+    from reports.pdf_generator import generate_pdf_report
+
+    started = time.perf_counter()
+    pdf_buf = generate_pdf_report(
+        user_name=job["user_name"],
+        user_phone=job["user_phone"],
+        meta_archetype_title=job["meta_archetype_title"],
+        scoring_data=job["scoring_data"],
+        strategy_content=job["strategy_content"],
+        chart_buffer=create_radar_chart(job["chart_scores"], job["scoring_data"].get("percentiles")),
+    )
+    return pdf_buf.getvalue(), time.perf_counter() - started
+
+
+class TextSource:
+    """LLM texts for the report according to --llm, cached in the artifact store."""
+
+    def __init__(self, mode: str, concurrency: int):
+        self.mode = mode
+        self.descriptions = content_store.knowledge_base().info
+        self.sem = asyncio.Semaphore(concurrency)
+        self.counts = {"cache_hits": 0, "llm_calls": 0, "llm_errors": 0, "fallbacks": 0}
+
+    async def _cached(self, kind: str, inputs, call):
+        key = artifact_store.key_for(kind, {"model": settings.OPENROUTER_MODEL, "inputs": inputs})
+        data = await asyncio.to_thread(artifact_store.get_bytes, key)
+        if data is not None:
+            self.counts["cache_hits"] += 1
+            return json.loads(data)
+        if self.mode != "live":
+            return None
+        try:
+            async with self.sem:
+                self.counts["llm_calls"] += 1
+                value = await call()
+        except Exception as e:
+            self.counts["llm_errors"] += 1
+            logging.warning(f"LLM {kind} failed: {e}")
+            return None
+        await asyncio.to_thread(artifact_store.put, key, json.dumps(value, ensure_ascii=False).encode("utf-8"), f"{kind}.json")
+        return value
+
+    async def strategy(self, scores: Dict[str, int]) -> str:
+        async def call():
+            from core.ai_service import ai_service  # needs API credentials: live mode only
+            return await ai_service.request_report_strategy(scores)
+
+        text = None
+        if self.mode != "off":
+            text = await self._cached("strategy", scores, call)
+        if text is None:
+            self.counts["fallbacks"] += 1
+            text = build_fallback_strategy(scores, self.descriptions)
+        return text
+
+    async def meta_title(self, primary: List[str]) -> str:
+        async def call():
+            from core.ai_service import ai_service
+            return await ai_service.request_meta_archetype(primary)
+
+        meta = None
+        if self.mode != "off":
+            meta = await self._cached("meta", primary, call)
+        return (meta or {}).get("title") or DEFAULT_META_TITLE
+
+
+def completed_sessions_query(after_id: int, all_sessions: bool, with_email: bool, limit: Optional[int] = None,
+                             tenant: Optional[str] = None):
+    stmt = (
+        select(Session, User)
+        .join(User, Session.user_id == User.id)
+        .where(Session.is_completed == True, Session.id > after_id)  # noqa: E712
+        .where(Session.tenant.is_(None) if tenant is None else Session.tenant == tenant)
+        .order_by(Session.id)
+    )
+    if limit:
+        stmt = stmt.options(selectinload(Session.answers)).limit(limit)
+    if with_email:
+        stmt = stmt.where(User.email.isnot(None), User.email != "")
+    if not all_sessions:
+        # Latest completed session per user: no newer completed one (ix_sessions_user_id)
+        newer = aliased(Session)
+        stmt = stmt.where(~exists().where(
+            newer.user_id == Session.user_id, newer.is_completed == True, newer.id > Session.id,  # noqa: E712
+            newer.tenant.is_(None) if tenant is None else newer.tenant == tenant,
+        ))
+    return stmt
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name or "report").strip("_") or "report"
+
+
+class Regenerator:
+    def __init__(self, args):
+        self.args = args
+        # Sessions are rescored with the bank of the bot that ran them, in the version they were answered on
+        self.tenant = find_tenant(args.tenant)
+        self.texts = TextSource(args.llm, args.llm_concurrency)
+        self.checkpoint_path = os.path.join(args.out, CHECKPOINT_FILE)
+        self.stats = {"sessions": 0, "rendered": 0, "render_errors": 0, "emailed": 0, "email_errors": 0}
+        self.render_seconds = 0.0
+
+    # --- checkpoint ---
+
+    def load_checkpoint(self) -> int:
+        if self.args.restart or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.stats.update(state.get("stats", {}))
+        return state.get("last_session_id", 0)
+
+    def save_checkpoint(self, last_id: int):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"last_session_id": last_id, "stats": self.stats, "updated_at": time.time()}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # --- per session ---
+
+    async def build_job(self, session: Session, user: User) -> Dict:
+        p_session = UserSession(
+            user_id=session.user_id,
+            started_at=session.started_at,
+            answers=[
+                UserAnswer(question_id=a.question_id, selected_option_id=a.selected_option_id, open_text_input=a.open_text_input)
+                for a in session.answers
+            ],
+        )
+        engine = self.tenant.engine_for(session.questions_version)
+        result = engine.calculate_scores(p_session)
+        result.questions_version = engine.version
+        # Reports are rebuilt with the current archetype_info.json: that is what regenerating is for
+        result.info_version = content_store.knowledge_base().version
+        scoring_data = result.model_dump(mode="json")
+        # Fixed archetype order: stable prompts and cache keys
+        scores = {a.value: scoring_data["archetype_scores"].get(a.value, 0) for a in ArchetypeType}
+        if self.tenant.default_bank and len(session.answers) >= len(engine.questions):
+            scoring_data["percentiles"] = await norms_store.percentiles(scores)
+        meta_title = DEFAULT_META_TITLE
+        if engine.needs_meta_archetype(result):
+            meta_title = await self.texts.meta_title([a.value for a in result.primary_cluster])
+        user_name = user.name or f"user{user.telegram_id}"
+        return {
+            "session_id": session.id,
+            "telegram_id": user.telegram_id,
+            "email": user.email,
+            "filename": f"Archetype_{safe_filename(user_name)}.pdf",
+            "user_name": user_name,
+            "user_phone": user.phone or "Не вказано",
+            "meta_archetype_title": meta_title,
+            "scoring_data": scoring_data,
+            "strategy_content": await self.texts.strategy(scores),
+            "chart_scores": scores,
+        }
+
+    async def deliver(self, job: Dict, pdf: bytes):
+        path = os.path.join(self.args.out, f"session-{job['session_id']}.pdf")
+        await asyncio.to_thread(self._write, path, pdf)
+        if self.args.store:
+            # /report re-delivers the regenerated file (new key, so no stale Telegram file_id)
+            key = artifact_store.key_for("pdf", {"regenerated": job["session_id"], "sha256": hashlib.sha256(pdf).hexdigest()})
+            await asyncio.to_thread(artifact_store.put, key, pdf, job["filename"])
+            await asyncio.to_thread(artifact_store.set_alias, self.tenant.scoped(f"last_report:{job['telegram_id']}"), key)
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    async def email_worker(self, queue: asyncio.Queue):
+        from core.email_service import send_report_email
+        while True:
+            job, pdf = await queue.get()
+            try:
+                ok = await send_report_email(
+                    to_email=job["email"],
+                    user_name=job["user_name"],
+                    user_phone=job["user_phone"],
+                    pdf=pdf,
+                    filename=job["filename"],
+                    notify_admin=False,
+                )
+                self.stats["emailed" if ok else "email_errors"] += 1
+            finally:
+                queue.task_done()
+
+    # --- main loop ---
+
+    async def run(self):
+        args = self.args
+        os.makedirs(args.out, exist_ok=True)
+        await db_repo.init_db()
+        last_id = self.load_checkpoint()
+        if last_id:
+            print(f"Resuming after session {last_id} ({self.stats['rendered']} already rendered)")
+
+        async with db_repo.async_session() as session:
+            total = (await session.execute(
+                select(func.count()).select_from(
+                    completed_sessions_query(last_id, args.all_sessions, args.email, tenant=self.tenant.db_name).subquery()
+                )
+            )).scalar()
+        print(f"{total} sessions to regenerate, {args.workers} render workers, llm={args.llm}")
+
+        email_queue: asyncio.Queue = asyncio.Queue(maxsize=args.chunk)
+        senders = [asyncio.create_task(self.email_worker(email_queue)) for _ in range(args.email_concurrency)] if args.email else []
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        done = 0
+
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=mp.get_context("spawn")) as pool:
+            while True:
+                async with db_repo.async_session() as session:
+                    rows = (await session.execute(
+                        completed_sessions_query(last_id, args.all_sessions, args.email, limit=args.chunk, tenant=self.tenant.db_name)
+                    )).all()
+                if not rows:
+                    break
+                jobs = await asyncio.gather(*(self.build_job(s, u) for s, u in rows))
+
+                async def render_and_deliver(job: Dict):
+                    try:
+                        pdf, seconds = await loop.run_in_executor(pool, render_report, job)
+                    except Exception as e:
+                        logging.error(f"Render failed for session {job['session_id']}: {e}")
+                        self.stats["render_errors"] += 1
+                        return
+                    self.render_seconds += seconds
+                    await self.deliver(job, pdf)
+                    self.stats["rendered"] += 1
+                    if args.email:
+                        await email_queue.put((job, pdf))
+
+                await asyncio.gather(*(render_and_deliver(job) for job in jobs))
+                if args.email:
+                    await email_queue.join()
+
+                # Only whole chunks are checkpointed: a crash re-renders at most one chunk
+                last_id = rows[-1][0].id
+                self.stats["sessions"] += len(rows)
+                self.save_checkpoint(last_id)
+                done += len(rows)
+                elapsed = time.perf_counter() - started
+                rate = done / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate else 0.0
+                print(f"  {done}/{total} sessions  {rate:.1f} reports/s  eta {eta:.0f}s  (last session {last_id})", flush=True)
+
+        for task in senders:
+            task.cancel()
+        elapsed = time.perf_counter() - started
+        print(f"Done in {elapsed:.1f}s: {self.stats}")
+        print(f"LLM texts: {self.texts.counts}")
+        if done:
+            print(f"Throughput {done / elapsed:.1f} reports/s; mean render {1000 * self.render_seconds / done:.0f} ms per report "
+                  f"(pool utilisation {100 * self.render_seconds / (elapsed * args.workers):.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m reports.regenerate")
+    parser.add_argument("--out", default="./regenerated", help="Directory for PDFs and the checkpoint file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Render processes")
+    parser.add_argument("--chunk", type=int, default=100, help="Sessions per DB chunk / checkpoint")
+    parser.add_argument("--llm", choices=["off", "cache", "live"], default="off")
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--all-sessions", action="store_true", help="Every completed session, not only the latest per user")
+    parser.add_argument("--email", action="store_true", help="E-mail each report to the lead (sessions without an e-mail are skipped)")
+    parser.add_argument("--email-concurrency", type=int, default=2)
+    parser.add_argument("--store", action="store_true", help="Make /report in the bot return the regenerated PDF")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Bot whose sessions to regenerate (multi-tenant mode)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(Regenerator(args).run())
+
+
+if __name__ == "__main__":
+    main()
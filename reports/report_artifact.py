@@ -0,0 +1,86 @@
+import io
+import mmap
+import os
+import tempfile
+from typing import Iterator, Optional, Union
+
+from core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ReportArtifact:
+    """
+    One rendered report, shared read-only by every consumer (Telegram upload,
+    user + admin e-mail, artifact store) without copying its bytes.
+
+    Reports up to REPORT_SPOOL_MB stay in memory behind a memoryview.
+    Bigger ones are spooled to a temp file (or opened from the artifact store)
+    and memory-mapped, so slow deliveries don't pin them in process memory.
+    Call close() (or use `with`) once every consumer is done.
+    """
+
+    def __init__(self, view: memoryview, filename: str, file=None, mapped: Optional[mmap.mmap] = None):
+        self.view = view
+        self.filename = filename
+        self._file = file
+        self._map = mapped
+
+    @staticmethod
+    def _spool_limit() -> int:
+        return settings.REPORT_SPOOL_MB * 1024 * 1024
+
+    @classmethod
+    def from_buffer(cls, data: Union[bytes, bytearray, memoryview, io.BytesIO], filename: str) -> "ReportArtifact":
+        # BytesIO.getbuffer() exposes the rendered buffer itself; getvalue() would copy it
+        view = data.getbuffer() if isinstance(data, io.BytesIO) else memoryview(data)
+        if view.nbytes <= cls._spool_limit():
+            return cls(view.toreadonly(), filename)
+        spool = tempfile.TemporaryFile(prefix="report-")
+        spool.write(view)
+        spool.flush()
+        view.release()
+        return cls._mapped(spool, filename)
+
+    @classmethod
+    def from_file(cls, path: str, filename: str) -> "ReportArtifact":
+        if os.path.getsize(path) <= cls._spool_limit():
+            with open(path, "rb") as f:
+                return cls(memoryview(f.read()).toreadonly(), filename)
+        return cls._mapped(open(path, "rb"), filename)
+
+    @classmethod
+    def _mapped(cls, file, filename: str) -> "ReportArtifact":
+        if os.fstat(file.fileno()).st_size == 0:
+            file.close()
+            return cls(memoryview(b""), filename)
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(memoryview(mapped), filename, file, mapped)
+
+    @property
+    def size(self) -> int:
+        return self.view.nbytes
+
+    @property
+    def spooled(self) -> bool:
+        return self._map is not None
+
+    def chunks(self, size: int = CHUNK_SIZE) -> Iterator[memoryview]:
+        for start in range(0, self.view.nbytes, size):
+            yield self.view[start:start + size]
+
+    def close(self):
+        try:
+            self.view.release()
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            return  # a consumer still holds a slice; GC closes the map later
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,165 @@
+"""
+Offline check of the adaptive (early-stopping) test mode.
+
+Simulates respondents with a random preference over archetypes, runs the
+adaptive question loop (ArchetypeEngine.pick_next / is_settled) and then lets
+the same respondent answer the skipped questions. The primary/secondary
+clusters of the early result must equal those of the full test.
+
+--export-check also writes the early-stopped sessions (plus full-length and
+abandoned ones) to a temporary SQLite database, runs the analytics export
+and report on it and checks that adaptive stops count as completed tests,
+not drop-offs, and stay out of the norms.
+
+    python tools/adaptive_sim.py [--users 2000] [--min-questions 12] [--concentration 0.5] [--scope clusters|primary]
+    python tools/adaptive_sim.py --export-check [--users 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.append(os.getcwd())
+
+from core.engine import ArchetypeEngine
+from core.models import ArchetypeType
+
+
+def simulate(engine: ArchetypeEngine, rng: random.Random, min_questions: int, concentration: float, informative: bool, scope: str):
+    secondary = scope == "clusters"
+    # Gamma draws -> Dirichlet preference; low concentration = more decided respondents
+    prefs = {a: rng.gammavariate(concentration, 1.0) for a in ArchetypeType}
+
+    def answer(q_id: int) -> str:
+        options = [o for o in engine.questions[q_id].options if o.archetype]
+        return rng.choices([o.id for o in options], weights=[prefs[o.archetype] + 1e-9 for o in options])[0]
+
+    order = list(engine.questions.keys())
+    rng.shuffle(order)
+    scores = defaultdict(int)
+    picks = []
+    asked = 0
+    while asked < len(order):
+        remaining = order[asked:]
+        if informative and asked >= min_questions:
+            nxt = engine.pick_next(scores, remaining, secondary)
+            i = order.index(nxt, asked)
+            order[asked], order[i] = order[i], order[asked]
+        picks.append((order[asked], answer(order[asked])))
+        arch, pts = engine.option_score(*picks[-1])
+        if arch:
+            scores[arch] += pts
+        asked += 1
+        if asked >= min_questions and engine.is_settled(scores, order[asked:], secondary):
+            break
+
+    early = engine.process_results(dict(scores))
+    for q_id in order[asked:]:
+        arch, pts = engine.option_score(q_id, answer(q_id))
+        if arch:
+            scores[arch] += pts
+    full = engine.process_results(dict(scores))
+    same = set(early.primary_cluster) == set(full.primary_cluster)
+    if secondary:
+        same = same and set(early.secondary_cluster) == set(full.secondary_cluster)
+    return asked, same, picks
+
+
+def check_export(engine: ArchetypeEngine, args) -> int:
+    """Adaptive sessions through analytics export -> report -> norms; returns the number of failed checks."""
+    from sqlalchemy import create_engine, insert
+
+    from analytics.aggregates import QuestionTables, compute_aggregates
+    from analytics.export import export, read_table
+    from analytics.norms import norm_bins
+    from core.db_models import Answer, Base, Session, User
+
+    tmp = tempfile.mkdtemp(prefix="adaptive-export-")
+    url = f"sqlite:///{os.path.join(tmp, 'bot.db')}"
+    rng = random.Random(args.seed)
+    done_at = datetime.utcnow() - timedelta(hours=1)  # past the export settle time
+    sessions, answers = [], []
+    expected = {"completed": 0, "adaptive_stops": 0, "abandoned": 0}
+    for sid in range(1, args.users + 1):
+        asked, _, picks = simulate(engine, rng, args.min_questions, args.concentration, True, args.scope)
+        if sid % 5 == 0:  # every fifth respondent leaves halfway
+            picks, completed = picks[:len(picks) // 2], False
+            expected["abandoned"] += 1
+        else:
+            completed = True
+            expected["completed"] += 1
+            expected["adaptive_stops"] += asked < len(engine.questions)
+        sessions.append({"id": sid, "user_id": sid, "started_at": done_at, "is_completed": completed,
+                         "completed_at": done_at if completed else None})
+        answers += [{"session_id": sid, "question_id": q, "selected_option_id": o} for q, o in picks]
+
+    db = create_engine(url)
+    Base.metadata.create_all(db)
+    with db.begin() as conn:
+        conn.execute(insert(User), [{"id": s["id"], "telegram_id": s["id"]} for s in sessions])
+        conn.execute(insert(Session), sessions)
+        conn.execute(insert(Answer), answers)
+    db.dispose()
+
+    out = os.path.join(tmp, "analytics")
+    export(url, out)
+    ans, sess = read_table(out, "answers"), read_table(out, "sessions")
+    tables = QuestionTables(engine)
+    report = compute_aggregates(ans, sess, read_table(out, "users"), tables)
+    full = expected["completed"] - expected["adaptive_stops"]
+    norm_samples = min((sum(c.values()) for c in norm_bins(ans, sess, tables).values()), default=0)
+
+    checks = {
+        "completed tests": (report["funnel"]["completed"], expected["completed"]),
+        "adaptive stops": (report["adaptive_stops"], expected["adaptive_stops"]),
+        "drop-offs": (sum(report["dropoff_by_answers"]), expected["abandoned"]),
+        "full-length tests in norms": (norm_samples, full),
+    }
+    failures = 0
+    print(f"\nexport check ({tmp}):")
+    for name, (got, want) in checks.items():
+        ok = got == want
+        failures += not ok
+        print(f"  {name:<28}{got:>6} (expected {want}){'' if ok else '  MISMATCH'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--min-questions", type=int, default=12)
+    parser.add_argument("--concentration", type=float, default=0.5)
+    parser.add_argument("--scope", choices=["clusters", "primary"], default="clusters",
+                        help="What must be settled before stopping (ADAPTIVE_SCOPE)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--export-check", action="store_true",
+                        help="Run adaptive sessions through the analytics export and report")
+    args = parser.parse_args()
+
+    engine = ArchetypeEngine()
+    if args.export_check:
+        return 1 if check_export(engine, args) else 0
+    total = len(engine.questions)
+    failures = 0
+    for informative in (False, True):
+        rng = random.Random(args.seed)
+        asked, mismatches = [], 0
+        for _ in range(args.users):
+            n, same, _ = simulate(engine, rng, args.min_questions, args.concentration, informative, args.scope)
+            asked.append(n)
+            mismatches += not same
+        stopped = sum(1 for n in asked if n < total)
+        label = "informative order" if informative else "shuffled order   "
+        print(f"{label}: mean {statistics.mean(asked):.1f}/{total} questions, "
+              f"median {statistics.median(asked):.0f}, stopped early {100 * stopped / len(asked):.1f}%, "
+              f"cluster mismatches {mismatches}")
+        failures += mismatches
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Throughput of the strategy markdown converter (reports/markdown.py) vs the
+old line loop in generate_pdf_report.
+
+Inputs are well-formed texts that the old loop can render as well: LLM-like
+strategies of --strategy-chars and the knowledge-base fallback strategy for
+random top archetypes. Reported per text:
+  - parse:      markdown -> blocks only (memoization bypassed)
+  - flowables:  text -> flowables, as generate_pdf_report calls it (cache cold / warm)
+  - layout:     flowables laid out into a PDF
+The old loop builds its Paragraphs directly, so its "flowables" column
+covers both steps.
+
+    python tools/bench_markdown.py [--texts 200] [--strategy-chars 6000]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+
+def timed(fn, items):
+    ms = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        ms.append((time.perf_counter() - started) * 1000)
+    return ms
+
+
+def main(args):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+    from core.archetype_info import build_fallback_strategy, load_archetype_info
+    from reports import pdf_generator
+    from reports.markdown import parse
+    from tools.bench_pdf_assembly import strategy_text
+    from tools.fuzz_markdown import legacy_story
+
+    font = pdf_generator._register_font()
+    st = pdf_generator._styles(font)
+    renderer = pdf_generator._markdown(font)
+    rng = random.Random(args.seed)
+    info = load_archetype_info()
+    keys = list(info)
+
+    corpora = {
+        "llm": [strategy_text(args.strategy_chars, rng) for _ in range(args.texts)],
+        # The fallback depends only on the top 3 archetypes: few distinct texts, repeated
+        "fallback": [build_fallback_strategy({k: rng.randint(1, 30) for k in rng.sample(keys[:5], 3)}, info)
+                     for _ in range(args.texts)],
+    }
+
+    def layout(story):
+        doc = SimpleDocTemplate(io.BytesIO(), pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
+        doc.build(story)
+
+    print(f"{'corpus':<10}{'converter':<11}{'parse us':>10}{'flowables us':>14}{'warm us':>9}{'layout ms':>11}{'MB/s':>7}")
+    for name, texts in corpora.items():
+        chars = statistics.mean(len(t) for t in texts)
+        distinct = len(set(texts))
+
+        old = statistics.median(timed(lambda t: legacy_story(t, st), texts))
+        old_layout = statistics.median(timed(lambda t: layout(legacy_story(t, st)), texts[:50]))
+        print(f"{name:<10}{'old loop':<11}{'-':>10}{old * 1000:>14.0f}{'-':>9}{old_layout:>11.1f}{chars / old / 1000:>7.2f}")
+
+        parse_ms = statistics.median(timed(parse.__wrapped__, texts))
+        parse.cache_clear()
+        cold = statistics.median(timed(renderer.flowables, texts))
+        warm = statistics.median(timed(renderer.flowables, texts))
+        new_layout = statistics.median(timed(lambda t: layout(renderer.flowables(t)), texts[:50]))
+        print(f"{'':<10}{'markdown':<11}{parse_ms * 1000:>10.0f}{cold * 1000:>14.0f}{warm * 1000:>9.0f}{new_layout:>11.1f}"
+              f"{chars / cold / 1000:>7.2f}   ({distinct} distinct texts, ~{chars:.0f} chars)")
+    cache = parse.cache_info()
+    print(f"\nparse cache: {cache.hits} hits / {cache.misses} misses")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=200)
+    parser.add_argument("--strategy-chars", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
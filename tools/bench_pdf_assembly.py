@@ -0,0 +1,123 @@
+"""
+PDF report layout: one monolithic pass vs cached dominant-section fragments.
+
+Simulated respondents are scored with ArchetypeEngine and get a radar chart
+and a markdown strategy of --strategy-chars. Each report is then rendered
+three ways with generate_pdf_report:
+  - monolithic: PDF_FRAGMENT_CACHE=false, everything laid out per report
+  - cold:       fragment cache starts empty (first report of each cluster renders it)
+  - warm:       same reports again, every fragment already cached
+Charts are rendered up front, so only the PDF step is timed. Every assembled
+report is checked against the monolithic one: same page count, same text
+on every page.
+
+    python tools/bench_pdf_assembly.py [--profiles 60] [--strategy-chars 6000]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.append(os.getcwd())
+
+
+def profiles(count: int, seed: int):
+    from core.engine import ArchetypeEngine
+    engine = ArchetypeEngine()
+    rng = random.Random(seed)
+    for _ in range(count):
+        prefs = {}
+        scores = Counter()
+        for q in engine.questions.values():
+            options = [o for o in q.options if o.archetype]
+            for o in options:
+                prefs.setdefault(o.archetype, rng.gammavariate(0.5, 1.0))
+            pick = rng.choices(options, weights=[prefs[o.archetype] + 1e-9 for o in options])[0]
+            scores[pick.archetype] += pick.points
+        yield ArchetypeEngine.process_results(dict(scores))
+
+
+def strategy_text(chars: int, rng: random.Random) -> str:
+    words = "бренд стратегія голос аудиторія цінність довіра візуал позиціонування ріст сила тінь".split()
+    parts = []
+    while sum(len(p) for p in parts) < chars:
+        parts.append(f"## {rng.choice(words).capitalize()} {rng.choice(words)}")
+        parts.append("**" + rng.choice(words) + "**: " + " ".join(rng.choices(words, k=60)) + ".")
+        parts += [f"- {' '.join(rng.choices(words, k=12))}" for _ in range(3)]
+        parts.append("")
+    return "\n".join(parts)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def page_texts(data: bytes):
+    from pypdf import PdfReader
+    return [page.extract_text() for page in PdfReader(io.BytesIO(data)).pages]
+
+
+def main(args):
+    os.environ["ARTIFACT_DIR"] = tempfile.mkdtemp(prefix="bench-pdf-")
+    from core.config import settings
+    from reports.chart_maker import create_radar_chart
+    from reports import pdf_generator
+
+    rng = random.Random(args.seed)
+    jobs = []
+    for result in profiles(args.profiles, args.seed):
+        scoring = result.model_dump()
+        chart = create_radar_chart(scoring["archetype_scores"]).getvalue()
+        jobs.append((scoring, strategy_text(args.strategy_chars, rng), chart))
+
+    def render(job):
+        scoring, strategy, chart = job
+        started = time.perf_counter()
+        pdf = pdf_generator.generate_pdf_report("Тест", "+380000000000", "Бенчмарк", scoring, strategy, io.BytesIO(chart))
+        return (time.perf_counter() - started) * 1000, pdf.getvalue()
+
+    render(jobs[0])  # font registration, imports
+    settings.PDF_FRAGMENT_CACHE = False
+    render(jobs[0])
+
+    results = {}
+    outputs = {}
+    for mode in ("monolithic", "cold", "warm"):
+        settings.PDF_FRAGMENT_CACHE = mode != "monolithic"
+        ms, sizes, outputs[mode] = [], [], []
+        for job in jobs:
+            elapsed, data = render(job)
+            ms.append(elapsed)
+            sizes.append(len(data))
+            outputs[mode].append(data)
+        results[mode] = (ms, sizes)
+
+    mismatches = 0
+    for mode in ("cold", "warm"):
+        for mono, assembled in zip(outputs["monolithic"], outputs[mode]):
+            if page_texts(mono) != page_texts(assembled):
+                mismatches += 1
+
+    clusters = len({tuple(a for a in s["primary_cluster"]) for s, _, _ in jobs})
+    print(f"{args.profiles} reports, {clusters} distinct primary clusters, strategy ~{args.strategy_chars} chars\n")
+    print(f"{'mode':<12}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'avg KB':>9}")
+    for mode, (ms, sizes) in results.items():
+        print(f"{mode:<12}{pct(ms, 0.5):>9.1f}{pct(ms, 0.95):>9.1f}{statistics.mean(ms):>9.1f}{statistics.mean(sizes) / 1024:>9.1f}")
+    base = statistics.mean(results["monolithic"][0])
+    for mode in ("cold", "warm"):
+        print(f"\n{mode}: {100 * (statistics.mean(results[mode][0]) / base - 1):+.1f}% time per report vs monolithic", end="")
+    print(f"\n\nassembled reports differing from monolithic (page count / text): {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=60)
+    parser.add_argument("--strategy-chars", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,115 @@
+"""
+Strategy prompt: the old all-archetypes prompt vs the token-budgeted builder.
+
+Simulated respondents are scored with ArchetypeEngine, then each profile's
+strategy is requested twice from a local OpenAI-compatible stub (FakeLLM):
+once with the legacy prompt, once with core/prompt_builder.py. The stub's
+latency grows with prompt size (--prefill-ms per 1k tokens). Both requests
+go through AIService._complete, so the reported token counts are the ones
+the bot records per call.
+
+    python tools/bench_prompt.py [--profiles 200] [--budget 600] [--latency-ms 50] [--prefill-ms 400]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.getcwd())
+
+
+def legacy_messages(scores, descriptions):
+    # The pre-builder request_report_strategy prompt
+    context_str = "\n".join([f"{k}: {v.get('title')} - {v.get('core_desire')}" for k, v in descriptions.items()])
+    prompt = (
+        f"Archetype Scores: {scores}. \n"
+        f"Archetype Context:\n{context_str}\n\n"
+        "Завдання: Створіть професійну маркетингову та брендингову стратегію для клієнта на основі його балів архетипів. "
+        "Зверніть увагу на комбінацію домінантних архетипів (тих, що мають найвищі бали).\n\n"
+        "Звіт ПОВИНЕН містити:\n"
+        "1. **Глибинний аналіз комбінації**: Як ваші архетипи взаємодіють між собою? Яку унікальну 'суперсилу' вони дають?\n"
+        "2. **Ваш Тіньовий аспект**: Чого варто остерігатися (слабкі місця).\n"
+        "3. **Маркетингова стратегія (Plan)**: Конкретні кроки з позиціонування, вибору голосу бренду (Tone of Voice) та візуального стилю.\n"
+        "4. **Рекомендації для росту**: Як масштабувати свій вплив, використовуючи ці архетипи.\n\n"
+        "Мова: Українська. Форматування: Markdown (заголовки ##, списки)."
+    )
+    return [
+        {"role": "system", "content": "Ви — експерт з брендингу, психології архетипів та стратегічного маркетингу. Створюйте контент, який виглядає як дорогий консалтинговий звіт."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def profiles(count: int, seed: int):
+    from core.engine import ArchetypeEngine
+    engine = ArchetypeEngine()
+    rng = random.Random(seed)
+    for _ in range(count):
+        prefs = {}
+        scores = Counter()
+        for q in engine.questions.values():
+            options = [o for o in q.options if o.archetype]
+            for o in options:
+                prefs.setdefault(o.archetype, rng.gammavariate(0.5, 1.0))
+            pick = rng.choices(options, weights=[prefs[o.archetype] + 1e-9 for o in options])[0]
+            scores[pick.archetype.value] += pick.points
+        yield dict(scores)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main(args):
+    from tools.loadtest.fake_llm import FakeLLM
+
+    llm = FakeLLM(latency_ms=args.latency_ms, jitter_ms=0, prompt_ms_per_1k_tokens=args.prefill_ms)
+    os.environ.update(OPENROUTER_BASE_URL=await llm.start(), OPENROUTER_API_KEY="sk-bench",
+                      STRATEGY_PROMPT_TOKEN_BUDGET=str(args.budget))
+    from core.ai_service import ai_service
+    from core.prompt_builder import estimate_tokens
+
+    results = {"legacy": {"est": [], "prompt": [], "completion": [], "ms": []},
+               "budgeted": {"est": [], "prompt": [], "completion": [], "ms": []}}
+    build_us, levels = [], Counter()
+    try:
+        for scores in profiles(args.profiles, args.seed):
+            started = time.perf_counter()
+            prompt = ai_service.prompts.build(scores)
+            build_us.append((time.perf_counter() - started) * 1e6)
+            levels[prompt.detail_level] += 1
+            legacy = legacy_messages(scores, ai_service.prompts.descriptions)
+            for mode, messages in (("legacy", legacy), ("budgeted", prompt.messages)):
+                await ai_service._complete(mode, messages)
+                call = ai_service.calls[-1]
+                r = results[mode]
+                r["est"].append(sum(estimate_tokens(m["content"]) for m in messages))
+                r["prompt"].append(call["prompt_tokens"])
+                r["completion"].append(call["completion_tokens"])
+                r["ms"].append(call["latency_ms"])
+    finally:
+        await llm.stop()
+
+    print(f"{args.profiles} profiles, budget {args.budget} est. tokens, stub {args.latency_ms:.0f}ms + {args.prefill_ms:.0f}ms/1k prompt tokens\n")
+    print(f"{'prompt':<10}{'est tok':>9}{'max':>6}{'api prompt':>12}{'completion':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{statistics.mean(r['est']):>9.0f}{max(r['est']):>6}{statistics.mean(r['prompt']):>12.0f}"
+              f"{statistics.mean(r['completion']):>12.0f}{pct(r['ms'], 0.5):>9.1f}{pct(r['ms'], 0.95):>9.1f}")
+    saved = 1 - sum(results["budgeted"]["prompt"]) / sum(results["legacy"]["prompt"])
+    print(f"\nprompt tokens saved: {100 * saved:.1f}%   over budget: {sum(1 for e in results['budgeted']['est'] if e > args.budget)}")
+    print(f"build: p50 {pct(build_us, 0.5):.0f}us p95 {pct(build_us, 0.95):.0f}us; detail levels {dict(sorted(levels.items()))}; "
+          f"profile cache hits {ai_service.prompts.cache_hits}/{ai_service.prompts.cache_hits + ai_service.prompts.cache_misses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=600, help="STRATEGY_PROMPT_TOKEN_BUDGET")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fixed stub latency per call")
+    parser.add_argument("--prefill-ms", type=float, default=400.0, help="Extra stub latency per 1k prompt tokens")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
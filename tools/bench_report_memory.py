@@ -0,0 +1,160 @@
+"""
+Peak memory of report delivery: legacy copies vs the shared ReportArtifact.
+
+Each mode runs in a fresh subprocess that "renders" N reports of --size-mb
+at once (BytesIO, like generate_pdf_report), stores them in the artifact
+store, uploads them to a fake Bot API and e-mails them (user + admin copy)
+to an SMTP sink. The fake servers run in this parent process, so their
+buffers don't count. Reported: peak RSS growth over the post-import
+baseline, per concurrent report.
+
+    python tools/bench_report_memory.py [--reports 8] [--size-mb 2,8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.getcwd())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+# ---------------- child ----------------
+
+async def legacy_email(to_email: str, pdf_buf, filename: str):
+    # The pre-ReportArtifact send_report_email (plain relay branch)
+    import aiosmtplib
+    from email.message import EmailMessage
+    from core.config import settings
+
+    message = EmailMessage()
+    message["From"] = settings.SMTP_USER
+    message["To"] = to_email
+    message["Subject"] = "Ваша стратегія Архетипів"
+    message.set_content("Вітаємо!")
+    pdf_buf.seek(0)
+    message.add_attachment(pdf_buf.read(), maintype="application", subtype="pdf", filename=filename)
+    kw = dict(hostname=settings.SMTP_HOST, port=settings.SMTP_PORT, username=settings.SMTP_USER,
+              password=settings.SMTP_PASSWORD, use_tls=False, start_tls=False, timeout=60)
+    await aiosmtplib.send(message, **kw)
+    admin_msg = EmailMessage()
+    admin_msg["From"] = settings.SMTP_USER
+    admin_msg["To"] = settings.ADMIN_EMAIL
+    admin_msg["Subject"] = "Новий Ліда"
+    admin_msg.set_content("Користувач завершив тест!")
+    admin_msg.add_attachment(message.get_payload()[1].get_content(), maintype="application", subtype="pdf", filename=filename)
+    await aiosmtplib.send(admin_msg, **kw)
+
+
+async def child(mode: str, reports: int, size_mb: float):
+    import io
+    from aiogram.types import BufferedInputFile
+    from adapters.telegram_bot.main import create_bot
+    from adapters.telegram_bot.handlers import ArtifactInputFile
+    from core.email_service import PDFAttachment, send_report_email
+    from reports.artifact_store import artifact_store
+    from reports.report_artifact import ReportArtifact
+
+    bot = create_bot()
+    await bot.get_me()  # warm the HTTP session
+    baseline = current_rss_mb()
+    size = int(size_mb * 2**20)
+
+    def render(i: int) -> io.BytesIO:
+        buf = io.BytesIO()
+        for _ in range(0, size, 2**20):
+            buf.write(os.urandom(min(2**20, size)))  # written piecewise, like reportlab
+        return buf
+
+    async def legacy(i: int):
+        pdf_buf = render(i)
+        pdf_data = pdf_buf.getvalue()
+        await asyncio.to_thread(artifact_store.put, f"bench-{i}", pdf_data, "r.pdf")
+        await bot.send_document(1, BufferedInputFile(pdf_data, filename="r.pdf"))
+        await legacy_email(f"user{i}@example.com", io.BytesIO(pdf_data), "r.pdf")
+
+    async def shared(i: int):
+        artifact = ReportArtifact.from_buffer(render(i), "r.pdf")
+        try:
+            await asyncio.to_thread(artifact_store.put, f"bench-{i}", artifact.view, "r.pdf")
+            await bot.send_document(1, ArtifactInputFile(artifact, "r.pdf"))
+            await send_report_email(f"user{i}@example.com", "User", "+380", PDFAttachment(artifact.view, "r.pdf"), "r.pdf")
+        finally:
+            artifact.close()
+
+    run = legacy if mode == "legacy" else shared
+    await asyncio.gather(*(run(i) for i in range(reports)))
+    await bot.session.close()
+    peak = rss_mb() - baseline
+    print(json.dumps({"mode": mode, "peak_mb": peak, "per_report_mb": peak / reports}))
+
+
+# ---------------- parent ----------------
+
+async def parent(args):
+    from tools.loadtest.fake_bot_api import FakeBotAPI
+    from tools.loadtest.smtp_sink import SMTPSink
+
+    api_port, smtp_port = free_port(), free_port()
+    api = FakeBotAPI("123456:BENCH")
+    smtp = SMTPSink()
+    await api.start(port=api_port)
+    await smtp.start(port=smtp_port)
+    env = dict(os.environ,
+               BOT_TOKEN="123456:BENCH", OPENROUTER_API_KEY="sk-bench", TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+               SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp_port), SMTP_USE_TLS="false",
+               SMTP_USER="bench@example.com", SMTP_PASSWORD="x", ADMIN_EMAIL="admin@example.com",
+               DATABASE_URL=f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+    print(f"{'size':>8}{'mode':>8}{'peak MB':>10}{'MB/report':>11}  (x report size)")
+    try:
+        for size_mb in args.size_mb:
+            for mode in ("legacy", "shared"):
+                env["ARTIFACT_DIR"] = tempfile.mkdtemp(prefix="bench-artifacts-")
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, __file__, "--child", mode, "--reports", str(args.reports), "--size-mb", str(size_mb),
+                    env=env, stdout=subprocess.PIPE,
+                )
+                out, _ = await proc.communicate()
+                result = json.loads(out.decode().strip().splitlines()[-1])
+                print(f"{size_mb:>6.1f}MB{mode:>8}{result['peak_mb']:>10.1f}{result['per_report_mb']:>11.1f}"
+                      f"  ({result['per_report_mb'] / size_mb:.1f}x)")
+    finally:
+        await api.stop()
+        await smtp.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=8, help="Concurrent reports")
+    parser.add_argument("--size-mb", type=lambda v: [float(x) for x in v.split(",")], default=[2.0, 8.0])
+    parser.add_argument("--child", choices=["legacy", "shared"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        import logging
+        logging.disable(logging.WARNING)
+        asyncio.run(child(args.child, args.reports, args.size_mb[0]))
+    else:
+        asyncio.run(parent(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Checks the content hot reload (core/content.py) on copies of the data files.
+
+- a changed questions.json / archetype_info.json becomes current after reload()
+- a test pinned to the old version still gets the old questions and info
+- an invalid file is rejected and the current version keeps serving
+- a fresh process (new ContentStore) restores the old version from its snapshot
+- the reload does not stall the event loop (heartbeat lag while reloading)
+
+    python tools/check_content_reload.py
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+WORKDIR = tempfile.mkdtemp(prefix="content-reload-")
+os.environ["ARTIFACT_DIR"] = os.path.join(WORKDIR, "artifacts")
+
+from core.content import ContentStore  # noqa: E402
+
+DATA_DIR = os.path.join(os.getcwd(), "data")
+
+
+def write_json(path: str, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    # mtime granularity: make sure the stamp changes even within one tick
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+async def max_lag_while(coro, interval: float = 0.005) -> float:
+    """Runs `coro` next to a heartbeat; returns the worst heartbeat delay (ms)."""
+    worst = 0.0
+    done = False
+
+    async def beat():
+        nonlocal worst
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            worst = max(worst, (time.perf_counter() - start - interval) * 1000)
+
+    task = asyncio.create_task(beat())
+    await asyncio.sleep(interval * 2)
+    result = await coro
+    done = True
+    await task
+    return worst, result
+
+
+async def run() -> int:
+    questions_path = os.path.join(WORKDIR, "questions.json")
+    info_path = os.path.join(WORKDIR, "archetype_info.json")
+    shutil.copy(os.path.join(DATA_DIR, "questions.json"), questions_path)
+    shutil.copy(os.path.join(DATA_DIR, "archetype_info.json"), info_path)
+
+    store = ContentStore(info_path)
+    failures = 0
+
+    def check(ok: bool, label: str):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+
+    v1 = store.engine(questions_path)
+    kb1 = store.knowledge_base()
+    first_id = next(iter(v1.questions))
+    old_text = v1.questions[first_id].text
+
+    started = time.perf_counter()
+    check(await store.reload() == [], "unchanged files: nothing reloaded")
+    idle_ms = (time.perf_counter() - started) * 1000
+
+    questions = json.load(open(questions_path, encoding="utf-8"))
+    questions[0]["text"] = "Змінене питання"
+    write_json(questions_path, questions)
+    info = json.load(open(info_path, encoding="utf-8"))
+    info["Hero"]["title"] = "Герой 2.0"
+    write_json(info_path, info)
+
+    lag_ms, changes = await max_lag_while(store.reload())
+    v2 = store.engine(questions_path)
+    check(len(changes) == 2 and v2.version != v1.version, f"both files reloaded: {changes}")
+    check(v2.questions[first_id].text == "Змінене питання", "new tests get the new questions")
+    check(store.engine(questions_path, v1.version).questions[first_id].text == old_text, "pinned test keeps its questions")
+    check(store.knowledge_base(kb1.version).info["Hero"]["title"] != "Герой 2.0", "pinned test keeps its archetype info")
+    check(store.knowledge_base().info["Hero"]["title"] == "Герой 2.0", "new tests get the new archetype info")
+    check(lag_ms < 50, f"event loop not blocked by the reload (worst heartbeat delay {lag_ms:.1f} ms)")
+
+    broken = [dict(questions[0], options=[])] + questions[1:]
+    write_json(questions_path, broken)
+    changes = await store.reload()
+    check(store.engine(questions_path).version == v2.version and "rejected" in changes[0], f"invalid bank rejected: {changes}")
+    with open(info_path, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    changes = await store.reload()
+    check(store.knowledge_base().info["Hero"]["title"] == "Герой 2.0", "invalid knowledge base rejected")
+
+    fresh = ContentStore(info_path=os.path.join(DATA_DIR, "archetype_info.json"))
+    fresh.engine(os.path.join(DATA_DIR, "questions.json"))
+    restored = fresh.engine(os.path.join(DATA_DIR, "questions.json"), v2.version)
+    check(restored.version == v2.version and fresh.stats["restored"] == 1, "new process restores an old version from its snapshot")
+    fresh.engine(os.path.join(DATA_DIR, "questions.json"), "0000000000000000")
+    check(fresh.stats["missing"] == 1, "unknown version falls back to the current one")
+
+    print(f"\nreload check with no changes: {idle_ms:.2f} ms; stats: {store.stats}")
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
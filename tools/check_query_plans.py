@@ -0,0 +1,79 @@
+"""
+Checks that the hot DB queries use indexes (SQLite EXPLAIN QUERY PLAN).
+
+Builds a database with the pre-migration schema (no answer/session
+indexes, duplicate answers), runs DBRepo.init_db so the migrations
+apply, then asserts that none of the hot queries fall back to a table scan.
+
+    python tools/check_query_plans.py
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.append(os.getcwd())
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "plans.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite as sqlite_dialect
+
+from core.db_models import Answer, Session
+
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER UNIQUE, name VARCHAR, email VARCHAR, phone VARCHAR, created_at DATETIME);
+CREATE TABLE sessions (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), started_at DATETIME, is_completed BOOLEAN);
+CREATE TABLE answers (id INTEGER PRIMARY KEY, session_id INTEGER REFERENCES sessions(id), question_id INTEGER, selected_option_id VARCHAR(1), open_text_input TEXT);
+"""
+
+HOT_QUERIES = {
+    # DBRepo.save_answer conflict target (and the legacy existence check)
+    "save_answer lookup": select(Answer).where(Answer.session_id == 1, Answer.question_id == 1),
+    # selectinload(Session.answers) in get_session_with_answers
+    "session answers (selectin)": select(Answer).where(Answer.session_id.in_([1, 2, 3])),
+    # sessions of a user
+    "sessions by user": select(Session).where(Session.user_id == 1),
+}
+
+
+def sql_of(stmt) -> str:
+    return str(stmt.compile(dialect=sqlite_dialect.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def main() -> int:
+    conn = sqlite3.connect(DB_PATH)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO users (id, telegram_id) VALUES (1, 1)")
+    conn.execute("INSERT INTO sessions (id, user_id, is_completed) VALUES (1, 1, 0)")
+    conn.executemany(
+        "INSERT INTO answers (session_id, question_id, selected_option_id) VALUES (?, ?, ?)",
+        [(1, 1, "A"), (1, 1, "B"), (1, 2, "C")],  # duplicate answer for question 1
+    )
+    conn.commit()
+    conn.close()
+
+    from adapters.db_repo import db_repo
+    asyncio.run(db_repo.init_db())
+
+    conn = sqlite3.connect(DB_PATH)
+    failures = 0
+    dupes = conn.execute("SELECT COUNT(*) FROM answers WHERE session_id = 1 AND question_id = 1").fetchone()[0]
+    if dupes != 1:
+        print(f"FAIL duplicate answers not collapsed by migration ({dupes} rows)")
+        failures += 1
+
+    for name, stmt in HOT_QUERIES.items():
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql_of(stmt))]
+        scans = [step for step in plan if step.startswith("SCAN")]
+        status = "FAIL" if scans else "ok  "
+        failures += bool(scans)
+        print(f"{status} {name}: {' | '.join(plan)}")
+    conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
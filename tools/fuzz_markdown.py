@@ -0,0 +1,163 @@
+"""
+Fuzz check for reports/markdown.py (the strategy section of the PDF).
+
+Three corpora:
+  - random: lines built from markdown tokens and hostile characters (<, &, >, unbalanced **, |, tabs, deep indents)
+  - mutated: the fallback strategy and LLM-like texts with random characters inserted/removed
+  - fixed: hand-written edge cases
+Every input must parse, give Paragraph-valid markup and lay out in a real PDF
+build. Also, no word of the input may be lost: every letter/digit run must
+show up in the rendered text or in a link target. The same inputs are also
+run through the pre-converter line loop to count how many would have taken
+the "PDF Generation Failed" path.
+
+    python tools/fuzz_markdown.py [--cases 2000] [--seed 1]
+"""
+import argparse
+import html
+import io
+import os
+import random
+import re
+import sys
+import traceback
+
+sys.path.append(os.getcwd())
+
+TOKENS = [
+    "#", "##", "###", "####", "- ", "* ", "+ ", "1. ", "2) ", "10. ", "> ", "> [!NOTE]", "> [!warning] ", "|", "| --- |",
+    "|:-:|", "**", "*", "_", "__", "***", "~~", "`", "```", "---", "[link](https://example.com/?a=1&b=<2>)", "[x](javascript:alert)",
+    "<", ">", "&", "&amp;", "<b>", "</i>", "<para>", "<br/>", '"', "'", "\\|", "\t", "    ", "  ", " ", " ",
+    "бренд", "стратегія", "Герой", "word", "snake_case", "2*3*4", "5 < 6", "a&b", "ŉ", "😀", " ",
+]
+HOSTILE = "<>&*_|#`>~[]()!\\\"'\t "
+FIXED = [
+    "", "\n\n\n", "#", "# ", "**", "****", "*a", "a*", "_a", "<", "&", "&#;", "&#99999999;", "<b>unclosed", "</b>",
+    "| a |\n|---|", "|a|b|\n|-|-|\n|1|2|3|\n|x|", "> [!NOTE]", "> [!NOTE]\n>\n>", "```", "```\n<b>&", "- a\n        - b\n- c",
+    "1. a\n1. b\n1. c", "- - -", "* * *", "x" * 5000, ("- a\n" + "  " * 30 + "- deep\n") * 3,
+    "|" + "c|" * 20 + "\n|" + "-|" * 20 + "\n|" + "v|" * 20, "| a |\n|---|\n| " + "дуже довгий текст " * 60 + " |",
+    "[a](https://x.y/\"onmouseover=\"x)", "***a** b*", "**a *b* c**", "~~~\ncode\n~~~", "> > nested quote",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 25)):
+        parts = [rng.choice(TOKENS) if rng.random() < 0.6 else rng.choice(HOSTILE) for _ in range(rng.randint(0, 12))]
+        lines.append("".join(parts) if rng.random() < 0.5 else " ".join(parts))
+    return "\n".join(lines)
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 30)):
+        pos = rng.randrange(len(chars) + 1)
+        if rng.random() < 0.7 or not chars:
+            chars.insert(pos, rng.choice(HOSTILE + "\n"))
+        else:
+            del chars[min(pos, len(chars) - 1)]
+    return "".join(chars)
+
+
+def legacy_story(text: str, st):
+    # The pre-converter strategy loop from generate_pdf_report
+    from reportlab.platypus import Paragraph, Spacer
+    from reportlab.lib.units import inch
+    story = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            story.append(Spacer(1, 0.1 * inch))
+            continue
+        line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line)
+        if line.startswith('#'):
+            story.append(Paragraph(line.lstrip('#').strip(), st["heading"]))
+        elif line.startswith('- ') or line.startswith('* '):
+            story.append(Paragraph(f"• {line[2:]}", st["bullet"]))
+        else:
+            story.append(Paragraph(line, st["normal"]))
+    return story
+
+
+_TAGS = re.compile(r"<[^>]*>")
+_HREF = re.compile(r'href="([^"]*)"')
+_WORDS = re.compile(r"[^\W_]+")
+# Callout markers become labels, ordered lists are renumbered and "```lang" names are dropped: not words of the text
+_MARKERS = re.compile(r"\[!\w*\]|^\s*\d{1,9}[.)](?=\s)|^\s{0,3}(?:```|~~~)[`~]*\s*[\w+#.-]*\s*$", re.MULTILINE)
+
+
+def rendered_words(blocks) -> set:
+    text = []
+    for block in blocks:
+        if block[0] == "code":  # raw text, not markup
+            text.append(block[1])
+            continue
+        for part in block[1:]:
+            if isinstance(part, tuple):  # table rows
+                part = " ".join(" ".join(row) for row in part)
+            if isinstance(part, str):
+                text.append(html.unescape(_TAGS.sub(" ", part)))
+                text.extend(html.unescape(h) for h in _HREF.findall(part))
+    return set(_WORDS.findall(" ".join(text)))
+
+
+def build(story):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+    doc = SimpleDocTemplate(io.BytesIO(), pagesize=A4, rightMargin=50, leftMargin=50, topMargin=50, bottomMargin=50)
+    doc.build(story)
+
+
+def main(args):
+    from core.archetype_info import build_fallback_strategy, load_archetype_info
+    from reports import pdf_generator
+    from reports.markdown import parse
+    from tools.bench_pdf_assembly import strategy_text
+
+    font = pdf_generator._register_font()
+    st = pdf_generator._styles(font)
+    renderer = pdf_generator._markdown(font)
+    rng = random.Random(args.seed)
+    info = load_archetype_info()
+    keys = list(info)
+
+    corpus = [("fixed", t) for t in FIXED]
+    for n in range(args.cases):
+        if n % 2:
+            corpus.append(("random", random_text(rng)))
+        else:
+            base = (build_fallback_strategy({k: rng.randint(0, 20) for k in rng.sample(keys, 4)}, info)
+                    if rng.random() < 0.5 else strategy_text(rng.randint(200, 3000), rng))
+            corpus.append(("mutated", mutate(base, rng)))
+
+    failures, lost, legacy_failures = [], [], 0
+    for kind, text in corpus:
+        try:
+            blocks = parse(text)
+            build(renderer.flowables(text))
+        except Exception:
+            failures.append((kind, text, traceback.format_exc()))
+            continue
+        missing = set(_WORDS.findall(_MARKERS.sub(" ", text))) - rendered_words(blocks)
+        if missing:
+            lost.append((kind, text, missing))
+        try:
+            build(legacy_story(text, st))
+        except Exception:
+            legacy_failures += 1
+
+    print(f"{len(corpus)} inputs ({args.cases} generated + {len(FIXED)} fixed)")
+    print(f"converter: {len(failures)} failed, {len(lost)} lost words")
+    print(f"legacy line loop: {legacy_failures} failed ({100 * legacy_failures / len(corpus):.1f}%)")
+    for kind, text, tb in failures[:3]:
+        print(f"\n--- {kind} failure ---\n{text[:400]!r}\n{tb}")
+    for kind, text, missing in lost[:3]:
+        print(f"\n--- {kind} lost {sorted(missing)[:10]} ---\n{text[:400]!r}")
+    sys.exit(1 if failures or lost else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,105 @@
+"""
+End-to-end load test: runs the real bot against a local Bot API, LLM and SMTP.
+
+Usage (from the project root):
+    python -m tools.loadtest --users 200 --concurrency 10,50,100 --countdown 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archetype bot load test")
+    parser.add_argument("--users", type=int, default=100, help="Simulated users per concurrency level")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[10, 50],
+                        help="Comma-separated concurrency levels, run one after another")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling", help="Bot update ingress")
+    parser.add_argument("--workers", type=int, default=1, help="Bot worker processes (chat affinity fan-out)")
+    parser.add_argument("--tenants", type=int, default=1, help="Bots served by the process (multi-tenant mode), users round-robin")
+    parser.add_argument("--open-text-rate", type=float, default=0.05, help="Probability of choosing option F")
+    parser.add_argument("--double-tap-rate", type=float, default=0.0, help="Probability of sending an answer tap twice")
+    parser.add_argument("--stale-tap-rate", type=float, default=0.0, help="Probability of tapping the previous question's keyboard")
+    parser.add_argument("--flooders", type=int, default=0, help="Extra users who spam /start, text and button taps during each phase")
+    parser.add_argument("--flood-messages", type=int, default=100, help="Messages per flooder")
+    parser.add_argument("--tap-limit", default="1000/1",
+                        help="THROTTLE_CALLBACK for the run; e.g. 60/60 lets users through but throttles flooders' taps")
+    parser.add_argument("--countdown", type=int, default=0, help="Results countdown in seconds (prod: 120)")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="Update slots per bot (webhook/worker runners, polling task limit); below --users, "
+                             "users in the results countdown outnumber the slots")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Simulated Bot API round trip per call")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--io", choices=["off", "record", "replay", "synthetic"], default="off",
+                        help="LLM/SMTP calls: fake servers (off), recorded to / replayed from --io-dir, or synthetic")
+    parser.add_argument("--io-dir", default="./fixtures/io", help="Fixtures for --io record/replay")
+    parser.add_argument("--io-latency-scale", type=float, default=1.0, help="--io replay: recorded latency x this")
+    parser.add_argument("--user-timeout", type=float, default=300.0, help="Seconds before a simulated user gives up")
+    parser.add_argument("--db", default="", help="SQLAlchemy URL (default: fresh temp SQLite file)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    api_port, llm_port, smtp_port, webhook_port = free_port(), free_port(), free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="archetype-loadtest-")
+    db_url = args.db or f"sqlite+aiosqlite:///{os.path.join(workdir, 'loadtest.db')}"
+
+    # Settings are read at import time, so configure everything before the bot is imported
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "OPENROUTER_API_KEY": "sk-loadtest",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_USER": "loadtest@example.com",
+        "SMTP_PASSWORD": "loadtest",
+        "SMTP_USE_TLS": "false",
+        "ADMIN_EMAIL": "admin@example.com",
+        "DATABASE_URL": db_url,
+        "ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "RESULTS_COUNTDOWN_SECONDS": str(args.countdown),
+        "RESULTS_COUNTDOWN_STEP": str(max(1, min(5, args.countdown or 1))),
+        "BOT_MODE": args.mode,
+        "WORKERS": str(args.workers),
+        "WEBHOOK_BASE_URL": f"http://127.0.0.1:{webhook_port}",
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_SECRET": "loadtest-secret",
+        # Simulated users answer 36 questions in about a second; the default tap limit is set for people
+        "THROTTLE_CALLBACK": args.tap_limit,
+        "LLM_IO_MODE": args.io,
+        "SMTP_IO_MODE": args.io,
+        "IO_FIXTURES_DIR": os.path.abspath(args.io_dir),
+        "IO_REPLAY_LATENCY_SCALE": str(args.io_latency_scale),
+    })
+    if args.max_in_flight:
+        for name in ("WEBHOOK_MAX_IN_FLIGHT", "WORKER_MAX_IN_FLIGHT", "TENANT_MAX_IN_FLIGHT"):
+            os.environ[name] = str(args.max_in_flight)
+    if args.tenants > 1:
+        tenants_file = os.path.join(workdir, "tenants.json")
+        with open(tenants_file, "w", encoding="utf-8") as f:
+            json.dump([{"name": f"brand{i}", "token": f"{200000 + i}:LOADTEST"} for i in range(args.tenants)], f)
+        os.environ["TENANTS_FILE"] = tenants_file
+    sys.path.append(os.getcwd())
+
+    from tools.loadtest.harness import run
+    asyncio.run(run(args, api_port, llm_port, smtp_port))
+
+
+if __name__ == "__main__":
+    main()
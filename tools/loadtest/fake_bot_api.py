@@ -0,0 +1,276 @@
+"""
+Minimal stand-in for the Telegram Bot API.
+
+Implements just enough of the HTTP interface for aiogram to run the real
+router: getUpdates long polling (or webhook delivery after setWebhook) plus
+the send/edit/delete methods the handlers use. Everything the bot sends is
+routed to a per-chat queue so simulated users can react to it.
+Several bot tokens can share one server (multi-tenant runs): updates and
+webhooks are kept per token, chat ids must not overlap between bots.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+
+
+class BotOutput:
+    """One call the bot made towards a chat (sendMessage, sendPhoto, ...)."""
+
+    def __init__(self, method: str, chat_id: int, params: Dict[str, Any], message: Optional[Dict[str, Any]]):
+        self.method = method
+        self.chat_id = chat_id
+        self.params = params
+        self.message = message
+        self.received_at = time.perf_counter()
+
+    @property
+    def text(self) -> str:
+        return self.params.get("text") or self.params.get("caption") or ""
+
+    @property
+    def callback_buttons(self) -> List[str]:
+        markup = self.params.get("reply_markup")
+        if not markup:
+            return []
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        rows = markup.get("inline_keyboard", [])
+        return [btn.get("callback_data") for row in rows for btn in row if btn.get("callback_data")]
+
+
+class FakeBotAPI:
+    def __init__(self, token: str, latency_ms: float = 0.0):
+        self.token = token  # default for push_*
+        # Simulated network round trip for every bot-side method call (not getUpdates)
+        self.latency = latency_ms / 1000
+        self.updates: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.outboxes: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.method_counts: Dict[str, int] = defaultdict(int)
+        self.token_calls: Dict[str, int] = defaultdict(int)
+        self.uploaded_bytes = 0
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        # Set by setWebhook: updates are then POSTed to the bot instead of queued for getUpdates.
+        # token -> (url, secret)
+        self.webhooks: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.webhook_failures = 0
+        # Callback queries the bot has not answered yet (the user's button still shows a spinner)
+        self.open_callbacks: set = set()
+        self.callbacks_pushed = 0
+        self._client: Optional[ClientSession] = None
+        self._deliveries: set = set()
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_route("*", "/bot{token}/{method}", self._handle)
+
+    # ---- Server lifecycle ----
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._client:
+            await self._client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    # ---- Update injection (user side) ----
+
+    def _user(self, chat_id: int) -> Dict[str, Any]:
+        return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+
+    def _chat(self, chat_id: int) -> Dict[str, Any]:
+        return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+
+    def push_text(self, chat_id: int, text: str, token: Optional[str] = None) -> int:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": self._user(chat_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return self._push({"message": message}, token)
+
+    def push_callback(self, chat_id: int, data: str, source: Optional[Dict[str, Any]], token: Optional[str] = None) -> int:
+        message = source or {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "text": "",
+        }
+        query_id = str(next(self._update_ids))
+        self.open_callbacks.add(query_id)
+        self.callbacks_pushed += 1
+        return self._push({
+            "callback_query": {
+                "id": query_id,
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "message": message,
+                "data": data,
+            }
+        }, token)
+
+    def _push(self, payload: Dict[str, Any], token: Optional[str] = None) -> int:
+        token = token or self.token
+        update_id = next(self._update_ids)
+        payload["update_id"] = update_id
+        if token in self.webhooks:
+            task = asyncio.create_task(self._deliver(payload, *self.webhooks[token]))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+        else:
+            self.updates[token].put_nowait(payload)
+        return update_id
+
+    async def _deliver(self, payload: Dict[str, Any], url: str, secret: Optional[str]):
+        if self._client is None:
+            self._client = ClientSession()
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        # Like Telegram, retry until the bot accepts the update
+        for attempt in range(5):
+            try:
+                async with self._client.post(url, json=payload, headers=headers) as resp:
+                    if resp.status == 200:
+                        return
+            except OSError:
+                pass
+            self.webhook_failures += 1
+            await asyncio.sleep(0.2 * (attempt + 1))
+
+    async def next_output(self, chat_id: int, timeout: float) -> BotOutput:
+        return await asyncio.wait_for(self.outboxes[chat_id].get(), timeout=timeout)
+
+    # ---- Bot side ----
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        token = request.match_info["token"]
+        self.method_counts[method] += 1
+        self.token_calls[token] += 1
+        params: Dict[str, Any] = {}
+        if request.can_read_body:
+            form = await request.post()
+            for key, value in form.items():
+                if isinstance(value, web.FileField):
+                    body = value.file.read()
+                    self.uploaded_bytes += len(body)
+                    params[key] = {"filename": value.filename, "size": len(body)}
+                else:
+                    params[key] = value
+        params.update(request.query)
+
+        if self.latency and method != "getUpdates":
+            await asyncio.sleep(self.latency)
+        if method in ("getUpdates", "setWebhook", "deleteWebhook"):
+            params["_token"] = token  # per-bot state
+        handler = getattr(self, f"_m_{method}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _m_getMe(self, params):
+        return BOT_USER
+
+    async def _m_setWebhook(self, params):
+        token = params["_token"]
+        self.webhooks[token] = (params.get("url"), params.get("secret_token"))
+        # Like Telegram, updates that arrived before the webhook was set are delivered to it
+        # (with --workers the ingress registers while the first users are already tapping)
+        pending = self.updates[token]
+        drop = str(params.get("drop_pending_updates")).lower() == "true"
+        while not pending.empty():
+            update = pending.get_nowait()
+            if not drop:
+                task = asyncio.create_task(self._deliver(update, *self.webhooks[token]))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+        return True
+
+    async def _m_deleteWebhook(self, params):
+        self.webhooks.pop(params["_token"], None)
+        return True
+
+    async def _m_getUpdates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        updates = self.updates[params["_token"]]
+        batch = []
+        try:
+            first = await asyncio.wait_for(updates.get(), timeout=max(timeout, 0.01))
+            batch.append(first)
+            while not updates.empty() and len(batch) < 100:
+                batch.append(updates.get_nowait())
+        except asyncio.TimeoutError:
+            pass
+        return [u for u in batch if u["update_id"] >= offset]
+
+    def _message(self, chat_id: int, **extra) -> Dict[str, Any]:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": BOT_USER,
+        }
+        msg.update(extra)
+        return msg
+
+    def _emit(self, method: str, params: Dict[str, Any], message: Optional[Dict[str, Any]]):
+        chat_id = int(params.get("chat_id") or 0)
+        self.outboxes[chat_id].put_nowait(BotOutput(method, chat_id, params, message))
+
+    def _file(self) -> Dict[str, Any]:
+        n = next(self._file_ids)
+        return {"file_id": f"file-{n}", "file_unique_id": f"uniq-{n}"}
+
+    async def _m_sendMessage(self, params):
+        msg = self._message(int(params["chat_id"]), text=params.get("text", ""))
+        self._emit("sendMessage", params, msg)
+        return msg
+
+    async def _m_sendPhoto(self, params):
+        photo = dict(self._file(), width=600, height=600)
+        msg = self._message(int(params["chat_id"]), photo=[photo], caption=params.get("caption"))
+        self._emit("sendPhoto", params, msg)
+        return msg
+
+    async def _m_sendDocument(self, params):
+        document = dict(self._file(), file_name="report.pdf")
+        msg = self._message(int(params["chat_id"]), document=document, caption=params.get("caption"))
+        self._emit("sendDocument", params, msg)
+        return msg
+
+    async def _m_editMessageText(self, params):
+        msg = self._message(int(params["chat_id"]), text=params.get("text", ""))
+        msg["message_id"] = int(params.get("message_id") or msg["message_id"])
+        self._emit("editMessageText", params, msg)
+        return msg
+
+    async def _m_editMessageReplyMarkup(self, params):
+        msg = self._message(int(params["chat_id"]), text="")
+        msg["message_id"] = int(params.get("message_id") or msg["message_id"])
+        return msg
+
+    async def _m_deleteMessage(self, params):
+        return True
+
+    async def _m_answerCallbackQuery(self, params):
+        self.open_callbacks.discard(str(params.get("callback_query_id")))
+        return True
@@ -0,0 +1,85 @@
+"""
+OpenAI-compatible stand-in for OpenRouter.
+
+Serves /v1/chat/completions with a configurable latency distribution and
+error rate (plus optional per-prompt-token time, like a real model's
+prefill) so the bot's AI paths (meta-archetype synthesis, strategy
+generation) can be exercised without a network or an API key.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+from aiohttp import web
+
+STRATEGY_PARAGRAPH = (
+    "Ваша комбінація архетипів поєднує внутрішню силу з чітким баченням. "
+    "Використовуйте це у позиціонуванні, тональності та візуальних кодах бренду.\n"
+)
+
+
+class FakeLLM:
+    def __init__(self, latency_ms: float = 800.0, jitter_ms: float = 200.0, error_rate: float = 0.0, strategy_chars: int = 4000,
+                 prompt_ms_per_1k_tokens: float = 0.0):
+        self.latency_ms = latency_ms
+        self.prompt_ms_per_1k_tokens = prompt_ms_per_1k_tokens
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.strategy_chars = strategy_chars
+        self.requests = 0
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self._completions)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _content(self, body: dict) -> str:
+        system = body["messages"][0]["content"] if body.get("messages") else ""
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            if "synthesizer" in system:
+                return json.dumps({"title": "Стратег-Візіонер", "description": "Синтез домінантних енергій."}, ensure_ascii=False)
+            return json.dumps({"archetype": "Hero", "confidence": 0.9})
+        text = "## Ваша стратегія\n\n"
+        while len(text) < self.strategy_chars:
+            text += f"### Розділ\n- **Крок:** {STRATEGY_PARAGRAPH}\n{STRATEGY_PARAGRAPH}\n"
+        return text
+
+    async def _completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        delay += prompt_chars / 4 / 1000 * self.prompt_ms_per_1k_tokens / 1000
+        await asyncio.sleep(delay)
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "Rate limit exceeded", "code": 429}}, status=429)
+
+        content = self._content(body)
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (prompt_chars + len(content)) // 4,
+            },
+        })
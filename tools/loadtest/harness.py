@@ -0,0 +1,332 @@
+"""
+Drives simulated users through the real bot router.
+
+Importing this module imports the bot itself, so the environment
+(BOT_TOKEN, TELEGRAM_API_URL, OPENROUTER_BASE_URL, SMTP_*, DATABASE_URL,
+RESULTS_COUNTDOWN_*) must be prepared first - see tools/loadtest/__main__.py.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from adapters.db_repo import db_repo
+from adapters.telegram_bot.main import create_tenant_bots, start_polling
+from adapters.telegram_bot.tenants import load_tenants
+from adapters.telegram_bot.webhook import start_webhook_server
+from adapters.telegram_bot.workers import run_multiworker
+from core.config import settings
+from core.logging_setup import setup_logging
+from core.loop_monitor import loop_monitor
+from .fake_bot_api import BotOutput, FakeBotAPI
+from .fake_llm import FakeLLM
+from .smtp_sink import SMTPSink
+
+
+FLOODER_CHAT_IDS = 10_000_000
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes a fixed-interval sleeper."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.completed = 0
+        self.failed = 0
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.completed_by_bot: Dict[str, int] = defaultdict(int)
+
+    def record(self, step: str, started: float):
+        self.latencies[step].append(time.perf_counter() - started)
+
+
+class SimulatedUser:
+    def __init__(self, api: FakeBotAPI, chat_id: int, stats: StepStats, rng: random.Random, open_text_rate: float, timeout: float,
+                 double_tap_rate: float = 0.0, stale_tap_rate: float = 0.0, token: str = None):
+        self.api = api
+        self.chat_id = chat_id
+        self.token = token  # bot this user talks to (multi-tenant runs)
+        self.stats = stats
+        self.rng = rng
+        self.open_text_rate = open_text_rate
+        self.timeout = timeout
+        self.double_tap_rate = double_tap_rate
+        self.stale_tap_rate = stale_tap_rate
+
+    def text(self, text: str):
+        self.api.push_text(self.chat_id, text, self.token)
+
+    def tap(self, data: str, source):
+        self.api.push_callback(self.chat_id, data, source, self.token)
+
+    async def wait_for(self, predicate: Callable[[BotOutput], bool]) -> BotOutput:
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            out = await self.api.next_output(self.chat_id, remaining)
+            if predicate(out):
+                return out
+
+    @staticmethod
+    def is_question(out: BotOutput) -> bool:
+        return out.method == "sendMessage" and any(b.startswith("ans:") for b in out.callback_buttons)
+
+    @staticmethod
+    def is_finish(out: BotOutput) -> bool:
+        return out.method == "sendMessage" and out.text.startswith("🎉")
+
+    async def run(self):
+        started = time.perf_counter()
+        self.text("/start")
+        question = await self.wait_for(self.is_question)
+        self.stats.record("start", started)
+
+        while True:
+            buttons = [b for b in question.callback_buttons if b.startswith("ans:")]
+            open_text = [b for b in buttons if b.rsplit(":", 1)[-1] == "F"]
+            if open_text and self.rng.random() < self.open_text_rate:
+                started = time.perf_counter()
+                self.tap(open_text[0], question.message)
+                await self.wait_for(lambda o: o.method == "sendMessage" and o.text.startswith("Будь ласка"))
+                self.stats.record("open_text_prompt", started)
+                started = time.perf_counter()
+                self.text("Я роблю так, як підказує інтуїція.")
+                step = "open_text_answer"
+            else:
+                choice = self.rng.choice([b for b in buttons if b not in open_text] or buttons)
+                started = time.perf_counter()
+                self.tap(choice, question.message)
+                if self.rng.random() < self.double_tap_rate:
+                    self.tap(choice, question.message)  # must be dropped
+                step = "answer"
+
+            nxt = await self.wait_for(lambda o: self.is_question(o) or self.is_finish(o))
+            if self.is_question(nxt) and self.rng.random() < self.stale_tap_rate:
+                # A tap on the previous message's keyboard: must not answer the new question
+                self.tap(self.rng.choice(buttons), question.message)
+            if self.is_finish(nxt):
+                self.stats.record("last_answer", started)
+                break
+            self.stats.record(step, started)
+            question = nxt
+
+        started = time.perf_counter()
+        await self.wait_for(lambda o: o.method == "sendPhoto")
+        self.stats.record("results", started)
+
+        offer = await self.wait_for(lambda o: "get_report" in o.callback_buttons)
+        started = time.perf_counter()
+        self.tap("get_report", offer.message)
+        await self.wait_for(lambda o: o.method == "sendMessage" and "ім'я" in o.text)
+        self.stats.record("lead_button", started)
+
+        started = time.perf_counter()
+        self.text(f"User {self.chat_id}")
+        await self.wait_for(lambda o: o.method == "sendMessage" and "телефону" in o.text)
+        self.stats.record("lead_name", started)
+
+        started = time.perf_counter()
+        self.text("+380000000000")
+        await self.wait_for(lambda o: o.method == "sendMessage" and "Email" in o.text)
+        self.stats.record("lead_phone", started)
+
+        started = time.perf_counter()
+        self.text(f"user{self.chat_id}@example.com")
+        await self.wait_for(lambda o: o.method == "sendDocument")
+        self.stats.record("pdf_delivery", started)
+        await self.wait_for(lambda o: o.method == "sendMessage" and o.text.startswith("✅"))
+        self.stats.record("email_delivery", started)
+
+        started = time.perf_counter()
+        self.text("/report")
+        await self.wait_for(lambda o: o.method == "sendDocument")
+        self.stats.record("report_redelivery", started)
+
+
+async def run_phase(api: FakeBotAPI, users: int, concurrency: int, first_chat_id: int, args, tokens: List[str]) -> Dict:
+    stats = StepStats()
+    lag = LoopLagSampler()
+    rng = random.Random(args.seed + first_chat_id)
+    sem = asyncio.Semaphore(concurrency)
+    calls_before = sum(api.method_counts.values())
+    callbacks_before, open_before = api.callbacks_pushed, set(api.open_callbacks)
+
+    async def one(chat_id: int):
+        async with sem:
+            # Users are spread over the bots round-robin
+            token = tokens[chat_id % len(tokens)]
+            user = SimulatedUser(api, chat_id, stats, rng, args.open_text_rate, args.user_timeout,
+                                 args.double_tap_rate, args.stale_tap_rate, token)
+            try:
+                await user.run()
+                stats.completed += 1
+                stats.completed_by_bot[token] += 1
+            except asyncio.TimeoutError:
+                stats.failed += 1
+                stats.errors["timeout"] += 1
+            except Exception as e:
+                stats.failed += 1
+                stats.errors[type(e).__name__] += 1
+
+    async def flood(chat_id: int):
+        # /start, text and answer taps on a dead keyboard as fast as the loop allows; the throttle
+        # must drop nearly all of it (and still answer the taps)
+        token = tokens[chat_id % len(tokens)]
+        for n in range(args.flood_messages):
+            if n % 3 == 2:
+                api.push_callback(chat_id, "ans:zz:0:A", None, token)
+            else:
+                api.push_text(chat_id, "/start" if n % 3 == 0 else f"spam {n}", token)
+            await asyncio.sleep(0.001)
+
+    lag.start()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(one(first_chat_id + i) for i in range(users)),
+        *(flood(FLOODER_CHAT_IDS + first_chat_id + i) for i in range(args.flooders)),
+    )
+    elapsed = time.perf_counter() - started
+    await lag.stop()
+
+    return {
+        "users": users,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "stats": stats,
+        "lag": lag.samples,
+        "api_calls": sum(api.method_counts.values()) - calls_before,
+        "callbacks": api.callbacks_pushed - callbacks_before,
+        "unanswered_callbacks": len(api.open_callbacks - open_before),
+    }
+
+
+def print_report(phase: Dict, llm: FakeLLM, smtp: SMTPSink, tenants: List = ()):
+    stats: StepStats = phase["stats"]
+    elapsed = phase["elapsed"] or 1e-9
+    print(f"\n=== concurrency={phase['concurrency']} users={phase['users']} elapsed={elapsed:.1f}s ===")
+    print(f"completed={stats.completed} failed={stats.failed} errors={dict(stats.errors)}")
+    print(f"throughput: {stats.completed / elapsed:.2f} tests/s, {phase['api_calls'] / elapsed:.1f} Bot API calls/s")
+    asked = sum(len(stats.latencies[s]) for s in ("answer", "open_text_answer", "last_answer"))
+    print(f"questions per completed test: {asked / max(1, stats.completed):.1f}")
+    # Every tap must be answered, dropped ones included, or its button keeps spinning
+    print(f"button taps: {phase['callbacks']}, never answered: {phase['unanswered_callbacks']}")
+    print(f"{'step':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, values in stats.latencies.items():
+        ms = [v * 1000 for v in values]
+        print(f"{step:<18}{len(ms):>8}{percentile(ms, 50):>10.1f}{percentile(ms, 95):>10.1f}{percentile(ms, 99):>10.1f}")
+    lag_ms = [v * 1000 for v in phase["lag"]]
+    print(f"event-loop lag: p50={percentile(lag_ms, 50):.1f}ms p99={percentile(lag_ms, 99):.1f}ms max={max(lag_ms, default=0):.1f}ms")
+    if loop_monitor.sites:  # in-process bot only (not --workers)
+        print(f"loop stalls over {settings.LOOP_LAG_THRESHOLD_MS}ms by blocking call:")
+        for site, (n, ms) in sorted(loop_monitor.sites.items(), key=lambda kv: kv[1][1], reverse=True)[:6]:
+            print(f"  {n:>4} x {ms / n:>6.0f}ms  {site}")
+        loop_monitor.sites = {}
+    print(f"LLM requests={llm.requests} errors={llm.errors}; SMTP messages={smtp.messages}")
+    if settings.LLM_IO_MODE != "off" or settings.SMTP_IO_MODE != "off":
+        from core.io_replay import llm_io, smtp_io
+        print(f"LLM/SMTP io ({settings.LLM_IO_MODE}): llm={llm_io.stats} smtp={smtp_io.stats}")
+    from core.ai_service import ai_service
+    if ai_service.single_flight["requests"]:  # in-process bot only (not --workers)
+        print(f"LLM single-flight: {ai_service.single_flight['coalesced']}/{ai_service.single_flight['requests']} "
+              f"calls joined an identical in-flight request ({100 * ai_service.coalescing_ratio():.0f}%)")
+    from adapters.telegram_bot.answer_guard import answer_guard
+    if answer_guard.stats["accepted"]:
+        print(f"answer taps: {answer_guard.stats}")
+    from adapters.telegram_bot.throttle import throttle
+    if any(throttle.stats.values()):
+        print(f"throttled: {throttle.stats}")
+    if len(tenants) > 1:
+        for t in tenants:
+            # Counters live in the worker processes with --workers (logged there on stop)
+            metrics = f" {t.metrics}" if t.metrics["updates"] else ""
+            print(f"tenant {t.name}: completed={stats.completed_by_bot[t.token]}{metrics}")
+
+
+async def run(args, api_port: int, llm_port: int, smtp_port: int):
+    # The bot's own (queued, JSON) logging; spawned workers read LOG_LEVEL from the environment
+    os.environ["LOG_LEVEL"] = settings.LOG_LEVEL = args.log_level
+    setup_logging()
+    # Stalls are summarised per phase below instead of logged one by one
+    logging.getLogger("loop_monitor").setLevel(logging.ERROR)
+    loop_monitor.start()
+
+    api = FakeBotAPI(settings.BOT_TOKEN, latency_ms=args.api_latency_ms)
+    llm = FakeLLM(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, error_rate=args.llm_error_rate)
+    smtp = SMTPSink()
+    await api.start(port=api_port)
+    await llm.start(port=llm_port)
+    await smtp.start(port=smtp_port)
+
+    await db_repo.init_db()
+    tenants = load_tenants()
+    bots = create_tenant_bots(tenants)
+    polling = webhook = None
+    stop_workers = asyncio.Event()
+    if settings.WORKERS > 1:
+        polling = asyncio.create_task(run_multiworker(bots, settings.WORKERS, stop=stop_workers))
+    elif settings.BOT_MODE == "webhook":
+        webhook = await start_webhook_server(bots, "127.0.0.1", settings.WEBHOOK_PORT)
+    else:
+        # The production call (task limit included), with a short long-poll so the run stops quickly
+        polling = asyncio.gather(*(start_polling(bot, dp, polling_timeout=1) for bot, dp in bots))
+
+    try:
+        next_chat_id = 100_000
+        for concurrency in args.concurrency:
+            phase = await run_phase(api, args.users, concurrency, next_chat_id, args, [t.token for t in tenants])
+            next_chat_id += args.users
+            print_report(phase, llm, smtp, tenants)
+    finally:
+        if polling and settings.WORKERS > 1:
+            stop_workers.set()
+            await polling
+        elif polling:
+            for _, dp in bots:
+                await dp.stop_polling()
+            await polling
+        if webhook:
+            await webhook.cleanup()
+        await bots[0][0].session.close()
+        await loop_monitor.stop()
+        await api.stop()
+        await llm.stop()
+        await smtp.stop()
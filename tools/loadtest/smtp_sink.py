@@ -0,0 +1,79 @@
+"""
+Local SMTP sink.
+
+Speaks just enough plain SMTP (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA)
+for aiosmtplib to deliver a message, then discards it and keeps counters.
+Used with SMTP_USE_TLS=False.
+"""
+import asyncio
+from typing import Optional
+
+
+class SMTPSink:
+    def __init__(self):
+        self.messages = 0
+        self.bytes_received = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._session, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def reply(line: str):
+            writer.write((line + "\r\n").encode())
+
+        reply("220 loadtest-sink ESMTP")
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                cmd = raw.decode(errors="replace").strip()
+                verb = cmd.split(" ", 1)[0].upper()
+
+                if verb in ("EHLO", "HELO"):
+                    writer.write(b"250-loadtest-sink\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 67108864\r\n")
+                elif verb == "AUTH":
+                    parts = cmd.split()
+                    if len(parts) >= 2 and parts[1].upper() == "LOGIN":
+                        # Username / password prompts, values are ignored
+                        if len(parts) == 2:
+                            reply("334 VXNlcm5hbWU6")
+                            await writer.drain()
+                            await reader.readline()
+                        reply("334 UGFzc3dvcmQ6")
+                        await writer.drain()
+                        await reader.readline()
+                    reply("235 2.7.0 Authentication successful")
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    size = 0
+                    while True:
+                        line = await reader.readline()
+                        if not line or line in (b".\r\n", b".\n"):
+                            break
+                        size += len(line)
+                    self.messages += 1
+                    self.bytes_received += size
+                    reply("250 OK: queued")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()